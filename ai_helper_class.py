@@ -1,20 +1,273 @@
-from openai import OpenAI
-import google.generativeai as genai
+import asyncio
 import random
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from dotenv import load_dotenv
 
+import metrics_helper
+from resilience_helper import retrying
+
 load_dotenv()
 
 
+# Returned by next() at the end of a stream
+_END = object()
+
+
+def estimate_tokens(text):
+    # Rough estimate, good enough to compare providers with each other
+    return max(1, len(text) // 4)
+
+
+class ProviderStats:
+    """Rolling latency, error and cost statistics of one provider and model."""
+
+    def __init__(self, window=50):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.costs = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.total_cost = 0.0
+
+    def record(self, latency, ok, cost=0.0):
+        self.calls += 1
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+            self.costs.append(cost)
+            self.total_cost += cost
+        else:
+            self.errors += 1
+
+    def percentile(self, fraction):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    @property
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    @property
+    def average_cost(self):
+        return sum(self.costs) / len(self.costs) if self.costs else None
+
+    def snapshot(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'error_rate': round(self.error_rate, 3),
+            'p50_latency': self.percentile(0.5),
+            'p95_latency': self.percentile(0.95),
+            'average_cost': self.average_cost,
+            'total_cost': round(self.total_cost, 6),
+        }
+
+
+class ProviderRouter:
+    """
+    Picks a provider for each call, weighted by its rolling p95 latency, error rate and cost.
+    A failing provider is failed over to the next best one, and with `hedge_after` set a second
+    provider is started when the first has not answered within that many seconds.
+    """
+
+    def __init__(self, providers, hedge_after=None, window=50, min_weight=0.05, cost_weight=0.25):
+        # providers: {name: (call(prompt, text) -> str, model)}
+        self.providers = providers
+        self.hedge_after = hedge_after
+        # Dampens price differences, so a 30x more expensive model is not starved of all traffic
+        self.cost_weight = cost_weight
+        self.min_weight = min_weight
+        self.stats_by_provider = {name: ProviderStats(window) for name in providers}
+        self.last_decision = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2 * len(providers), thread_name_prefix='ai-router')
+
+    def weights(self):
+        with self._lock:
+            snapshots = {name: stats.snapshot() for name, stats in self.stats_by_provider.items()}
+        known_latencies = [s['p95_latency'] for s in snapshots.values() if s['p95_latency']]
+        known_costs = [s['average_cost'] for s in snapshots.values() if s['average_cost']]
+        # Providers without data yet are scored like the best known one, so they get tried
+        default_latency = min(known_latencies, default=1.0)
+        default_cost = min(known_costs, default=1.0)
+
+        weights = {}
+        for name, snapshot in snapshots.items():
+            latency = snapshot['p95_latency'] or default_latency
+            cost = snapshot['average_cost'] or default_cost
+            relative_cost = cost / default_cost if default_cost else 1.0
+            score = (1 - snapshot['error_rate']) ** 2 / (latency * relative_cost ** self.cost_weight)
+            weights[name] = score
+        total = sum(weights.values()) or 1.0
+        return {name: max(self.min_weight, score / total) for name, score in weights.items()}
+
+    def ranked_providers(self):
+        """Weighted random order: the first provider is the pick, the rest are failovers."""
+        weights = self.weights()
+        remaining = dict(weights)
+        order = []
+        while remaining:
+            names = list(remaining)
+            choice = random.choices(names, weights=[remaining[name] for name in names])[0]
+            order.append(choice)
+            del remaining[choice]
+        return order, weights
+
+    def record(self, name, latency, ok, prompt='', text='', result=''):
+        cost = 0.0
+        if ok:
+            cost = metrics_helper.compute_cost(self.providers[name][1], estimate_tokens(prompt + text), estimate_tokens(result))
+        with self._lock:
+            self.stats_by_provider[name].record(latency, ok=ok, cost=cost)
+
+    def _call(self, name, prompt, text):
+        call, _ = self.providers[name]
+        start = time.monotonic()
+        try:
+            result = call(prompt, text)
+        except Exception:
+            self.record(name, time.monotonic() - start, ok=False)
+            raise
+        self.record(name, time.monotonic() - start, ok=True, prompt=prompt, text=text, result=result)
+        return result
+
+    def _call_hedged(self, primary, backup, prompt, text, errors):
+        """Call primary, and backup as well when primary is slow. Failures are added to errors."""
+        futures = {self._executor.submit(self._call, primary, prompt, text): primary}
+        done, _ = wait(futures, timeout=self.hedge_after)
+        if not done:
+            print(f"{primary} is slower than {self.hedge_after}s, hedging with {backup}")
+            futures[self._executor.submit(self._call, backup, prompt, text)] = backup
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return futures[future], future.result(), len(futures) > 1
+                error = future.exception()
+                errors[futures[future]] = error
+        raise error
+
+    def generate(self, prompt, text):
+        order, weights = self.ranked_providers()
+        decision = {'order': order, 'weights': weights, 'attempts': [], 'hedged': False, 'chosen': None}
+        self.last_decision = decision
+        # Providers that failed already, a hedged call can fail on the backup as well
+        errors = {}
+        error = None
+
+        for name in order:
+            if name in errors:
+                continue
+            remaining = [other for other in order if other != name and other not in errors]
+            backup = remaining[0] if remaining else None
+            print(f"Router selected: {name} (weight {weights[name]:.2f})")
+            try:
+                if self.hedge_after and backup:
+                    winner, result, hedged = self._call_hedged(name, backup, prompt, text, errors)
+                    decision['hedged'] = hedged
+                else:
+                    winner, result = name, self._call(name, prompt, text)
+            except Exception as e:
+                errors.setdefault(name, e)
+                failed = [provider for provider in errors if provider not in dict(decision['attempts'])]
+                print(f"{', '.join(failed)} failed, failing over: {e}")
+                decision['attempts'].extend((provider, str(errors[provider])) for provider in failed)
+                error = e
+                continue
+            # The backup of a hedged call can fail while the primary still answers
+            decision['attempts'].extend((provider, str(errors[provider])) for provider in errors
+                                        if provider not in dict(decision['attempts']))
+            decision['attempts'].append((winner, 'ok'))
+            decision['chosen'] = winner
+            return result
+        raise error
+
+    def stats(self):
+        weights = self.weights()
+        with self._lock:
+            return {
+                name: dict(stats.snapshot(), model=self.providers[name][1], weight=round(weights[name], 3))
+                for name, stats in self.stats_by_provider.items()
+            }
+
+
+class StreamMetrics:
+    """
+    Latency of one streamed call: time to the first chunk and the total time spent waiting on the
+    provider, without the time the consumer took between chunks.
+    """
+
+    def __init__(self, provider, model):
+        self.provider = provider
+        self.model = model
+        self.started_at = time.time()
+        self.first_token_latency = None
+        self.total_latency = None
+        self.chunks = 0
+        self.characters = 0
+        self.error = None
+        self._waited = 0.0
+
+    def waited(self, seconds):
+        self._waited += seconds
+
+    def add_chunk(self, chunk):
+        if self.first_token_latency is None:
+            self.first_token_latency = self._waited
+        self.chunks += 1
+        self.characters += len(chunk)
+
+    def finish(self, error=None):
+        self.total_latency = self._waited
+        self.error = error
+
+    def as_dict(self):
+        return {
+            'provider': self.provider,
+            'model': self.model,
+            'started_at': self.started_at,
+            'first_token_latency': self.first_token_latency,
+            'total_latency': self.total_latency,
+            'chunks': self.chunks,
+            'characters': self.characters,
+            'error': self.error,
+        }
+
+
 class AI:
-    def __init__(self):
+    def __init__(self, hedge_after=None):
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.gemini_api_key = os.getenv("GEMINI_API_KEY")
+        self.router = ProviderRouter({
+            'openai:gpt-4o': (lambda prompt, text: self.generate_text_openai(prompt, text, model="gpt-4o"), "gpt-4o"),
+            'gemini:gemini-1.5-flash': (
+                lambda prompt, text: self.generate_text_gemini(prompt, text, model="gemini-1.5-flash"),
+                "gemini-1.5-flash",
+            ),
+        }, hedge_after=hedge_after)
+        self.stream_providers = {
+            'openai:gpt-4o': lambda prompt, text: self.stream_text_openai(prompt, text, model="gpt-4o"),
+            'gemini:gemini-1.5-flash': lambda prompt, text: self.stream_text_gemini(prompt, text, model="gemini-1.5-flash"),
+        }
+        self.stream_metrics = deque(maxlen=1000)
 
 
-    def generate_text_openai(self, prompt, text):
-        client = OpenAI(api_key=self.openai_api_key)
+    def generate_text_openai(self, prompt, text, model="gpt-4o"):
+        from openai import OpenAI
+
+        # Retries are handled by resilience_helper
+        client = OpenAI(api_key=self.openai_api_key, max_retries=0)
 
         message = [{"role": "assistant", "content": prompt}, {"role": "user", "content": text}]
         temperature = 1
@@ -23,37 +276,162 @@ class AI:
 
         print("Calling GPT for topic: " + (text[:50] + '..') if len(text) > 52 else text)
 
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        response = retrying('openai', client.chat.completions.create)(
+            model=model,
             messages=message,
             temperature=temperature,
             max_tokens=max_tokens,
             frequency_penalty=frequency_penalty
         )
+        metrics_helper.record_llm_usage('openai', model, response)
         return response.choices[0].message.content
 
-    def generate_text_gemini(self, prompt, text):
+    def generate_text_gemini(self, prompt, text, model="gemini-1.5-flash"):
+        import google.generativeai as genai
+
         genai.configure(api_key=self.gemini_api_key)
         combined_input = AI.combine_input(prompt, text)
 
-        model = genai.GenerativeModel("gemini-1.5-flash")
+        generative_model = genai.GenerativeModel(model)
 
         print("Calling Gemini API for input")
 
-        response = model.generate_content(combined_input)
+        response = retrying('gemini', generative_model.generate_content)(combined_input)
+        metrics_helper.record_llm_usage('gemini', model, response)
         return (response.text)
 
+    def _measure_stream(self, provider, model, chunks):
+        metrics = StreamMetrics(provider, model)
+        self.stream_metrics.append(metrics)
+        error = None
+        try:
+            while True:
+                start = time.monotonic()
+                try:
+                    chunk = next(chunks, _END)
+                finally:
+                    metrics.waited(time.monotonic() - start)
+                if chunk is _END:
+                    break
+                if chunk:
+                    metrics.add_chunk(chunk)
+                    yield chunk
+        except GeneratorExit:
+            error = 'closed before the end of the stream'
+            chunks.close()
+            raise
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            metrics.finish(error=error)
+            first_token = f"{metrics.first_token_latency:.2f}s" if metrics.first_token_latency is not None else "n/a"
+            print(f"{provider} stream finished: first token after {first_token}, total {metrics.total_latency:.2f}s")
+
+    def stream_text_openai(self, prompt, text, model="gpt-4o"):
+        """Yield the completion in chunks as they arrive, recording the latency in stream_metrics."""
+        from openai import OpenAI
+
+        client = OpenAI(api_key=self.openai_api_key, max_retries=0)
+        message = [{"role": "assistant", "content": prompt}, {"role": "user", "content": text}]
+
+        print("Streaming GPT for topic: " + (text[:50] + '..' if len(text) > 52 else text))
+
+        def chunks():
+            # Only opening the stream is retried, a stream that breaks off is raised to the caller
+            response = retrying('openai', client.chat.completions.create)(
+                model=model,
+                messages=message,
+                temperature=1,
+                max_tokens=4095,
+                frequency_penalty=0.0,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            for event in response:
+                if event.choices:
+                    yield event.choices[0].delta.content
+                if event.usage:
+                    # Sent with the last event of the stream
+                    metrics_helper.record_llm_usage('openai', model, event)
+
+        return self._measure_stream('openai', model, chunks())
+
+    def stream_text_gemini(self, prompt, text, model="gemini-1.5-flash"):
+        """Yield the Gemini response in chunks as they arrive, recording the latency in stream_metrics."""
+        import google.generativeai as genai
+
+        genai.configure(api_key=self.gemini_api_key)
+        combined_input = AI.combine_input(prompt, text)
+        generative_model = genai.GenerativeModel(model)
+
+        print("Streaming Gemini API for input")
+
+        def chunks():
+            event = None
+            for event in retrying('gemini', generative_model.generate_content)(combined_input, stream=True):
+                yield event.text
+            if event is not None:
+                metrics_helper.record_llm_usage('gemini', model, event)
+
+        return self._measure_stream('gemini', model, chunks())
+
+    def stream_content(self, prompt, text):
+        """
+        Stream from the provider picked by the router. Failing over is only possible until the
+        first chunk has been yielded, after that an error is raised to the caller.
+        """
+        order, weights = self.router.ranked_providers()
+        error = None
+        for name in order:
+            print(f"Router selected for streaming: {name} (weight {weights[name]:.2f})")
+            chunks = self.stream_providers[name](prompt, text)
+            # Only the time spent waiting on the provider counts, not the consumer's time between chunks
+            waited = 0.0
+            parts = []
+            try:
+                while True:
+                    start = time.monotonic()
+                    try:
+                        chunk = next(chunks, _END)
+                    finally:
+                        waited += time.monotonic() - start
+                    if chunk is _END:
+                        break
+                    parts.append(chunk)
+                    yield chunk
+            except GeneratorExit:
+                chunks.close()
+                raise
+            except Exception as e:
+                self.router.record(name, waited, ok=False)
+                if parts:
+                    raise
+                print(f"{name} failed before the first chunk, failing over: {e}")
+                error = e
+                continue
+            self.router.record(name, waited, ok=True, prompt=prompt, text=text, result=''.join(parts))
+            return
+        raise error
+
+    async def astream_content(self, prompt, text):
+        """Async iterator version of stream_content, the blocking SDK calls run in a thread."""
+        loop = asyncio.get_running_loop()
+        chunks = self.stream_content(prompt, text)
+        done = object()
+        while True:
+            chunk = await loop.run_in_executor(None, next, chunks, done)
+            if chunk is done:
+                return
+            yield chunk
+
     @staticmethod
     def combine_input(prompt, text):
         return f"{prompt}\n\n{text}"
 
     def generate_random_content(self, prompt, text):
-        choice = random.choice(['openai', 'gemini'])
-
-        if choice == 'openai':
-            print("Randomly selected: OpenAI")
-            return self.generate_text_openai(prompt, text)
-        else:
-            print("Randomly selected: Gemini")
-            return self.generate_text_gemini(prompt, text)
+        # Provider choice is weighted by latency, errors and cost, see router_stats()
+        return self.router.generate(prompt, text)
 
+    def router_stats(self):
+        return self.router.stats()
@@ -1,42 +1,553 @@
+"""
+Script Name: AI Translate PDF
+Description:
+    This script translates a PDF page by page into English with OpenAI's GPT model and saves the
+    translation as a Word document, with a "Page N" heading and a page break for every page.
+
+    Memory stays flat no matter how long the document is:
+    - Pages are read lazily one at a time, with PyMuPDF when it is installed (faster) or PyPDF2,
+      and the parsed objects of a page are released once its text is extracted.
+    - The translation is written to a part document every --pages-per-part pages, and the parts
+      are merged into the final document at the end (or kept as they are with --split-output).
+
+    Pages are translated by a pool of --concurrency workers, optionally limited to --rate requests
+    per second. Given a directory instead of a PDF, the script translates every PDF below it: the
+    pages of all files go through one shared work queue, so the workers never wait on a single
+    file, and every file reports its progress and gets its own Word document (in the output
+    directory, mirroring the input directory).
+
+    Running headers, footers, university names and captions repeat on almost every page. A
+    translation memory splits every page into segments (its first and last line, short standalone
+    lines, and sentences or paragraphs) and keeps their translations in SQLite, keyed by a hash of the segment. Only the
+    segments it has not seen before are sent to the model, together in one request with numbered
+    markers. --no-memory translates whole pages as before.
+       © [2025] [Boes Marie]. All rights reserved.
+"""
+
+import argparse
+import copy
+import hashlib
 import os
+import queue
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
 import PyPDF2
 from docx import Document
 from openai import OpenAI
 
-client = OpenAI(
-    api_key=os.environ.get("OPENAI_API_KEY"),
-)
+import metrics_helper
+from rate_limit_helper import RateLimiter
+from resilience_helper import retrying
+
+DEFAULT_PAGES_PER_PART = 100
+DEFAULT_CONCURRENCY = 4
+TRANSLATION_MODEL = "gpt-3.5-turbo"
+TRANSLATION_MEMORY_PATH = os.getenv('TRANSLATION_MEMORY_PATH', 'translation_memory.sqlite')
+
+# A line ending a sentence, or a line much shorter than the full lines of the page (caption,
+# the end of a paragraph), ends a segment
+SEGMENT_END = re.compile(r'[.!?。:;)\]"\'”’]$')
+SHORT_LINE_RATIO = 0.6
+# Page numbers and other segments without letters are kept as they are
+UNTRANSLATABLE_SEGMENT = re.compile(r'^[\W\d_]+$')
+SEGMENT_MARKER = re.compile(r'\[\[(\d+)\]\]')
+
+_DONE = object()
+
+_client = None
+
+def get_client():
+    # Created on first use so importing this module has no side effects
+    global _client
+    if _client is None:
+        # Retries are handled by resilience_helper
+        _client = OpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY"),
+            max_retries=0,
+        )
+    return _client
 
 def translate_text(text):
-    response = client.chat.completions.create(
+    response = retrying('openai', get_client().chat.completions.create)(
         messages=[
             {
                 "role": "user",
                 "content": f"Translate the following text into English:\n\n{text}",
             }
         ],
-        model="gpt-3.5-turbo",
+        model=TRANSLATION_MODEL,
         max_tokens=4000
     )
+    metrics_helper.record_llm_usage('openai', TRANSLATION_MODEL, response)
     return response.choices[0].message.content
 
-def translate_pdf_to_word(pdf_path, word_path):
-    pdf_reader = PyPDF2.PdfReader(pdf_path)
+class TranslationMemory:
+    """Persistent store of segment translations keyed by a hash of the segment, in SQLite."""
+
+    def __init__(self, path=TRANSLATION_MEMORY_PATH):
+        # Shared by the worker threads, so every access goes through the lock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS translation_memory ("
+            " segment_hash TEXT PRIMARY KEY, source TEXT NOT NULL, translation TEXT NOT NULL,"
+            " model TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def segment_hash(segment):
+        return hashlib.sha256(segment.encode('utf-8')).hexdigest()
+
+    def get_many(self, segments):
+        """Return {segment: translation} for the segments that were translated before."""
+        hashes = {self.segment_hash(segment): segment for segment in segments}
+        found = {}
+        with self._lock:
+            keys = list(hashes)
+            # Stay well below SQLite's limit on bound parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.connection.execute(
+                    f"SELECT segment_hash, translation FROM translation_memory WHERE segment_hash IN ({placeholders})",
+                    chunk
+                )
+                found.update((hashes[segment_hash], translation) for segment_hash, translation in rows)
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        return found
+
+    def set_many(self, translations, model=TRANSLATION_MODEL):
+        now = time.time()
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO translation_memory (segment_hash, source, translation, model, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(self.segment_hash(source), source, translation, model, now) for source, translation in translations.items()]
+            )
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+def split_segments(text):
+    """
+    Split page text into segments: the first and last line of the page, short standalone lines,
+    and sentences or paragraphs.
+    """
+    lines = [' '.join(line.split()) for line in text.splitlines()]
+    short_line_length = SHORT_LINE_RATIO * max((len(line) for line in lines), default=0)
+    # Running headers and footers can be as long as a full line, they are segments of their own
+    # whatever their length so every page has the same segment for them
+    text_lines = [index for index, line in enumerate(lines) if line]
+    page_edges = {text_lines[0], text_lines[-1]} if text_lines else set()
+    segments = []
+    current = []
+    for index, line in enumerate(lines):
+        if not line or index in page_edges:
+            if current:
+                segments.append(' '.join(current))
+                current = []
+            if line:
+                segments.append(line)
+            continue
+        current.append(line)
+        if len(line) < short_line_length or SEGMENT_END.search(line):
+            segments.append(' '.join(current))
+            current = []
+    if current:
+        segments.append(' '.join(current))
+    return segments
+
+def parse_numbered_translations(content, count):
+    """Return the translations of segments [[1]] to [[count]], or None when one is missing."""
+    parts = SEGMENT_MARKER.split(content or '')
+    translations = {}
+    for index in range(1, len(parts) - 1, 2):
+        number = int(parts[index])
+        text = parts[index + 1].strip()
+        if 1 <= number <= count and text:
+            translations[number] = text
+    if len(translations) != count:
+        return None
+    return [translations[number] for number in range(1, count + 1)]
+
+def translate_segments(segments):
+    """Translate several segments with one request. Returns None when the answer cannot be matched up."""
+    numbered = '\n'.join(f"[[{number}]] {segment}" for number, segment in enumerate(segments, start=1))
+    response = retrying('openai', get_client().chat.completions.create)(
+        messages=[
+            {
+                "role": "user",
+                "content": (
+                    "Translate each [[n]] segment into English, keeping every marker:\n\n"
+                    f"{numbered}"
+                ),
+            }
+        ],
+        model=TRANSLATION_MODEL,
+        max_tokens=4000
+    )
+    metrics_helper.record_llm_usage('openai', TRANSLATION_MODEL, response)
+    return parse_numbered_translations(response.choices[0].message.content, len(segments))
+
+def translate_page(text, memory=None, limiter=None):
+    """Translate the text of a page, sending only the segments the memory does not know yet."""
+    if memory is None:
+        if limiter is not None:
+            limiter.acquire()
+        return translate_text(text)
+
+    segments = split_segments(text)
+    translatable = [segment for segment in segments if not UNTRANSLATABLE_SEGMENT.match(segment)]
+    known = memory.get_many(translatable)
+    unseen = list(dict.fromkeys(segment for segment in translatable if segment not in known))
+
+    if unseen:
+        if limiter is not None:
+            limiter.acquire()
+        translations = translate_segments(unseen)
+        if translations is None:
+            # The model did not keep the markers, translate the page as a whole instead
+            print("Segment markers were not kept in the answer, translating the whole page.")
+            if limiter is not None:
+                limiter.acquire()
+            return translate_text(text)
+        new = dict(zip(unseen, translations))
+        memory.set_many(new)
+        known.update(new)
+
+    return '\n'.join(known.get(segment, segment) for segment in segments)
+
+def pymupdf_available():
+    try:
+        import fitz  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def iter_pages_pymupdf(pdf_path):
+    import fitz
+
+    with fitz.open(pdf_path) as document:
+        for page_number in range(document.page_count):
+            page = document.load_page(page_number)
+            text = page.get_text()
+            # Drop the page and its resources before loading the next one
+            del page
+            yield page_number, text
+
+def iter_pages_pypdf2(pdf_path):
+    # Given a path PyPDF2 reads the whole file into memory, given a file it reads what it needs
+    with open(pdf_path, 'rb') as pdf_file:
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        for page_number in range(len(pdf_reader.pages)):
+            text = pdf_reader.pages[page_number].extract_text()
+            # PyPDF2 keeps every object it parsed (content streams, fonts, images) in this cache
+            pdf_reader.resolved_objects.clear()
+            yield page_number, text
+
+def iter_pdf_pages(pdf_path, backend='auto'):
+    """Yield (page number, text) for every page of the PDF, reading one page at a time."""
+    if backend == 'auto':
+        backend = 'pymupdf' if pymupdf_available() else 'pypdf2'
+    if backend == 'pymupdf':
+        return iter_pages_pymupdf(pdf_path)
+    return iter_pages_pypdf2(pdf_path)
+
+def count_pdf_pages(pdf_path, backend='auto'):
+    if backend == 'auto':
+        backend = 'pymupdf' if pymupdf_available() else 'pypdf2'
+    if backend == 'pymupdf':
+        import fitz
+
+        with fitz.open(pdf_path) as document:
+            return document.page_count
+    with open(pdf_path, 'rb') as pdf_file:
+        return len(PyPDF2.PdfReader(pdf_file).pages)
+
+def merge_documents(part_paths, word_path):
+    """Append the bodies of the part documents to the first one and save it as word_path."""
+    merged = Document(part_paths[0])
+    body = merged.element.body
+    # New content goes before the section properties, which have to stay the last element
+    section_properties = body.sectPr
+    for part_path in part_paths[1:]:
+        part = Document(part_path)
+        for element in part.element.body:
+            if element.tag.endswith('}sectPr'):
+                continue
+            if section_properties is not None:
+                section_properties.addprevious(copy.deepcopy(element))
+            else:
+                body.append(copy.deepcopy(element))
+        del part
+    merged.save(word_path)
+
+class ChunkedDocxWriter:
+    """
+    Writes translated pages to a new part document every `pages_per_part` pages, so only one
+    part is held in memory. close() merges the parts into word_path, or with merge=False keeps
+    them next to it as <name>.part0001.docx, <name>.part0002.docx, ...
+    """
+
+    def __init__(self, word_path, pages_per_part=DEFAULT_PAGES_PER_PART, merge=True):
+        self.word_path = word_path
+        self.pages_per_part = max(1, pages_per_part)
+        self.merge = merge
+        self.part_paths = []
+        self.pages_written = 0
+        self._document = None
+        self._pages_in_part = 0
+        output_directory = os.path.dirname(os.path.abspath(word_path))
+        self._part_directory = tempfile.mkdtemp(prefix='.translate_parts_', dir=output_directory) if merge else None
+
+    def _part_path(self, index):
+        stem, extension = os.path.splitext(self.word_path)
+        if self.merge:
+            return os.path.join(self._part_directory, f"part{index:04d}{extension or '.docx'}")
+        return f"{stem}.part{index:04d}{extension or '.docx'}"
+
+    def add_page(self, page_number, translated_text):
+        if self._document is None:
+            self._document = Document()
+        self._document.add_paragraph(f"Page {page_number + 1}")
+        self._document.add_paragraph(translated_text)
+        self._document.add_page_break()
+        self._pages_in_part += 1
+        self.pages_written += 1
+        if self._pages_in_part >= self.pages_per_part:
+            self._save_part()
+
+    def _save_part(self):
+        if self._document is None:
+            return
+        part_path = self._part_path(len(self.part_paths) + 1)
+        self._document.save(part_path)
+        self.part_paths.append(part_path)
+        self._document = None
+        self._pages_in_part = 0
+
+    def close(self):
+        self._save_part()
+        if not self.merge:
+            return self.part_paths
+        try:
+            if self.part_paths:
+                merge_documents(self.part_paths, self.word_path)
+            else:
+                Document().save(self.word_path)
+        finally:
+            shutil.rmtree(self._part_directory, ignore_errors=True)
+        return [self.word_path]
+
+    def discard(self):
+        """Drop everything written so far, e.g. after a page could not be translated."""
+        self._document = None
+        if self.merge:
+            shutil.rmtree(self._part_directory, ignore_errors=True)
+        else:
+            for part_path in self.part_paths:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+        self.part_paths = []
+
+class TranslationJob:
+    """
+    One PDF of a run. Pages are translated in any order by the workers and written to the
+    document in page order; the document is finished once every queued page is translated.
+    """
+
+    def __init__(self, pdf_path, word_path, total_pages=None, pages_per_part=DEFAULT_PAGES_PER_PART, merge=True):
+        self.pdf_path = pdf_path
+        self.word_path = word_path
+        self.total_pages = total_pages
+        self.name = os.path.basename(pdf_path)
+        self.writer = ChunkedDocxWriter(word_path, pages_per_part=pages_per_part, merge=merge)
+        self.queued = 0
+        self.translated = 0
+        self.error = None
+        self.output_paths = None
+        self._all_queued = False
+        self._pending = {}
+        self._next_sequence = 0
+        self._lock = threading.Lock()
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+    @property
+    def finished(self):
+        return self.output_paths is not None or self.failed
+
+    def queue_page(self):
+        """Return the sequence number of the next page with text that is queued for translation."""
+        with self._lock:
+            self.queued += 1
+            return self.queued - 1
+
+    def all_pages_queued(self):
+        with self._lock:
+            self._all_queued = True
+            self._finish_if_done()
+
+    def add_translation(self, sequence, page_number, translated_text):
+        with self._lock:
+            if self.finished:
+                return
+            self._pending[sequence] = (page_number, translated_text)
+            self.translated += 1
+            while self._next_sequence in self._pending:
+                self.writer.add_page(*self._pending.pop(self._next_sequence))
+                self._next_sequence += 1
+            print(f"[{self.name}] Translated page {page_number + 1} "
+                  f"({self.translated}/{self.total_pages or '?'} pages)")
+            self._finish_if_done()
+
+    def fail(self, error):
+        with self._lock:
+            if self.finished:
+                return
+            self.error = error
+            self._pending.clear()
+            self.writer.discard()
+        print(f"[{self.name}] Translation failed, no document written: {error}")
+
+    def _finish_if_done(self):
+        if self._all_queued and self.translated == self.queued and not self.finished:
+            self.output_paths = self.writer.close()
+            print(f"[{self.name}] Translation saved to {', '.join(self.output_paths)}")
+
+def queue_pages(jobs, work_queue, backend='auto'):
+    """Read the pages of all PDFs, one file after the other, onto the shared work queue."""
+    for job in jobs:
+        try:
+            for page_number, text in iter_pdf_pages(job.pdf_path, backend):
+                if job.failed:
+                    break
+                if text:
+                    work_queue.put((job, job.queue_page(), page_number, text))
+        except Exception as e:
+            job.fail(e)
+        job.all_pages_queued()
+
+def translate_worker(work_queue, limiter=None, memory=None):
+    while True:
+        item = work_queue.get()
+        if item is _DONE:
+            return
+        job, sequence, page_number, text = item
+        if job.failed:
+            continue
+        try:
+            with metrics_helper.timed('record', 'translate_page'):
+                translated_text = translate_page(text, memory, limiter)
+        except Exception as e:
+            job.fail(e)
+            continue
+        job.add_translation(sequence, page_number, translated_text)
+
+def translate_pdfs(files, backend='auto', pages_per_part=DEFAULT_PAGES_PER_PART, merge=True,
+                   concurrency=DEFAULT_CONCURRENCY, requests_per_second=None, memory_path=TRANSLATION_MEMORY_PATH):
+    """Translate [(pdf_path, word_path), ...] with one pool of workers shared by all files."""
+    jobs = []
+    for pdf_path, word_path in files:
+        try:
+            total_pages = count_pdf_pages(pdf_path, backend)
+        except Exception as e:
+            print(f"Could not read {pdf_path}: {e}")
+            continue
+        jobs.append(TranslationJob(pdf_path, word_path, total_pages, pages_per_part=pages_per_part, merge=merge))
+    print(f"Translating {sum(job.total_pages for job in jobs)} pages of {len(jobs)} PDF files "
+          f"with {concurrency} workers.")
+
+    # A bounded queue keeps only a few pages per worker in memory
+    work_queue = queue.Queue(maxsize=max(1, concurrency) * 4)
+    limiter = RateLimiter(requests_per_second) if requests_per_second else None
+    memory = TranslationMemory(memory_path) if memory_path else None
+    workers = [
+        threading.Thread(target=translate_worker, args=(work_queue, limiter, memory), name=f"translate-{index}",
+                         daemon=True)
+        for index in range(max(1, concurrency))
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        queue_pages(jobs, work_queue, backend)
+    finally:
+        for _ in workers:
+            work_queue.put(_DONE)
+        for worker in workers:
+            worker.join()
+        if memory is not None:
+            print(f"Translation memory: {memory.hits} segments reused, {memory.misses} translated.")
+            memory.close()
+
+    translated_files = sum(1 for job in jobs if job.output_paths is not None)
+    print(f"Translated {translated_files} of {len(files)} PDF files.")
+    return jobs
+
+def find_pdfs(input_directory, output_directory):
+    """Yield (pdf_path, word_path) for every PDF below input_directory."""
+    for directory, subdirectories, filenames in os.walk(input_directory):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            if not filename.lower().endswith('.pdf'):
+                continue
+            pdf_path = os.path.join(directory, filename)
+            relative_path = os.path.relpath(pdf_path, input_directory)
+            word_path = os.path.join(output_directory, os.path.splitext(relative_path)[0] + '.docx')
+            os.makedirs(os.path.dirname(word_path), exist_ok=True)
+            yield pdf_path, word_path
+
+def translate_directory(input_directory, output_directory=None, **options):
+    files = list(find_pdfs(input_directory, output_directory or input_directory))
+    if not files:
+        print(f"No PDF files found in {input_directory}")
+        return []
+    return translate_pdfs(files, **options)
 
-    document = Document()
+def translate_pdf_to_word(pdf_path, word_path, backend='auto', pages_per_part=DEFAULT_PAGES_PER_PART, merge=True,
+                          concurrency=1, requests_per_second=None, memory_path=TRANSLATION_MEMORY_PATH):
+    jobs = translate_pdfs([(pdf_path, word_path)], backend=backend, pages_per_part=pages_per_part, merge=merge,
+                          concurrency=concurrency, requests_per_second=requests_per_second, memory_path=memory_path)
+    return jobs[0].output_paths if jobs else None
 
-    for page_number, page in enumerate(pdf_reader.pages):
-        text = page.extract_text()
-        if text:
-            translated_text = translate_text(text)
-            document.add_paragraph(f"Page {page_number + 1}")
-            document.add_paragraph(translated_text)
-            document.add_page_break()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Translate a PDF into English and save it as a Word document.")
+    parser.add_argument('pdf_path', nargs='?', default=r'C:\Users\marie\Downloads\translate\translate.pdf',
+                        help="PDF file, or a directory to translate every PDF below it")
+    parser.add_argument('word_path', nargs='?',
+                        help="Word document, or for a directory the output directory (default: the input directory)")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help="Pages translated in parallel")
+    parser.add_argument('--rate', type=float, help="Maximum translation requests per second, shared by all workers")
+    parser.add_argument('--backend', choices=['auto', 'pymupdf', 'pypdf2'], default='auto',
+                        help="PDF text extraction backend, auto uses PyMuPDF when it is installed")
+    parser.add_argument('--pages-per-part', type=int, default=DEFAULT_PAGES_PER_PART,
+                        help="Pages written to one part document before it is saved and released")
+    parser.add_argument('--split-output', action='store_true',
+                        help="Keep the part documents instead of merging them into one document")
+    parser.add_argument('--memory', default=TRANSLATION_MEMORY_PATH, help="Path of the SQLite translation memory")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="Translate whole pages without the translation memory")
+    args = parser.parse_args(argv)
+    options = dict(backend=args.backend, pages_per_part=args.pages_per_part, merge=not args.split_output,
+                   concurrency=args.concurrency, requests_per_second=args.rate,
+                   memory_path=None if args.no_memory else args.memory)
 
-    document.save(word_path)
-    print(f'Translation saved to {word_path}')
+    if os.path.isdir(args.pdf_path):
+        translate_directory(args.pdf_path, args.word_path, **options)
+    else:
+        word_path = args.word_path or r'C:\Users\marie\Downloads\translate\translate.docx'
+        translate_pdf_to_word(args.pdf_path, word_path, **options)
 
 if __name__ == "__main__":
-    pdf_path = r'C:\Users\marie\Downloads\translate\translate.pdf'
-    word_path = r'C:\Users\marie\Downloads\translate\translate.docx'
-    translate_pdf_to_word(pdf_path, word_path)
\ No newline at end of file
+    main()
@@ -0,0 +1,382 @@
+"""
+Script Name: Airtable Helper
+Description:
+    Shared helpers for the scripts that read and write the Airtable content table.
+
+    airtable_table returns a table whose API calls go through the shared retry and circuit
+    breaker layer of resilience_helper, so rate limited or failing requests are retried with
+    backoff instead of failing the record. Every HTTP request of the table, including the page
+    requests of all(), first takes a slot of the host-wide rate limit of its base
+    (AIRTABLE_REQUESTS_PER_SECOND, 5 by default like Airtable's own limit, 0 to turn it off), which
+    is shared with all other scripts running on the same machine.
+
+    AirtableBatchWriter buffers record updates and creates coming from many worker threads and
+    writes them with Airtable's batch endpoints, which accept up to 10 records per request.
+    Updates to the same record that are still waiting in the buffer are merged, and a background
+    thread flushes the buffer when a batch is full or after a short interval. The records of a
+    batch update that fails are retried one by one, and the ones that still fail are kept in
+    failed_updates (and fail the Future returned by update()) for the caller to report.
+
+    AirtableMirror keeps a local SQLite replica of a table (AIRTABLE_MIRROR_PATH) with indexes on
+    the fields the scripts select on (state, key_phrase, source_content_url, wp_id). sync() only
+    fetches the records changed since the previous sync with a LAST_MODIFIED_TIME() formula and
+    does a full sync once a day (AIRTABLE_MIRROR_FULL_SYNC_HOURS), which also drops deleted
+    records. select() then runs the selection locally, and writes go to Airtable first and are
+    applied to the replica from Airtable's answer.
+       © [2025] [Boes Marie]. All rights reserved.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timezone
+
+from pyairtable import Api
+from requests.adapters import HTTPAdapter
+
+from rate_limit_helper import SharedRateLimiter
+from resilience_helper import retrying
+
+AIRTABLE_BATCH_SIZE = 10
+AIRTABLE_ENDPOINT = 'airtable'
+# Points the scripts at another Airtable compatible server, e.g. the mock of the benchmarks
+AIRTABLE_ENDPOINT_URL = os.getenv('AIRTABLE_ENDPOINT_URL', 'https://api.airtable.com')
+
+AIRTABLE_REQUESTS_PER_SECOND = float(os.getenv('AIRTABLE_REQUESTS_PER_SECOND', 5))
+
+AIRTABLE_MIRROR_PATH = os.getenv('AIRTABLE_MIRROR_PATH', 'airtable_mirror.sqlite')
+MIRROR_INDEXED_FIELDS = ('state', 'key_phrase', 'source_content_url', 'wp_id')
+MIRROR_FULL_SYNC_INTERVAL = float(os.getenv('AIRTABLE_MIRROR_FULL_SYNC_HOURS', 24)) * 3600
+# Incremental syncs overlap a little, for clock differences and edits made during a sync
+MIRROR_SYNC_OVERLAP = 300
+
+# Conditions of AirtableMirror.select for an empty or a filled in field
+BLANK = object()
+NOT_BLANK = object()
+
+
+class ResilientTable:
+    """Wraps a pyairtable Table so its API calls are retried by the shared resilience layer."""
+
+    IDEMPOTENT_METHODS = {'all', 'first', 'get', 'update', 'batch_update', 'batch_upsert', 'delete', 'batch_delete'}
+    # Repeating a create after a server error could create the record twice
+    NON_IDEMPOTENT_METHODS = {'create', 'batch_create'}
+
+    def __init__(self, table, endpoint=AIRTABLE_ENDPOINT):
+        self.table = table
+        self.endpoint = endpoint
+
+    def __getattr__(self, name):
+        attribute = getattr(self.table, name)
+        if name in self.IDEMPOTENT_METHODS:
+            return retrying(self.endpoint, attribute)
+        if name in self.NON_IDEMPOTENT_METHODS:
+            return retrying(self.endpoint, attribute, idempotent=False)
+        return attribute
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def base_rate_limiter(base_id):
+    """The host-wide rate limiter of an Airtable base, one per process."""
+    with _limiters_lock:
+        if base_id not in _limiters:
+            _limiters[base_id] = SharedRateLimiter(f'airtable:{base_id}', AIRTABLE_REQUESTS_PER_SECOND)
+        return _limiters[base_id]
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """Transport adapter that makes every request, retries included, wait for the limit of its base."""
+
+    def send(self, request, *args, **kwargs):
+        # Request paths look like /v0/<base id>/<table>
+        parts = request.path_url.split('/')
+        if len(parts) > 2 and parts[2]:
+            base_rate_limiter(parts[2].split('?')[0]).acquire()
+        return super().send(request, *args, **kwargs)
+
+
+def airtable_table(api_key, base_id, table_name):
+    # Retries are handled by resilience_helper instead of pyairtable's own retry strategy
+    api = Api(api_key, retry_strategy=None, endpoint_url=AIRTABLE_ENDPOINT_URL)
+    if AIRTABLE_REQUESTS_PER_SECOND > 0:
+        adapter = RateLimitedAdapter()
+        api.session.mount('https://', adapter)
+        api.session.mount('http://', adapter)
+    return ResilientTable(api.table(base_id, table_name))
+
+
+class AirtableBatchWriter:
+    def __init__(self, table, batch_size=AIRTABLE_BATCH_SIZE, flush_interval=2.0):
+        self.table = table
+        self.batch_size = min(batch_size, AIRTABLE_BATCH_SIZE)
+        self.flush_interval = flush_interval
+        self._updates = {}
+        self._update_futures = {}
+        self._creates = []
+        # Record id -> error of the updates that could not be written, even one record at a time
+        self.failed_updates = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='airtable-batch-writer', daemon=True)
+        self._thread.start()
+
+    def update(self, record_id, fields):
+        """
+        Queue an update, merged with any pending update of the same record. Returns a Future that
+        resolves to the updated record, or fails when the update could not be written.
+        """
+        future = Future()
+        with self._lock:
+            self._updates.setdefault(record_id, {}).update(fields)
+            self._update_futures.setdefault(record_id, []).append(future)
+            if len(self._updates) >= self.batch_size:
+                self._wakeup.set()
+        return future
+
+    def create(self, fields):
+        """Queue a new record. Returns a Future that resolves to the created record."""
+        future = Future()
+        with self._lock:
+            self._creates.append((fields, future))
+            if len(self._creates) >= self.batch_size:
+                self._wakeup.set()
+        return future
+
+    def flush(self):
+        """Write everything that is pending, in batches."""
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    creates = self._creates[:self.batch_size]
+                    del self._creates[:self.batch_size]
+                    update_ids = list(self._updates)[:self.batch_size]
+                    updates = [({'id': record_id, 'fields': self._updates.pop(record_id)},
+                                self._update_futures.pop(record_id)) for record_id in update_ids]
+                if not creates and not updates:
+                    return
+                if creates:
+                    self._write_creates(creates)
+                if updates:
+                    self._write_updates(updates)
+
+    def _write_creates(self, creates):
+        try:
+            records = self.table.batch_create([fields for fields, _ in creates])
+        except Exception as e:
+            print(f"Error creating {len(creates)} Airtable records: {e}")
+            for _, future in creates:
+                future.set_exception(e)
+            return
+        for (_, future), record in zip(creates, records):
+            future.set_result(record)
+
+    def _write_updates(self, updates):
+        try:
+            records = self.table.batch_update([update for update, _ in updates])
+        except Exception as e:
+            # One invalid record fails the whole batch, so the records are retried one by one
+            record_ids = ', '.join(update['id'] for update, _ in updates)
+            print(f"Error updating Airtable records {record_ids}: {e}, retrying them one by one.")
+            for update, futures in updates:
+                self._write_update(update, futures)
+            return
+        for (_, futures), record in zip(updates, records):
+            for future in futures:
+                future.set_result(record)
+
+    def _write_update(self, update, futures):
+        try:
+            record = self.table.update(update['id'], update['fields'])
+        except Exception as e:
+            print(f"Error updating Airtable record {update['id']}: {e}")
+            with self._lock:
+                self.failed_updates[update['id']] = str(e)
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future in futures:
+            future.set_result(record)
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self):
+        """Stop the background thread and write everything that is still pending."""
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def _field_expression(name):
+    """SQL for the value of a field; indexes and queries have to use the exact same expression."""
+    path = '$."' + name.replace('"', '\\"') + '"'
+    return "json_extract(fields, '" + path.replace("'", "''") + "')"
+
+
+class AirtableMirror:
+    """Local SQLite replica of an Airtable table, see the module docstring."""
+
+    def __init__(self, table, path=AIRTABLE_MIRROR_PATH, indexed_fields=MIRROR_INDEXED_FIELDS):
+        self.table = table
+        airtable = getattr(table, 'table', table)
+        self.source = f"{airtable.base.id}/{airtable.name}"
+        self._lock = threading.Lock()
+        # Writes can come from the background thread of an AirtableBatchWriter
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # Several scripts can read and sync the same mirror at the same time
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                source TEXT NOT NULL,
+                id TEXT NOT NULL,
+                created_time TEXT,
+                fields TEXT NOT NULL,
+                PRIMARY KEY (source, id)
+            );
+            CREATE TABLE IF NOT EXISTS syncs (
+                source TEXT PRIMARY KEY,
+                last_sync REAL,
+                last_full_sync REAL
+            );
+            """
+        )
+        for field in indexed_fields:
+            index_name = 'records_' + re.sub(r'\W', '_', field)
+            self.connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON records (source, {_field_expression(field)})"
+            )
+        self.connection.commit()
+
+    def _insert(self, records):
+        """Insert or replace records, within a transaction the caller holds."""
+        rows = [(self.source, record['id'], record.get('createdTime'), json.dumps(record.get('fields', {})))
+                for record in records]
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO records (source, id, created_time, fields) VALUES (?, ?, ?, ?)", rows
+        )
+
+    def _store(self, records):
+        with self._lock, self.connection:
+            self._insert(records)
+
+    def sync(self, full=False):
+        """Bring the replica up to date. Returns the number of records fetched from Airtable."""
+        started = time.time()
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT last_sync, last_full_sync FROM syncs WHERE source = ?", (self.source,)
+            ).fetchone()
+        last_sync, last_full_sync = row or (None, None)
+
+        if full or last_sync is None or started - (last_full_sync or 0) > MIRROR_FULL_SYNC_INTERVAL:
+            records = self.table.all()
+            # One transaction, readers never see an empty or partly filled replica
+            with self._lock, self.connection:
+                self.connection.execute("DELETE FROM records WHERE source = ?", (self.source,))
+                self._insert(records)
+            last_full_sync = started
+            print(f"Full sync of the Airtable mirror of {self.source}: {len(records)} records.")
+        else:
+            since = datetime.fromtimestamp(last_sync - MIRROR_SYNC_OVERLAP, timezone.utc)
+            records = self.table.all(formula=f"IS_AFTER(LAST_MODIFIED_TIME(), '{since:%Y-%m-%dT%H:%M:%S.000Z}')")
+            self._store(records)
+            print(f"Synced {len(records)} changed records into the Airtable mirror of {self.source}.")
+
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO syncs (source, last_sync, last_full_sync) VALUES (?, ?, ?)",
+                (self.source, started, last_full_sync),
+            )
+        return len(records)
+
+    def select(self, conditions=None, **field_conditions):
+        """
+        Records whose fields match all conditions, e.g. `select(state='READY_TO_PUBLISH', html=BLANK)`.
+        A condition is a value, a list of values, BLANK or NOT_BLANK.
+        """
+        clauses = ['source = ?']
+        params = [self.source]
+        for field, value in {**(conditions or {}), **field_conditions}.items():
+            expression = _field_expression(field)
+            if value is BLANK:
+                clauses.append(f"({expression} IS NULL OR {expression} = '')")
+            elif value is NOT_BLANK:
+                clauses.append(f"({expression} IS NOT NULL AND {expression} != '')")
+            elif isinstance(value, (list, tuple, set)):
+                clauses.append(f"{expression} IN ({', '.join('?' * len(value))})")
+                params.extend(value)
+            else:
+                clauses.append(f"{expression} = ?")
+                params.append(value)
+
+        with self._lock:
+            rows = self.connection.execute(
+                f"SELECT id, created_time, fields FROM records WHERE {' AND '.join(clauses)}", params
+            ).fetchall()
+        return [{'id': record_id, 'createdTime': created_time, 'fields': json.loads(fields)}
+                for record_id, created_time, fields in rows]
+
+    def get(self, record_id):
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT created_time, fields FROM records WHERE source = ? AND id = ?", (self.source, record_id)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'id': record_id, 'createdTime': row[0], 'fields': json.loads(row[1])}
+
+    # Writes go to Airtable first, the replica takes the records from its answer
+
+    def update(self, record_id, fields, **options):
+        record = self.table.update(record_id, fields, **options)
+        self._store([record])
+        return record
+
+    def batch_update(self, records, **options):
+        updated = self.table.batch_update(records, **options)
+        self._store(updated)
+        return updated
+
+    def create(self, fields, **options):
+        record = self.table.create(fields, **options)
+        self._store([record])
+        return record
+
+    def batch_create(self, records, **options):
+        created = self.table.batch_create(records, **options)
+        self._store(created)
+        return created
+
+    def delete(self, record_id):
+        result = self.table.delete(record_id)
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM records WHERE source = ? AND id = ?", (self.source, record_id))
+        return result
+
+    def __getattr__(self, name):
+        # Everything else, e.g. all() with a formula, goes straight to Airtable
+        return getattr(self.table, name)
+
+    def close(self):
+        self.connection.close()
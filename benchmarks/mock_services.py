@@ -0,0 +1,527 @@
+"""
+Script Name: Mock Services For Benchmarks
+Description:
+    Local stand-ins for the services the scripts talk to, so their performance can be measured
+    on a laptop without network access or API keys. One threaded HTTP server answers for all of
+    them, on different paths:
+
+    - /v1/chat/completions: the OpenAI chat completions API, with a configurable latency per call
+      and token usage in the response. Streaming (`stream: true`) is answered with server sent
+      events like the real API. The answer is a Markdown article, FAQ schema HTML when the prompt
+      asks for it, FAQ JSON for each key phrase of the request in JSON mode, or one translation
+      per [[n]] marker for numbered segments.
+    - /v0/<base>/<table>: the Airtable REST API (list with pagination, get, create, update, batch
+      create and update with at most 10 records). Every base is limited to a number of requests
+      per second and answers 429 above it, like Airtable does. Formulas are NOT evaluated, so a
+      table should only be seeded with the records the script under test is meant to pick up.
+    - /wp-json/wp/v2/posts: the WordPress REST API for creating, updating and listing posts, and
+      /wp-json/batch/v1 for up to 25 post requests in one call (answered 207 with one response per
+      request, `wordpress_item_latency` extra per request).
+    - /site/sitemap.xml and /site/page-<n>: a fixture website whose sitemap lists its pages.
+      Every `noindex_every`-th page has a noindex meta tag and every `header_noindex_every`-th
+      page an X-Robots-Tag header. Every `redirect_every`-th page is listed under its old URL,
+      which redirects to it, and every `blocked_every`-th page under /site/private/, which
+      /robots.txt disallows. Pages link a canonical and two hreflang alternates.
+       © [2025] [Boes Marie]. All rights reserved.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+import re
+from urllib.parse import parse_qs, unquote, urlparse
+
+AIRTABLE_PAGE_SIZE = 100
+AIRTABLE_BATCH_SIZE = 10
+WORDPRESS_BATCH_SIZE = 25
+SEGMENT_MARKER = re.compile(r'\[\[(\d+)\]\]')
+
+ARTICLE_PARAGRAPH = (
+    "The National Tax Service explained how the new rules apply to foreign residents and which "
+    "documents have to be filed before the deadline. Taxpayers can check their status online."
+)
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def fake_completion(words):
+    """A Markdown article of roughly `words` words with a couple of H2 headings."""
+    sections = []
+    paragraph_words = len(ARTICLE_PARAGRAPH.split())
+    for index in range(max(1, words // (paragraph_words * 2))):
+        sections.append(f"## Section {index + 1}\n\n{ARTICLE_PARAGRAPH}\n\n{ARTICLE_PARAGRAPH}")
+    return "# Generated article\n\n" + "\n\n".join(sections)
+
+
+def fake_faq_pairs(key_phrase):
+    return [{'q': f"What should I know about {key_phrase} question {index}?", 'a': ARTICLE_PARAGRAPH}
+            for index in range(1, 4)]
+
+
+def fake_faq_html(key_phrase):
+    questions = ''.join(
+        '<div itemscope itemprop="mainEntity" itemtype="https://schema.org/Question">\n'
+        f'    <h3 itemprop="name">{pair["q"]}</h3>\n'
+        '    <div itemscope itemprop="acceptedAnswer" itemtype="https://schema.org/Answer">\n'
+        f'        <div itemprop="text">{pair["a"]}</div>\n'
+        '    </div>\n'
+        '</div>\n'
+        for pair in fake_faq_pairs(key_phrase)
+    )
+    return ('<div itemscope itemtype="https://schema.org/FAQPage">\n'
+            f'<h2> Frequently Asked Questions (FAQ) </h2>\n{questions}</div>')
+
+
+def fake_faq_json(messages):
+    """JSON answer for a batch FAQ request, whose user message is a JSON list of key phrases."""
+    key_phrases = []
+    for message in messages:
+        if message.get('role') == 'user':
+            try:
+                key_phrases = json.loads(message.get('content') or '[]')
+            except ValueError:
+                pass
+    if not isinstance(key_phrases, list):
+        key_phrases = []
+    return json.dumps({'faqs': {str(key_phrase): fake_faq_pairs(key_phrase) for key_phrase in key_phrases}})
+
+
+def fake_segment_translations(prompt):
+    parts = SEGMENT_MARKER.split(prompt)
+    return '\n'.join(f"[[{parts[index]}]] Translated: {parts[index + 1].strip()}" for index in range(1, len(parts) - 1, 2))
+
+
+def fake_answer(body, completion_words):
+    messages = body.get('messages', [])
+    prompt = ' '.join(str(message.get('content', '')) for message in messages)
+    if (body.get('response_format') or {}).get('type') == 'json_object':
+        return fake_faq_json(messages)
+    if SEGMENT_MARKER.search(prompt):
+        return fake_segment_translations(prompt)
+    if 'FAQ Schema' in prompt:
+        return fake_faq_html(prompt[:40])
+    return fake_completion(completion_words)
+
+
+class TokenBucket:
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class MockServices(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, openai_latency=0.5, completion_words=400,
+                 airtable_rate=5, airtable_latency=0.02, wordpress_latency=0.1, wordpress_item_latency=0.01,
+                 page_latency=0.02, site_pages=200, noindex_every=10, header_noindex_every=25, redirect_every=20,
+                 blocked_every=50):
+        super().__init__((host, port), MockRequestHandler)
+        self.openai_latency = openai_latency
+        self.completion_words = completion_words
+        self.airtable_rate = airtable_rate
+        self.airtable_latency = airtable_latency
+        self.wordpress_latency = wordpress_latency
+        self.wordpress_item_latency = wordpress_item_latency
+        self.page_latency = page_latency
+        self.site_pages = site_pages
+        self.noindex_every = noindex_every
+        self.header_noindex_every = header_noindex_every
+        self.redirect_every = redirect_every
+        self.blocked_every = blocked_every
+
+        self.tables = {}
+        self.posts = {}
+        self.request_counts = {}
+        self._buckets = {}
+        self._ids = count(1)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='mock-services', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def count_request(self, service, status):
+        with self._lock:
+            key = f"{service} {status}"
+            self.request_counts[key] = self.request_counts.get(key, 0) + 1
+
+    def reset_counts(self):
+        with self._lock:
+            self.request_counts = {}
+
+    # Airtable
+
+    def new_record_id(self):
+        return f"rec{next(self._ids):014d}"
+
+    def seed_table(self, base_id, table_name, records):
+        """Replace the content of a table with records built from a list of field dicts."""
+        table = {}
+        for fields in records:
+            record_id = self.new_record_id()
+            table[record_id] = {'id': record_id, 'createdTime': '2025-01-01T00:00:00.000Z', 'fields': dict(fields)}
+        with self._lock:
+            self.tables[(base_id, table_name)] = table
+        return list(table.values())
+
+    def table(self, base_id, table_name):
+        with self._lock:
+            return self.tables.setdefault((base_id, table_name), {})
+
+    def airtable_allowed(self, base_id):
+        with self._lock:
+            bucket = self._buckets.setdefault(base_id, TokenBucket(self.airtable_rate))
+        return bucket.take()
+
+    # WordPress
+
+    def new_post_id(self):
+        return next(self._ids)
+
+    def save_post(self, post_id, body):
+        """Create a post, or update it when `post_id` is given. Returns the status and the post."""
+        if post_id:
+            post = self.posts.get(int(post_id))
+            if post is None:
+                return 404, {'code': 'rest_post_invalid_id'}
+            status = 200
+        else:
+            new_id = self.new_post_id()
+            post = self.posts[new_id] = {'id': new_id, 'slug': f"post-{new_id}", 'link': f"{self.url}/post-{new_id}/"}
+            status = 201
+        for field in ('title', 'content'):
+            if field in body:
+                post[field] = {'rendered': body[field]}
+        for field in ('status', 'date', 'featured_media', 'slug'):
+            if field in body:
+                post[field] = body[field]
+        return status, post
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, without this a kept alive connection waits for
+    # the delayed ACK of the client before the body is sent
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def send_body(self, status, body, content_type='application/json', headers=None):
+        if not isinstance(body, bytes):
+            body = (json.dumps(body) if content_type == 'application/json' else body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.route('GET')
+
+    def do_POST(self):
+        self.route('POST')
+
+    def do_PATCH(self):
+        self.route('PATCH')
+
+    def do_PUT(self):
+        self.route('PUT')
+
+    def route(self, method):
+        parsed = urlparse(self.path)
+        path = parsed.path
+        query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        # Always read the body, a keep-alive connection would otherwise see it as the next request
+        self.body = self.read_json()
+        if path.startswith('/v1/chat/completions'):
+            self.openai_chat(method)
+        elif path.startswith('/v0/'):
+            self.airtable(method, [unquote(part) for part in path.split('/')[2:]], query)
+        elif path.rstrip('/') == '/wp-json/batch/v1':
+            self.wordpress_batch(method)
+        elif path.startswith('/wp-json/wp/v2/posts'):
+            self.wordpress_posts(method, path[len('/wp-json/wp/v2/posts'):].strip('/'), query)
+        elif path == '/robots.txt':
+            self.server.count_request('site', 200)
+            self.send_body(200, 'User-agent: *\nDisallow: /site/private/\n', content_type='text/plain')
+        elif path.startswith('/site/'):
+            self.site(path[len('/site/'):])
+        else:
+            self.send_body(404, {'error': 'not found'})
+
+    # OpenAI
+
+    def openai_chat(self, method):
+        server = self.server
+        if method != 'POST':
+            self.send_body(405, {'error': {'message': 'method not allowed'}})
+            return
+        body = self.body
+        prompt = ' '.join(str(message.get('content', '')) for message in body.get('messages', []))
+        content = fake_answer(body, server.completion_words)
+        usage = {
+            'prompt_tokens': estimate_tokens(prompt),
+            'completion_tokens': estimate_tokens(content),
+            'total_tokens': estimate_tokens(prompt) + estimate_tokens(content),
+        }
+        completion_id = f"chatcmpl-{random.getrandbits(32):08x}"
+        model = body.get('model', 'gpt-4o')
+        latency = server.openai_latency * random.uniform(0.8, 1.2)
+        server.count_request('openai', 200)
+
+        if not body.get('stream'):
+            time.sleep(latency)
+            self.send_body(200, {
+                'id': completion_id, 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+            return
+
+        # Half of the latency before the first token, the rest spread over the chunks
+        words = content.split(' ')
+        chunks = [' '.join(words[index:index + 20]) + ' ' for index in range(0, len(words), 20)]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        time.sleep(latency / 2)
+        for chunk in chunks:
+            self.send_event({
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'delta': {'content': chunk}, 'finish_reason': None}],
+            })
+            time.sleep(latency / 2 / len(chunks))
+        if (body.get('stream_options') or {}).get('include_usage'):
+            self.send_event({
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                'choices': [], 'usage': usage,
+            })
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+
+    def send_event(self, payload):
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    # Airtable
+
+    def airtable(self, method, parts, query):
+        server = self.server
+        if len(parts) < 2:
+            self.send_body(404, {'error': 'NOT_FOUND'})
+            return
+        base_id, table_name, rest = parts[0], parts[1], parts[2:]
+        time.sleep(server.airtable_latency)
+        if not server.airtable_allowed(base_id):
+            server.count_request('airtable', 429)
+            self.send_body(429, {'errors': [{'error': 'RATE_LIMIT_REACHED',
+                                             'message': 'Rate limit exceeded. Please try again later'}]})
+            return
+        server.count_request('airtable', 200)
+        table = server.table(base_id, table_name)
+
+        if method == 'GET' and not rest:
+            self.airtable_list(table, query)
+        elif method == 'POST' and rest == ['listRecords']:
+            self.airtable_list(table, self.body)
+        elif method == 'GET':
+            record = table.get(rest[0])
+            self.send_body(200 if record else 404, record or {'error': 'NOT_FOUND'})
+        elif method == 'POST' and not rest:
+            self.airtable_create(table, self.body)
+        elif method in ('PATCH', 'PUT'):
+            self.airtable_update(table, method, rest, self.body)
+        else:
+            self.send_body(404, {'error': 'NOT_FOUND'})
+
+    def airtable_list(self, table, options):
+        records = list(table.values())
+        offset = int(options.get('offset') or 0)
+        page_size = min(int(options.get('pageSize') or AIRTABLE_PAGE_SIZE), AIRTABLE_PAGE_SIZE)
+        if options.get('maxRecords'):
+            records = records[:int(options['maxRecords'])]
+        page = {'records': records[offset:offset + page_size]}
+        if offset + page_size < len(records):
+            page['offset'] = str(offset + page_size)
+        self.send_body(200, page)
+
+    def airtable_create(self, table, body):
+        if 'records' in body:
+            if len(body['records']) > AIRTABLE_BATCH_SIZE:
+                self.send_body(422, {'error': {'type': 'INVALID_RECORDS'}})
+                return
+            created = [self.airtable_new_record(table, record['fields']) for record in body['records']]
+            self.send_body(200, {'records': created})
+        else:
+            self.send_body(200, self.airtable_new_record(table, body.get('fields', {})))
+
+    def airtable_new_record(self, table, fields):
+        record_id = self.server.new_record_id()
+        table[record_id] = {'id': record_id, 'createdTime': '2025-01-01T00:00:00.000Z', 'fields': dict(fields)}
+        return table[record_id]
+
+    def airtable_update(self, table, method, rest, body):
+        updates = [{'id': rest[0], 'fields': body.get('fields', {})}] if rest else body.get('records', [])
+        if len(updates) > AIRTABLE_BATCH_SIZE:
+            self.send_body(422, {'error': {'type': 'INVALID_RECORDS'}})
+            return
+        updated = []
+        for update in updates:
+            record = table.get(update['id'])
+            if record is None:
+                self.send_body(404, {'error': 'NOT_FOUND'})
+                return
+            if method == 'PUT':
+                record['fields'] = {}
+            record['fields'].update(update['fields'])
+            updated.append(record)
+        self.send_body(200, updated[0] if rest else {'records': updated})
+
+    # WordPress
+
+    def wordpress_posts(self, method, post_id, query):
+        server = self.server
+        time.sleep(server.wordpress_latency)
+        server.count_request('wordpress', 200)
+
+        if method == 'GET' and not post_id:
+            per_page = int(query.get('per_page', 10))
+            page = int(query.get('page', 1))
+            posts = sorted(server.posts.values(), key=lambda post: post['id'])
+            total_pages = max(1, -(-len(posts) // per_page))
+            self.send_body(200, posts[(page - 1) * per_page:page * per_page], headers={
+                'X-WP-Total': str(len(posts)), 'X-WP-TotalPages': str(total_pages),
+            })
+        elif method == 'GET':
+            post = server.posts.get(int(post_id))
+            self.send_body(200 if post else 404, post or {'code': 'rest_post_invalid_id'})
+        elif method == 'POST':
+            status, post = server.save_post(post_id, self.body)
+            self.send_body(status, post)
+        else:
+            self.send_body(405, {'code': 'rest_no_route'})
+
+    def wordpress_batch(self, method):
+        server = self.server
+        requests = self.body.get('requests') or []
+        if method != 'POST':
+            self.send_body(405, {'code': 'rest_no_route'})
+            return
+        if len(requests) > WORDPRESS_BATCH_SIZE:
+            server.count_request('wordpress', 400)
+            self.send_body(400, {'code': 'rest_invalid_param', 'message': 'requests must contain at most 25 items'})
+            return
+        time.sleep(server.wordpress_latency + server.wordpress_item_latency * len(requests))
+        server.count_request('wordpress', 207)
+
+        responses = []
+        for request in requests:
+            match = re.fullmatch(r'/wp/v2/posts(?:/(\d+))?', request.get('path', ''))
+            if request.get('method', 'POST') != 'POST' or not match:
+                responses.append({'status': 404, 'body': {'code': 'rest_no_route'}, 'headers': {}})
+                continue
+            status, post = server.save_post(match.group(1), request.get('body') or {})
+            responses.append({'status': status, 'body': post, 'headers': {}})
+        self.send_body(207, {'responses': responses})
+
+    # Fixture website
+
+    def site(self, name):
+        server = self.server
+        time.sleep(server.page_latency)
+        server.count_request('site', 200)
+
+        if name == 'sitemap.xml':
+            urls = [f"{server.url}/site/{self.sitemap_path(index)}" for index in range(1, server.site_pages + 1)]
+            urls.append(f"{server.url}/site/images/logo.png")
+            entries = ''.join(f"<url><loc>{url}</loc></url>" for url in urls)
+            self.send_body(200, '<?xml version="1.0" encoding="UTF-8"?>'
+                                '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                                f"{entries}</urlset>", content_type='application/xml')
+            return
+
+        if name.startswith('old-page-'):
+            self.send_body(301, '', content_type='text/html',
+                           headers={'Location': f"{server.url}/site/{name[len('old-'):]}"})
+            return
+        if name.startswith('private/'):
+            name = name[len('private/'):]
+        if not name.startswith('page-') or not name[len('page-'):].isdigit():
+            self.send_body(404, '<html><body>Not found</body></html>', content_type='text/html')
+            return
+
+        index = int(name[len('page-'):])
+        if index > server.site_pages:
+            self.send_body(404, '<html><body>Not found</body></html>', content_type='text/html')
+            return
+        robots = 'noindex, follow' if server.noindex_every and index % server.noindex_every == 0 else 'index, follow'
+        headers = {}
+        if server.header_noindex_every and index % server.header_noindex_every == 0:
+            headers['X-Robots-Tag'] = 'noindex'
+        page = (
+            '<!DOCTYPE html><html><head>'
+            f'<title>Page {index}</title>'
+            f'<meta name="robots" content="{robots}">'
+            f'<link rel="canonical" href="{server.url}/site/page-{index}">'
+            f'<link rel="alternate" hreflang="en" href="{server.url}/site/page-{index}">'
+            f'<link rel="alternate" hreflang="ko" href="{server.url}/ko/site/page-{index}">'
+            '</head><body>'
+            f'<h1>Page {index}</h1>' + f'<p>{ARTICLE_PARAGRAPH}</p>' * 5 +
+            '</body></html>'
+        )
+        self.send_body(200, page, content_type='text/html', headers=headers)
+
+    def sitemap_path(self, index):
+        server = self.server
+        if server.blocked_every and index % server.blocked_every == 0:
+            return f"private/page-{index}"
+        if server.redirect_every and index % server.redirect_every == 0:
+            return f"old-page-{index}"
+        return f"page-{index}"
@@ -0,0 +1,357 @@
+"""
+Script Name: Offline Benchmarks
+Description:
+    Runs the scripts against the local mock services of mock_services.py and reports their
+    throughput (records per second) and per record latency (p50 / p95), so performance changes
+    can be measured on a laptop without network access or API keys.
+
+    Benchmarked scripts:
+    - noindex_page_check: checks every page of the fixture sitemap (noindex), and audits them
+      with --audit, which also follows redirects and checks robots.txt (audit, --concurrency sets
+      its worker processes).
+    - english_blog_generation_based_on_source_content: generates an article for every INIT record.
+    - markdown_to_html_conversion: converts every READY_TO_PUBLISH record to HTML.
+    - wordpress_blog_publishing: publishes every READY_TO_PUBLISH record, one post per request
+      (wordpress) or through the batch endpoint with --bulk (wordpress_bulk).
+    - ai_translate_pdf: translates a generated PDF page by page (translate_pdf), and a directory
+      of PDFs of different sizes through the shared work queue (translate_dir).
+    - generate_faq_markup_based_on_keyword: generates a FAQ for every record with a key phrase,
+      in batches with --faq-batch-size (0 for one request per record).
+
+    The scripts run unchanged through their main functions. The environment points them at the
+    mock services (OPENAI_BASE_URL, AIRTABLE_ENDPOINT_URL, WORDPRESS_SITE_URL), and the per record
+    timings and call latencies come from the events the scripts record with metrics_helper.
+
+    Example:
+        python benchmarks/run_benchmarks.py --records 50 --openai-latency 0.5
+        python benchmarks/run_benchmarks.py --only noindex markdown --json results.json
+       © [2025] [Boes Marie]. All rights reserved.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from mock_services import ARTICLE_PARAGRAPH, MockServices, fake_completion  # noqa: E402
+
+BASE_ID = 'appBenchmark'
+TABLE_NAME = 'Content'
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def configure_environment(services):
+    """Point the scripts at the mock services. Has to run before the scripts are imported."""
+    os.environ.update({
+        'OPENAI_API_KEY': 'benchmark',
+        'OPENAI_BASE_URL': f"{services.url}/v1",
+        'AIRTABLE_API_KEY': 'benchmark',
+        'AIRTABLE_BASE_ID': BASE_ID,
+        'AIRTABLE_TABLE_NAME': TABLE_NAME,
+        'AIRTABLE_ENDPOINT_URL': services.url,
+        'WORDPRESS_SITE_URL': services.url,
+        'WORDPRESS_APP_USERNAME': 'benchmark',
+        'WORDPRESS_APP_PASSWORD': 'benchmark',
+    })
+
+
+# As long as the body lines, so only its place on the page tells it is a header
+FIXTURE_HEADER = "Graduate School of Business, Seoul National University, Master of Science Thesis"
+
+
+def write_fixture_pdf(path, pages):
+    """Write a PDF with a running header, a paragraph and a page number footer per page, readable by PyPDF2."""
+    objects = []
+    page_ids = [4 + 2 * index for index in range(pages)]
+    objects.append("<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(f"<< /Type /Pages /Kids [{' '.join(f'{page_id} 0 R' for page_id in page_ids)}] /Count {pages} >>")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for index in range(pages):
+        paragraph = f"Section {index + 1} of this thesis. {ARTICLE_PARAGRAPH}"
+        lines = ([FIXTURE_HEADER]
+                 + [paragraph[start:start + 80] for start in range(0, len(paragraph), 80)]
+                 + ["This thesis is protected by copyright of Seoul National University.",
+                    "Reproduction without permission of the author is not allowed.",
+                    f"- {index + 1} -"])
+        text = ' '.join(f"({line}) Tj T*" for line in lines)
+        stream = f"BT /F1 11 Tf 14 TL 72 720 Td {text} ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_ids[index] + 1} 0 R >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    output = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n".encode('latin-1')
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    output += ''.join(f"{offset:010d} 00000 n \n" for offset in offsets).encode('latin-1')
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode('latin-1')
+    with open(path, 'wb') as pdf_file:
+        pdf_file.write(output)
+
+
+def source_records(count):
+    return [{'state': 'INIT', 'source_content_url': f"https://blog.naver.com/benchmark/{index}",
+             'source_content_text': ARTICLE_PARAGRAPH * 8} for index in range(count)]
+
+
+def markdown_records(count):
+    return [{'state': 'READY_TO_PUBLISH', 'title': f"Article {index}",
+             'article_text': fake_completion(600)} for index in range(count)]
+
+
+def html_records(count):
+    import markdown_to_html_conversion
+    html = markdown_to_html_conversion.convert_markdown_to_html(fake_completion(600))
+    return [{'state': 'READY_TO_PUBLISH', 'title': f"Article {index}", 'html': html} for index in range(count)]
+
+
+def key_phrase_records(count):
+    # Every key phrase appears twice, written differently
+    return [{'key_phrase': f"Skin booster {index // 2} in Korea" if index % 2 else f"skin booster {index // 2} korea"}
+            for index in range(count)]
+
+
+def bench_noindex(services, args, workdir):
+    import noindex_page_check
+    services.site_pages = args.pages
+    noindex_page_check.main([f"{services.url}/site/sitemap.xml"])
+
+
+def bench_audit(services, args, workdir):
+    import noindex_page_check
+    services.site_pages = args.pages
+    workers = ['--workers', str(args.concurrency)] if args.concurrency else []
+    noindex_page_check.main([f"{services.url}/site/sitemap.xml", '--audit',
+                             '--output', os.path.join(workdir, 'audit_records.jsonl')] + workers)
+
+
+def bench_english(services, args, workdir):
+    import english_blog_generation_based_on_source_content as article_generation
+    services.seed_table(BASE_ID, TABLE_NAME, source_records(args.records))
+    article_generation.main(concurrency_args(args))
+
+
+def bench_markdown(services, args, workdir):
+    import markdown_to_html_conversion
+    services.seed_table(BASE_ID, TABLE_NAME, markdown_records(args.records))
+    markdown_to_html_conversion.main([])
+
+
+def bench_wordpress(services, args, workdir):
+    import wordpress_blog_publishing
+    services.seed_table(BASE_ID, TABLE_NAME, html_records(args.records))
+    wordpress_blog_publishing.main([])
+
+
+def bench_wordpress_bulk(services, args, workdir):
+    import wordpress_blog_publishing
+    services.seed_table(BASE_ID, TABLE_NAME, html_records(args.records))
+    wordpress_blog_publishing.main(['--bulk'])
+    # Batches are not timed per record, so count the published records
+    return sum(1 for record in services.table(BASE_ID, TABLE_NAME).values() if record['fields'].get('wp_id'))
+
+
+def concurrency_args(args):
+    return ['--concurrency', str(args.concurrency)] if args.concurrency else []
+
+
+def memory_args(args, workdir, name):
+    if args.no_translation_memory:
+        return ['--no-memory']
+    # A fresh translation memory for every benchmark
+    return ['--memory', os.path.join(workdir, f"{name}_memory.sqlite")]
+
+
+def bench_translate_pdf(services, args, workdir):
+    import ai_translate_pdf
+    pdf_path = os.path.join(workdir, 'fixture.pdf')
+    write_fixture_pdf(pdf_path, args.pdf_pages)
+    ai_translate_pdf.main([pdf_path, os.path.join(workdir, 'fixture.docx')] + concurrency_args(args)
+                          + memory_args(args, workdir, 'translate_pdf'))
+    if not args.no_translation_memory:
+        check_header_segment(os.path.join(workdir, 'translate_pdf_memory.sqlite'))
+
+
+def check_header_segment(memory_path):
+    """The running header has to be one segment of the memory, or it is translated on every page."""
+    import sqlite3
+    with contextlib.closing(sqlite3.connect(memory_path)) as connection:
+        found = connection.execute("SELECT COUNT(*) FROM translation_memory WHERE source = ?",
+                                   (FIXTURE_HEADER,)).fetchone()[0]
+    if not found:
+        raise AssertionError(f"The running header is not a segment of its own: {FIXTURE_HEADER!r}")
+
+
+def bench_translate_dir(services, args, workdir):
+    import ai_translate_pdf
+    input_directory = os.path.join(workdir, 'papers')
+    os.makedirs(input_directory, exist_ok=True)
+    # One big paper and a few small ones
+    write_fixture_pdf(os.path.join(input_directory, 'thesis.pdf'), args.pdf_pages)
+    for index in range(4):
+        write_fixture_pdf(os.path.join(input_directory, f"paper-{index}.pdf"), max(1, args.pdf_pages // 8))
+    ai_translate_pdf.main([input_directory, os.path.join(workdir, 'translated')] + concurrency_args(args)
+                          + memory_args(args, workdir, 'translate_dir'))
+
+
+def bench_faq(services, args, workdir):
+    import generate_faq_markup_based_on_keyword
+    services.seed_table(BASE_ID, TABLE_NAME, key_phrase_records(args.records))
+    batch_args = ['--batch-size', str(args.faq_batch_size)] if args.faq_batch_size else []
+    generate_faq_markup_based_on_keyword.main(batch_args + ['--cache', os.path.join(workdir, 'faq_cache.sqlite')])
+    # Batches are not timed per record, so count the records that got a FAQ
+    return sum(1 for record in services.table(BASE_ID, TABLE_NAME).values() if record['fields'].get('faq'))
+
+
+BENCHMARKS = {
+    'noindex': bench_noindex,
+    'audit': bench_audit,
+    'english': bench_english,
+    'markdown': bench_markdown,
+    'wordpress': bench_wordpress,
+    'wordpress_bulk': bench_wordpress_bulk,
+    'translate_pdf': bench_translate_pdf,
+    'translate_dir': bench_translate_dir,
+    'faq': bench_faq,
+}
+
+
+def read_events(metrics_file):
+    if not os.path.exists(metrics_file):
+        return []
+    with open(metrics_file, encoding='utf-8') as events_file:
+        return [json.loads(line) for line in events_file if line.strip()]
+
+
+def summarize(name, events, elapsed, request_counts, records=None):
+    record_events = [event for event in events if event.get('kind') == 'record']
+    durations = [event['duration'] for event in record_events]
+    if records is None:
+        records = sum(1 for event in record_events if event['ok'])
+
+    calls = defaultdict(list)
+    for event in events:
+        if event.get('type') == 'call' and event.get('kind') not in ('record', 'stage'):
+            calls[event['endpoint']].append(event['duration'])
+    usage = [event for event in events if event.get('type') == 'llm_usage']
+
+    return {
+        'benchmark': name,
+        'records': records,
+        'failed': sum(1 for event in record_events if not event['ok']),
+        'seconds': round(elapsed, 3),
+        'records_per_second': round(records / elapsed, 3) if elapsed else None,
+        'p50_latency': percentile(durations, 0.5),
+        'p95_latency': percentile(durations, 0.95),
+        'calls': {
+            endpoint: {'count': len(values), 'p95_latency': percentile(values, 0.95)}
+            for endpoint, values in sorted(calls.items())
+        },
+        'mock_requests': dict(sorted(request_counts.items())),
+        'llm_requests': len(usage),
+        'tokens_in': sum(event['tokens_in'] or 0 for event in usage),
+        'tokens_out': sum(event['tokens_out'] or 0 for event in usage),
+    }
+
+
+def run_benchmark(name, services, args, workdir):
+    import metrics_helper
+
+    metrics_file = os.path.join(workdir, f"{name}.jsonl")
+    metrics_helper.METRICS_FILE = metrics_file
+    services.reset_counts()
+
+    output = sys.stdout if args.verbose else io.StringIO()
+    start = time.monotonic()
+    with contextlib.redirect_stdout(output):
+        records = BENCHMARKS[name](services, args, workdir)
+    elapsed = time.monotonic() - start
+
+    metrics_helper.METRICS_FILE = None
+    return summarize(name, read_events(metrics_file), elapsed, services.request_counts, records)
+
+
+def format_seconds(value):
+    return f"{value:.3f}" if value is not None else '-'
+
+
+def print_results(results):
+    print(f"{'benchmark':<15}{'records':>9}{'failed':>8}{'seconds':>10}{'rec/s':>9}{'p50 s':>9}{'p95 s':>9}")
+    for result in results:
+        print(f"{result['benchmark']:<15}{result['records']:>9}{result['failed']:>8}{result['seconds']:>10.2f}"
+              f"{result['records_per_second'] or 0:>9.2f}{format_seconds(result['p50_latency']):>9}"
+              f"{format_seconds(result['p95_latency']):>9}")
+        for endpoint, stats in result['calls'].items():
+            print(f"    {endpoint:<22} {stats['count']:>6} calls, p95 {format_seconds(stats['p95_latency'])}s")
+        if result['llm_requests']:
+            print(f"    {result['llm_requests']} LLM requests, {result['tokens_in']} tokens in, "
+                  f"{result['tokens_out']} tokens out")
+        throttled = result['mock_requests'].get('airtable 429')
+        if throttled:
+            print(f"    airtable rate limited {throttled} requests (429)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scripts offline against local mock services.")
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help="Benchmarks to run, default all")
+    parser.add_argument('--records', type=int, default=50, help="Airtable records per benchmark")
+    parser.add_argument('--pages', type=int, default=200, help="Pages in the fixture sitemap")
+    parser.add_argument('--pdf-pages', type=int, default=20, help="Pages in the fixture PDF")
+    parser.add_argument('--concurrency', type=int,
+                        help="Workers for the scripts that have a --concurrency option, default their own default")
+    parser.add_argument('--no-translation-memory', action='store_true',
+                        help="Translate whole PDF pages without the translation memory")
+    parser.add_argument('--faq-batch-size', type=int, default=10, help="Key phrases per FAQ request, 0 for one per record")
+    parser.add_argument('--openai-latency', type=float, default=0.5, help="Seconds per chat completion")
+    parser.add_argument('--completion-words', type=int, default=400, help="Length of the mock completions")
+    parser.add_argument('--airtable-rate', type=float, default=5, help="Airtable requests per second per base")
+    parser.add_argument('--airtable-latency', type=float, default=0.02)
+    parser.add_argument('--wordpress-latency', type=float, default=0.1)
+    parser.add_argument('--page-latency', type=float, default=0.02)
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    parser.add_argument('--verbose', action='store_true', help="Show the output of the scripts")
+    args = parser.parse_args(argv)
+
+    services = MockServices(
+        openai_latency=args.openai_latency,
+        completion_words=args.completion_words,
+        airtable_rate=args.airtable_rate,
+        airtable_latency=args.airtable_latency,
+        wordpress_latency=args.wordpress_latency,
+        page_latency=args.page_latency,
+        site_pages=args.pages,
+    )
+    results = []
+    with services, tempfile.TemporaryDirectory() as workdir:
+        configure_environment(services)
+        for name in args.only or list(BENCHMARKS):
+            print(f"Running {name}...", flush=True)
+            results.append(run_benchmark(name, services, args, workdir))
+
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as json_file:
+            json.dump(results, json_file, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Script Name: SEO Automations CLI
+Description:
+    Single entry point for the scripts in this repository, e.g. `python cli.py noindex-check`.
+    Every subcommand maps to one script module, which is only imported once that subcommand
+    runs. A cron job therefore only loads the dependencies of the task it runs (no pandas or
+    Gemini SDK for a noindex check) and nothing touches the network at import time.
+    Options after the subcommand are passed to the script, see `python cli.py <command> --help`.
+       © [2025] [Boes Marie]. All rights reserved.
+"""
+
+import argparse
+import importlib
+import os
+import sys
+
+COMMANDS = {
+    'scrape-source': ('scrape_source_blog_content', "Fetch new Naver blog articles and their content into Airtable"),
+    'generate-articles': ('english_blog_generation_based_on_source_content', "Generate English articles from source content"),
+    'markdown-to-html': ('markdown_to_html_conversion', "Convert ready to publish Markdown articles to HTML"),
+    'publish-wordpress': ('wordpress_blog_publishing', "Publish ready articles to WordPress"),
+    'run-pipeline': ('content_pipeline', "Run scrape, generate, convert and publish as one pipeline"),
+    'publish-medium': ('medium_blog_publishing', "Publish ready articles to Medium"),
+    'post-instagram': ('instagram_posting', "Post today's scheduled records to Instagram"),
+    'generate-faq': ('generate_faq_markup_based_on_keyword', "Generate FAQ schema markup for key phrases"),
+    'company-descriptions': ('text_description_based_on_website_text', "Generate company introductions from website text"),
+    'keyword-difficulty': ('seo_keysearch_difficulty_checker', "Check keyword difficulty with the Keysearch API"),
+    'noindex-check': ('noindex_page_check', "Check or audit the indexability of sitemap pages"),
+    'convert-urls': ('convert_urls_to_list', "Join a slug list, or diff it against the live sitemap or WordPress posts"),
+    'translate-pdf': ('ai_translate_pdf', "Translate a PDF into an English Word document"),
+    'recognize-music': ('music_recognition', "Recognize, tag and rename MP3 files"),
+}
+
+
+def build_parser():
+    commands = '\n'.join(f"  {name:<22}{help_text}" for name, (_, help_text) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        prog='cli.py',
+        description="Run one of the SEO automation scripts.",
+        epilog=f"commands:\n{commands}",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('command', choices=COMMANDS, metavar='command', help="Script to run, see the list below")
+    # Everything after the command, including --help, is handled by the script itself
+    parser.add_argument('script_args', nargs=argparse.REMAINDER, metavar='...', help="Options passed to the script")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    module_name, _ = COMMANDS[args.command]
+    # Metrics of the run are labelled with the script, not with cli.py
+    os.environ.setdefault('METRICS_SCRIPT', module_name)
+    module = importlib.import_module(module_name)
+    sys.argv[0] = f"cli.py {args.command}"
+    return module.main(args.script_args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
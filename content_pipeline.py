@@ -0,0 +1,291 @@
+"""
+Script Name: Content Pipeline Orchestrator
+Description:
+    This script runs the Naver blog scraping, English article generation, Markdown to HTML
+    conversion and WordPress publishing scripts as the stages of one streaming pipeline,
+    instead of four cron jobs that each query the same Airtable table and leave records waiting
+    for the next cron tick.
+
+    1. Airtable is read once for the records that still have work to do (plus a light read of
+       the known source URLs to detect new Naver articles), and every record is routed to the
+       stage it is waiting for.
+    2. Each stage runs its own pool of worker threads and hands finished records to the next
+       stage in memory.
+    3. State transitions (INIT -> REVIEW_REQUIRED -> READY_TO_PUBLISH -> PUBLISHED) and the
+       generated content are written back with batched Airtable updates.
+
+    Generated articles stop at REVIEW_REQUIRED for a human review, as before. With
+    --auto-approve they move straight on to READY_TO_PUBLISH and through the remaining stages.
+       © [2025] [Boes Marie]. All rights reserved.
+"""
+
+import argparse
+import os
+import queue
+import threading
+from datetime import datetime
+
+from dotenv import load_dotenv, find_dotenv
+
+import scrape_source_blog_content
+import english_blog_generation_based_on_source_content as article_generation
+import metrics_helper
+import markdown_to_html_conversion
+import wordpress_blog_publishing
+from airtable_helper import AirtableBatchWriter, airtable_table
+
+# Load environment variables from .env file
+load_dotenv(find_dotenv())
+
+AIRTABLE_API_KEY = os.getenv('AIRTABLE_API_KEY')
+BASE_ID = os.getenv('AIRTABLE_BASE_ID')
+TABLE_NAME = os.getenv('AIRTABLE_TABLE_NAME')
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+
+# Records that still have work to do in one of the stages
+ACTIVE_RECORDS_FORMULA = (
+    "OR("
+    "AND(NOT({source_content_url} = ''), {source_content_text} = BLANK()), "
+    "{state} = 'INIT', "
+    "{state} = 'READY_TO_PUBLISH'"
+    ")"
+)
+
+_DONE = object()
+
+
+class Stage:
+    """A pipeline stage: a queue of records worked on by its own pool of threads."""
+
+    def __init__(self, name, handler, workers):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = queue.Queue()
+        self.downstream = None
+        self.processed = 0
+        self.failed = 0
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def put(self, record):
+        self.queue.put(record)
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def close(self):
+        """Signal that no more records will be put on this stage."""
+        for _ in self._threads:
+            self.queue.put(_DONE)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            record = self.queue.get()
+            if record is _DONE:
+                return
+            try:
+                with metrics_helper.timed('stage', self.name):
+                    result = self.handler(record)
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                print(f"[{self.name}] Error processing record {record.get('id') or record['fields']}: {e}")
+                continue
+            with self._lock:
+                self.processed += 1
+            if result is not None and self.downstream is not None:
+                self.downstream.put(result)
+
+
+class ContentPipeline:
+    def __init__(self, table, writer, auto_approve=False):
+        self.table = table
+        self.writer = writer
+        self.auto_approve = auto_approve
+        # New Naver articles that are not stored yet, the crawl state is saved once it is empty
+        self.crawl_state = None
+        self.unstored_urls = set()
+        self._lock = threading.Lock()
+
+    def scrape(self, record):
+        fields = record['fields']
+        source_content_url = fields['source_content_url']
+        print(f"[scrape] Processing URL: {source_content_url}")
+        scraped_text = scrape_source_blog_content.fetch_article_text(source_content_url)
+
+        if record.get('id'):
+            self.writer.update(record['id'], {'source_content_text': scraped_text})
+            fields['source_content_text'] = scraped_text
+        else:
+            # New article, the record id is needed by the next stages so wait for the batch
+            record = self.writer.create({
+                'source_content_url': source_content_url,
+                'source_content_text': scraped_text,
+            }).result()
+            with self._lock:
+                self.unstored_urls.discard(source_content_url)
+            print(f"[scrape] Stored new article URL: {source_content_url}")
+
+        if record['fields'].get('state', 'INIT') == 'INIT':
+            return record
+        return None
+
+    def generate(self, record):
+        source_content = record['fields'].get('source_content_text', "")
+        if not source_content:
+            return None
+
+        generated_text = article_generation.generate_text(OPENAI_API_KEY, article_generation.GPT_PROMPT, source_content)
+        complete_text = generated_text + article_generation.DISCLAIMER
+        state = 'READY_TO_PUBLISH' if self.auto_approve else 'REVIEW_REQUIRED'
+
+        self.writer.update(record['id'], {'article_text': complete_text, 'state': state})
+        record['fields'].update({'article_text': complete_text, 'state': state})
+        print(f"[generate] Generated article for record {record['id']}, state is now {state}.")
+        return record if self.auto_approve else None
+
+    def convert(self, record):
+        fields = record['fields']
+        if not fields.get('html'):
+            article_text = fields.get('article_text')
+            if not article_text:
+                return None
+            html_content = markdown_to_html_conversion.convert_markdown_to_html(article_text)
+            self.writer.update(record['id'], {'html': html_content})
+            fields['html'] = html_content
+            print(f"[convert] Converted record {record['id']} from Markdown to HTML.")
+        return record
+
+    def publish(self, record):
+        fields = record['fields']
+        title = fields.get('title')
+        article_html = fields.get('html')
+        schedule_date_str = fields.get('schedule_date')
+        schedule_date = datetime.fromisoformat(schedule_date_str) if schedule_date_str else None
+        image_id = wordpress_blog_publishing.get_random_image_name()
+
+        if not (image_id and title and article_html):
+            print(f"[publish] Failed to process article '{title}' due to missing data.")
+            return None
+
+        wp_post_id = wordpress_blog_publishing.publish_to_wordpress(title, article_html, image_id, schedule_date)
+        if wp_post_id:
+            update = self.writer.update(record['id'], {
+                'state': 'PUBLISHED',
+                'wp_id': str(wp_post_id),
+                # Baseline of wordpress_blog_publishing.py --sync, like its own publish path stores
+                'wp_content_hash': wordpress_blog_publishing.content_hash(title, article_html),
+            })
+            # The post exists already, without this update the next run would publish it again
+            update.add_done_callback(lambda future: future.exception() and print(
+                f"[publish] Record {record['id']} is still READY_TO_PUBLISH but was published as post {wp_post_id}."))
+            print(f"[publish] Article '{title}' published on WordPress successfully.")
+        return None
+
+    def save_crawl_state(self):
+        """Save the crawl state of the discovery, unless a new article could not be stored."""
+        if self.crawl_state is None:
+            return
+        if self.unstored_urls:
+            print(f"Crawl state not saved, {len(self.unstored_urls)} new articles were not stored.")
+            return
+        scrape_source_blog_content.save_crawl_state(self.crawl_state)
+
+    def seed(self, scrape, generate, convert, discover=True):
+        """Read Airtable once and route every record to the stage it is waiting for."""
+        if discover:
+            known_urls = {
+                record['fields'].get('source_content_url')
+                for record in self.table.all(fields=['source_content_url'])
+            }
+            latest_articles, self.crawl_state = scrape_source_blog_content.fetch_latest_articles()
+            for article_url in latest_articles:
+                if article_url not in known_urls:
+                    known_urls.add(article_url)
+                    with self._lock:
+                        self.unstored_urls.add(article_url)
+                    scrape.put({'id': None, 'fields': {'source_content_url': article_url}})
+
+        records = self.table.all(formula=ACTIVE_RECORDS_FORMULA)
+        print(f"Found {len(records)} records with pending work.")
+        for record in records:
+            fields = record['fields']
+            state = fields.get('state')
+            if fields.get('source_content_url') and not fields.get('source_content_text'):
+                scrape.put(record)
+            elif state == 'INIT':
+                generate.put(record)
+            elif state == 'READY_TO_PUBLISH':
+                convert.put(record)
+
+
+def run_pipeline(scrape_workers=4, generate_workers=4, convert_workers=2, publish_workers=2,
+                 auto_approve=False, discover=True):
+    table = airtable_table(AIRTABLE_API_KEY, BASE_ID, TABLE_NAME)
+
+    with AirtableBatchWriter(table) as writer:
+        pipeline = ContentPipeline(table, writer, auto_approve=auto_approve)
+        stages = [
+            Stage('scrape', pipeline.scrape, scrape_workers),
+            Stage('generate', pipeline.generate, generate_workers),
+            Stage('convert', pipeline.convert, convert_workers),
+            Stage('publish', pipeline.publish, publish_workers),
+        ]
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.downstream = next_stage
+        for stage in stages:
+            stage.start()
+
+        scrape, generate, convert, _ = stages
+        try:
+            pipeline.seed(scrape, generate, convert, discover=discover)
+        finally:
+            # A stage is finished once its upstream stage is finished and its queue is drained
+            for stage in stages:
+                stage.close()
+                stage.join()
+    # The batch writer is closed here, so every create has been written or has failed
+    pipeline.save_crawl_state()
+
+    for stage in stages:
+        print(f"Stage {stage.name}: {stage.processed} processed, {stage.failed} failed.")
+    if writer.failed_updates:
+        print(f"{len(writer.failed_updates)} Airtable records could not be updated: "
+              f"{', '.join(sorted(writer.failed_updates))}")
+    return writer.failed_updates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run scraping, generation, conversion and publishing as one pipeline.")
+    parser.add_argument('--scrape-workers', type=int, default=4)
+    parser.add_argument('--generate-workers', type=int, default=4)
+    parser.add_argument('--convert-workers', type=int, default=2)
+    parser.add_argument('--publish-workers', type=int, default=2)
+    parser.add_argument('--auto-approve', action='store_true',
+                        help="Skip the human review and publish generated articles in the same run")
+    parser.add_argument('--no-discovery', action='store_true',
+                        help="Do not check the Naver blog for new articles")
+    args = parser.parse_args(argv)
+
+    failed_updates = run_pipeline(
+        scrape_workers=args.scrape_workers,
+        generate_workers=args.generate_workers,
+        convert_workers=args.convert_workers,
+        publish_workers=args.publish_workers,
+        auto_approve=args.auto_approve,
+        discover=not args.no_discovery,
+    )
+    if failed_updates:
+        return 1
+
+
+if __name__ == '__main__':
+    main()
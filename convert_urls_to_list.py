@@ -1,3 +1,37 @@
+"""
+Script Name: Slug Inventory
+Description:
+    Without arguments this script joins the newline separated list of slugs below into a comma
+    separated string, as it always did. Given slug lists (--slugs, files or - for stdin, one slug
+    or URL per line or comma separated) the same is done for them.
+
+    Given the live site as well (--sitemap with one or more sitemaps or sitemap indexes, and/or
+    --wordpress with the site URL for its posts index), it compares the expected slugs with the
+    live pages and reports:
+    - missing: expected slugs without a live page,
+    - orphans: live pages that are not in the expected list,
+    - duplicates: slugs listed more than once, and slugs used by more than one live URL.
+
+    Slug lists and sitemaps are streamed, the comparison uses hash lookups in first seen order
+    (no sorting), so hundreds of thousands of slugs are handled in linear time. With --output-dir
+    the results are written to missing.txt, orphans.txt and duplicates.txt.
+       © [2025] [Boes Marie]. All rights reserved.
+"""
+
+import argparse
+import gzip
+import os
+import sys
+from urllib.parse import unquote, urlparse
+
+from lxml import etree
+
+import resilience_helper
+
+SITEMAP_NAMESPACE = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+WORDPRESS_PAGE_SIZE = 100
+
+
 def transform_input(input_string):
     elements = input_string.split('\n')
     transformed_string = ','.join(elements)
@@ -137,5 +171,185 @@ alar-reduction-korea
 transgender-friendly-clinics-korea
 uterine-fibroids-treatment-korea"""
 
-output_data = transform_input(input_data)
-print(output_data)
+
+def slug_from_url(url):
+    """The last path segment of a URL, or the value itself when it is a slug already."""
+    value = url.strip()
+    if '/' in value:
+        path = urlparse(value).path if '://' in value else value
+        segments = [segment for segment in path.split('/') if segment]
+        value = segments[-1] if segments else ''
+    return unquote(value).strip().lower()
+
+
+def iter_slug_lines(paths):
+    """Stream slugs from files (- for stdin), one per line or comma separated."""
+    for path in paths:
+        slug_file = sys.stdin if path == '-' else open(path, encoding='utf-8-sig')
+        try:
+            for line in slug_file:
+                for value in line.split(','):
+                    slug = slug_from_url(value)
+                    if slug:
+                        yield slug
+        finally:
+            if slug_file is not sys.stdin:
+                slug_file.close()
+
+
+def iter_sitemap_urls(sitemap_url, visited=None):
+    """Stream the page URLs of a sitemap, following sitemap indexes, without loading it whole."""
+    visited = visited if visited is not None else set()
+    if sitemap_url in visited:
+        return
+    visited.add(sitemap_url)
+
+    response = resilience_helper.request('GET', sitemap_url, stream=True, timeout=60)
+    try:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        source = response.raw
+        if urlparse(sitemap_url).path.endswith('.gz'):
+            source = gzip.GzipFile(fileobj=response.raw)
+
+        child_sitemaps = []
+        tags = (f'{SITEMAP_NAMESPACE}url', f'{SITEMAP_NAMESPACE}sitemap', 'url', 'sitemap')
+        for _, element in etree.iterparse(source, events=('end',), tag=tags):
+            location = (element.findtext(f'{SITEMAP_NAMESPACE}loc') or element.findtext('loc') or '').strip()
+            is_child_sitemap = etree.QName(element).localname == 'sitemap'
+            # Drop the entries parsed so far, so memory stays flat for big sitemaps
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+            if not location:
+                continue
+            if is_child_sitemap:
+                child_sitemaps.append(location)
+            else:
+                yield location
+    finally:
+        response.close()
+
+    for child_sitemap in child_sitemaps:
+        print(f"Reading sitemap {child_sitemap}", file=sys.stderr)
+        yield from iter_sitemap_urls(child_sitemap, visited)
+
+
+def iter_wordpress_slugs(site_url, post_types=('posts', 'pages')):
+    """Stream (slug, link) of every published post and page from the WordPress REST API."""
+    for post_type in post_types:
+        page = 1
+        total_pages = 1
+        while page <= total_pages:
+            response = resilience_helper.request(
+                'GET',
+                f"{site_url.rstrip('/')}/wp-json/wp/v2/{post_type}",
+                endpoint='wordpress',
+                params={'per_page': WORDPRESS_PAGE_SIZE, 'page': page, '_fields': 'slug,link'},
+                timeout=60,
+            )
+            response.raise_for_status()
+            total_pages = int(response.headers.get('X-WP-TotalPages', 1))
+            for post in response.json():
+                # REST slugs are percent-encoded (Korean titles), compare them like the expected slugs
+                yield slug_from_url(post.get('slug') or post.get('link', '')), post.get('link', '')
+            page += 1
+
+
+def count_slugs(slugs):
+    """Return the slugs in first seen order (a dict used as an ordered set) and {slug: count} of the duplicates."""
+    seen = {}
+    duplicates = {}
+    for slug in slugs:
+        if slug in seen:
+            duplicates[slug] = duplicates.get(slug, 1) + 1
+        else:
+            seen[slug] = None
+    return seen, duplicates
+
+
+def count_live_slugs(pairs):
+    """
+    Like count_slugs for (slug, url) pairs of the live site: a slug is only a duplicate when it
+    has more than one distinct URL, so a page listed by both the sitemap and WordPress counts once.
+    """
+    urls_by_slug = {}
+    for slug, url in pairs:
+        # The sitemap and the REST API can differ in scheme, encoding and trailing slash
+        urls = urls_by_slug.setdefault(slug, set())
+        if url:
+            parsed = urlparse(url)
+            urls.add(unquote(parsed.netloc + parsed.path).rstrip('/').lower())
+    duplicates = {slug: len(urls) for slug, urls in urls_by_slug.items() if len(urls) > 1}
+    return dict.fromkeys(urls_by_slug), duplicates
+
+
+def live_slugs(sitemap_urls=(), wordpress_url=None):
+    """Stream (slug, url) of the live site from its sitemaps and/or WordPress posts index."""
+    for sitemap_url in sitemap_urls:
+        for url in iter_sitemap_urls(sitemap_url):
+            slug = slug_from_url(url)
+            if slug:
+                yield slug, url
+    if wordpress_url:
+        for slug, url in iter_wordpress_slugs(wordpress_url):
+            if slug:
+                yield slug, url
+
+
+def diff_slugs(expected_slugs, live):
+    """Compare the expected slugs with the (slug, url) pairs of the live site, both iterables, in linear time."""
+    expected, duplicate_expected = count_slugs(expected_slugs)
+    live, duplicate_live = count_live_slugs(live)
+    return {
+        'missing': [slug for slug in expected if slug not in live],
+        'orphans': [slug for slug in live if slug not in expected],
+        'duplicates': [f"{slug}\tlisted {count} times" for slug, count in duplicate_expected.items()]
+                      + [f"{slug}\t{count} live URLs" for slug, count in duplicate_live.items()],
+        'expected': len(expected),
+        'live': len(live),
+    }
+
+
+def write_results(results, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    for name in ('missing', 'orphans', 'duplicates'):
+        with open(os.path.join(output_dir, f"{name}.txt"), 'w', encoding='utf-8') as result_file:
+            result_file.writelines(f"{line}\n" for line in results[name])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Join a slug list into a comma separated string, "
+                                                 "or compare it with the slugs of the live site.")
+    parser.add_argument('--slugs', nargs='+', metavar='FILE',
+                        help="Files with the expected slugs or URLs, - for stdin (default: the built-in list)")
+    parser.add_argument('--sitemap', nargs='+', default=[], metavar='URL', help="Sitemaps or sitemap indexes of the live site")
+    parser.add_argument('--wordpress', metavar='SITE_URL', help="WordPress site whose posts and pages are the live slugs")
+    parser.add_argument('--output-dir', help="Write missing.txt, orphans.txt and duplicates.txt to this directory")
+    args = parser.parse_args(argv)
+
+    expected_slugs = iter_slug_lines(args.slugs) if args.slugs else (
+        slug for slug in (slug_from_url(line) for line in input_data.split('\n')) if slug
+    )
+
+    if not args.sitemap and not args.wordpress:
+        if args.slugs:
+            print(','.join(expected_slugs))
+        else:
+            print(transform_input(input_data))
+        return
+
+    results = diff_slugs(expected_slugs, live_slugs(args.sitemap, args.wordpress))
+    print(f"{results['expected']} expected slugs, {results['live']} live slugs: "
+          f"{len(results['missing'])} missing, {len(results['orphans'])} orphans, "
+          f"{len(results['duplicates'])} duplicates.")
+    if args.output_dir:
+        write_results(results, args.output_dir)
+        print(f"Results written to {args.output_dir}")
+    else:
+        for name in ('missing', 'orphans', 'duplicates'):
+            print(f"{name}: {','.join(results[name])}")
+
+
+if __name__ == "__main__":
+    main()
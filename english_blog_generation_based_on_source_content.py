@@ -5,79 +5,154 @@ Description:
     For each record, it uses OpenAI's GPT model to generate an article from the source content
     provided in the record. The generated text is then appended with a disclaimer and updated
     back into the Airtable record, changing the state to "REVIEW_REQUIRED".
+
+    Records are processed by a pool of --concurrency worker threads sharing one OpenAI client,
+    optionally limited to --rate requests per second. Finished articles are written back to
+    Airtable in batches while the others are still being generated, and a record that fails is
+    left INIT for the next run without stopping the others.
        © [2025] [Boes Marie]. All rights reserved.
 """
 
+import argparse
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv, find_dotenv
-from pyairtable import Api
 from openai import OpenAI
 
+import metrics_helper
+from airtable_helper import AIRTABLE_MIRROR_PATH, AirtableBatchWriter, AirtableMirror, airtable_table
+from rate_limit_helper import RateLimiter
+from resilience_helper import retrying
+
 # Load environment variables from .env file
 load_dotenv(find_dotenv())
 
+GPT_PROMPT = (
+    "This is source info, create a new article in English based on this. "
+    "The article needs to have a couple of H2 headings. Output should be in markdown."
+)
+
+# Disclaimer text to be appended
+DISCLAIMER = (
+    "\n\n*Disclaimer : This content is a translation of material originally published in"
+    " Korean by the National Tax Service of the Republic of Korea. While efforts have been"
+    " made to ensure accuracy, this translation is provided for informational purposes only"
+    " and does not carry legal weight. In the event of any discrepancy, the original Korean"
+    " version shall prevail. Users should consult the official Korean documents for precise"
+    " interpretation. This translation does not constitute legal advice. The translators and"
+    " publishers shall not be held liable for any loss arising from reliance on this translation.*"
+)
+
+DEFAULT_CONCURRENCY = 4
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(api_key):
+    # One client per key, shared by all threads so they reuse its connection pool. The lock keeps
+    # threads that ask for it at the same time from each building their own client.
+    with _clients_lock:
+        if api_key not in _clients:
+            # Retries are handled by resilience_helper
+            _clients[api_key] = OpenAI(api_key=api_key, max_retries=0)
+        return _clients[api_key]
+
 # Function to generate text using OpenAI
 def generate_text(api_key, prompt, text):
-    client = OpenAI(api_key=api_key)
+    client = get_client(api_key)
     message = [{"role": "assistant", "content": prompt}, {"role": "user", "content": text}]
     temperature = 1
     max_tokens = 2200
     frequency_penalty = 0.0
     print("Calling GPT for topic: " + (text[:50] + '..' if len(text) > 52 else text))
-    response = client.chat.completions.create(
+    response = retrying('openai', client.chat.completions.create)(
         model="gpt-4",
         messages=message,
         temperature=temperature,
         max_tokens=max_tokens,
         frequency_penalty=frequency_penalty
     )
+    metrics_helper.record_llm_usage('openai', "gpt-4", response)
     return response.choices[0].message.content
 
-def main():
+def generate_article(record, writer, api_key, limiter=None):
+    source_content = record['fields'].get('source_content_text', "")
+    if not source_content:
+        return False
+
+    if limiter:
+        limiter.acquire()
+    with metrics_helper.timed('record', 'generate_article'):
+        generated_text = generate_text(api_key, GPT_PROMPT, source_content)
+
+        # Merge generated text with the disclaimer
+        complete_text = generated_text + DISCLAIMER
+
+        record_id = record['id']
+        writer.update(record_id, {
+            "article_text": complete_text,
+            "state": "REVIEW_REQUIRED"
+        })
+    print(f"Queued record ID {record_id} with generated text, disclaimer, and state REVIEW_REQUIRED.")
+    return True
+
+
+def generate_articles(table, records, api_key, concurrency=DEFAULT_CONCURRENCY, requests_per_second=None):
+    """
+    Generate the articles of the records in a pool of threads. Returns the number generated and
+    the ids of the records whose generated article could not be written to Airtable.
+    """
+    limiter = RateLimiter(requests_per_second) if requests_per_second else None
+    generated = 0
+    with AirtableBatchWriter(table) as writer:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {executor.submit(generate_article, record, writer, api_key, limiter): record
+                       for record in records}
+            for future in as_completed(futures):
+                # A failing record stays INIT for the next run and does not stop the others
+                try:
+                    generated += future.result()
+                except Exception as e:
+                    print(f"Error generating article for record {futures[future]['id']}: {e}")
+    failed = sorted(writer.failed_updates)
+    return generated - len(failed), failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate English articles for INIT records from their source content.")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help="Articles generated in parallel")
+    parser.add_argument('--rate', type=float, help="Maximum OpenAI requests per second")
+    parser.add_argument('--mirror', nargs='?', const=AIRTABLE_MIRROR_PATH,
+                        help="Select the records from a local SQLite mirror of the table, synced incrementally "
+                             "(default path: %(const)s)")
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency has to be at least 1")
+
     # Load Airtable and OpenAI credentials from environment variables
     airtable_api_key = os.getenv("AIRTABLE_API_KEY")
     airtable_base_id = os.getenv("AIRTABLE_BASE_ID")
     airtable_table_name = os.getenv("AIRTABLE_TABLE_NAME")
     openai_api_key = os.getenv("OPENAI_API_KEY")
 
-    gpt_prompt = (
-        "This is source info, create a new article in English based on this. "
-        "The article needs to have a couple of H2 headings. Output should be in markdown."
-    )
-
-    # Disclaimer text to be appended
-    disclaimer = (
-        "\n\n*Disclaimer : This content is a translation of material originally published in"
-        " Korean by the National Tax Service of the Republic of Korea. While efforts have been"
-        " made to ensure accuracy, this translation is provided for informational purposes only"
-        " and does not carry legal weight. In the event of any discrepancy, the original Korean"
-        " version shall prevail. Users should consult the official Korean documents for precise"
-        " interpretation. This translation does not constitute legal advice. The translators and"
-        " publishers shall not be held liable for any loss arising from reliance on this translation.*"
-    )
-
-    # Initialize Airtable API object and Table object
-    api = Api(airtable_api_key)
-    table = api.table(airtable_base_id, airtable_table_name)
+    # Initialize Airtable Table object
+    table = airtable_table(airtable_api_key, airtable_base_id, airtable_table_name)
 
     # Fetch records with state 'INIT'
-    formula = "{state} = 'INIT'"
-    records = table.all(formula=formula)
-
-    for record in records:
-        source_content = record['fields'].get('source_content_text', "")
-        if source_content:
-            generated_text = generate_text(openai_api_key, gpt_prompt, source_content)
-
-            # Merge generated text with the disclaimer
-            complete_text = generated_text + disclaimer
+    if args.mirror:
+        table = AirtableMirror(table, args.mirror)
+        table.sync()
+        records = table.select(state='INIT')
+    else:
+        formula = "{state} = 'INIT'"
+        records = table.all(formula=formula)
 
-            record_id = record['id']
-            table.update(record_id, {
-                "article_text": complete_text,
-                "state": "REVIEW_REQUIRED"
-            })
-            print(f"Updated record ID {record_id} with generated text, disclaimer, and changed state to REVIEW_REQUIRED.")
+    generated, failed = generate_articles(table, records, openai_api_key, args.concurrency, args.rate)
+    print(f"Generated {generated} of {len(records)} articles.")
+    if failed:
+        print(f"The articles of {len(failed)} records could not be saved in Airtable: {', '.join(failed)}")
+        return 1
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -5,13 +5,33 @@ Description:
     using OpenAI's GPT-4 model. It processes records with a specified key phrase and no existing FAQ,
     generating structured FAQ text in HTML format. The generated content is then stored back in the
     Airtable record, enriching the dataset with AI-enhanced information.
+
+    With --batch-size the key phrases of several records are sent in one request, and the model
+    only returns compact JSON question and answer pairs. They are validated and the FAQPage
+    markup (microdata, or JSON-LD with --format jsonld) is rendered locally from a template, so
+    no output tokens are spent on HTML boilerplate.
+
+    Key phrases are normalized (case, punctuation, stopwords and locale suffixes, so "botox korea"
+    and "Botox in Korea" are the same phrase) and records are grouped by it before generation.
+    Each group gets one generated FAQ, which is also kept in a SQLite cache keyed by the
+    normalized phrase, so later runs reuse it instead of calling GPT again.
                © [2025] [Boes Marie]. All rights reserved.
 """
 
+import argparse
+import html
+import json
 import os
+import re
+import sqlite3
+import time
+import unicodedata
 from dotenv import load_dotenv
-from pyairtable import Api
-import openai
+from openai import OpenAI
+
+import metrics_helper
+from airtable_helper import AIRTABLE_MIRROR_PATH, BLANK, NOT_BLANK, AirtableMirror, airtable_table
+from resilience_helper import retrying
 
 # Load environment variables
 load_dotenv()
@@ -22,38 +42,53 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 BASE_ID = os.getenv("AIRTABLE_BASE_ID")
 TABLE_NAME = os.getenv("AIRTABLE_TABLE_NAME")
 
-def fetch_records_to_process(api, base_id, table_name):
-    """Fetch records from Airtable that have a key phrase but no FAQ."""
-    table = api.base(base_id).table(table_name)
-    formula = "AND(NOT({key_phrase} = ''), {faq} = BLANK())"
-    records = table.all(formula=formula)
-    return records, table
+FAQ_CACHE_PATH = os.getenv("FAQ_CACHE_PATH", "faq_cache.sqlite")
+# Trailing locations that do not change what a FAQ is about, longest first
+LOCALE_SUFFIXES = sorted(
+    (suffix.strip().lower() for suffix in os.getenv("FAQ_LOCALE_SUFFIXES", "south korea,korea").split(',') if suffix.strip()),
+    key=len, reverse=True,
+)
+STOPWORDS = {'a', 'an', 'the', 'in', 'of', 'for', 'at', 'to', 'on', 'near', 'and', 'with', 'by', 'from', 'about'}
 
-def generate_text(api_key, prompt, text):
-    """Generate FAQ text using OpenAI's GPT model."""
-    openai.api_key = api_key
+FAQ_COUNT = 3
+# JSON mode needs a newer model than gpt-4
+FAQ_BATCH_MODEL = "gpt-4o"
+FAQ_TOKENS_PER_PHRASE = 400
+# Output token limit of FAQ_BATCH_MODEL, a larger max_tokens fails the whole request
+FAQ_MAX_OUTPUT_TOKENS = 16384
+# More key phrases would not fit in the answer and cut off its JSON
+FAQ_MAX_BATCH_SIZE = FAQ_MAX_OUTPUT_TOKENS // FAQ_TOKENS_PER_PHRASE
 
-    message = [{"role": "system", "content": prompt}, {"role": "user", "content": text}]
-    print(f"Calling GPT for topic: {text[:50] + '..' if len(text) > 52 else text}")
+FAQ_BATCH_PROMPT = (
+    f"For each key phrase in the JSON list you get, create {FAQ_COUNT} frequently asked questions related "
+    "to it and answer each in 2-3 sentences. Reply with JSON only, in this form: "
+    '{"faqs": {"<key phrase exactly as given>": [{"q": "<question>", "a": "<answer>"}]}}'
+)
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=message,
-        temperature=1,
-        max_tokens=1500,
-        frequency_penalty=0.0
-    )
-
-    return response['choices'][0]['message']['content']
+FAQ_MICRODATA_TEMPLATE = (
+    '<div itemscope itemtype="https://schema.org/FAQPage">\n'
+    '    <h2> Frequently Asked Questions (FAQ) </h2>\n'
+    '{questions}'
+    '</div>'
+)
+FAQ_MICRODATA_QUESTION = (
+    '    <div itemscope itemprop="mainEntity" itemtype="https://schema.org/Question">\n'
+    '        <h3 itemprop="name">{question}</h3>\n'
+    '        <div itemscope itemprop="acceptedAnswer" itemtype="https://schema.org/Answer">\n'
+    '            <div itemprop="text">{answer}</div>\n'
+    '        </div>\n'
+    '    </div>\n'
+)
+FAQ_HTML_TEMPLATE = (
+    '<div class="faq">\n'
+    '    <h2> Frequently Asked Questions (FAQ) </h2>\n'
+    '{questions}'
+    '</div>\n'
+    '<script type="application/ld+json">{json_ld}</script>'
+)
+FAQ_HTML_QUESTION = '    <h3>{question}</h3>\n    <p>{answer}</p>\n'
 
-def main(airtable_api_key, base_id, table_name, openai_api_key):
-    api = Api(airtable_api_key)
-    records, table = fetch_records_to_process(api, base_id, table_name)
-
-    for record in records:
-        topic = record['fields'].get('key_phrase')
-
-        faq_text_schema_example = '''
+FAQ_SCHEMA_EXAMPLE = '''
         <div itemscope itemtype="https://schema.org/FAQPage">
             <h2> Frequently Asked Questions (FAQ) </h2>
             <div itemscope itemprop=mainEntity itemtype="https://schema.org/Question">
@@ -77,14 +112,292 @@ def main(airtable_api_key, base_id, table_name, openai_api_key):
         </div>
         '''
 
-        faq_prompt = (
-            f"Create 3 frequently asked questions related to {topic} and answer each in 2-3 sentences. "
-            f"Output the result in FAQ Schema Structured data in HTML like the example: {faq_text_schema_example}"
+
+class FaqCache:
+    """Persistent cache of generated FAQs keyed by normalized key phrase, stored in SQLite."""
+
+    def __init__(self, path=FAQ_CACHE_PATH):
+        self.connection = sqlite3.connect(path)
+        # kind is 'pairs' for JSON question and answer pairs, 'html' for markup written by GPT
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS faq_cache ("
+            " key_phrase TEXT NOT NULL, kind TEXT NOT NULL, data TEXT NOT NULL, created_at REAL NOT NULL,"
+            " PRIMARY KEY (key_phrase, kind))"
+        )
+
+    def get_many(self, key_phrases, kind):
+        """Return {normalized key phrase: data} for the cached key phrases."""
+        cached = {}
+        key_phrases = list(key_phrases)
+        # Stay well below SQLite's limit on bound parameters
+        for start in range(0, len(key_phrases), 500):
+            chunk = key_phrases[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.connection.execute(
+                f"SELECT key_phrase, data FROM faq_cache WHERE kind = ? AND key_phrase IN ({placeholders})",
+                (kind, *chunk)
+            )
+            cached.update((key_phrase, json.loads(data)) for key_phrase, data in rows)
+        return cached
+
+    def set(self, key_phrase, kind, data):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO faq_cache (key_phrase, kind, data, created_at) VALUES (?, ?, ?, ?)",
+                (key_phrase, kind, json.dumps(data, ensure_ascii=False), time.time())
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+class NoFaqCache:
+    """Stand-in for FaqCache when caching is switched off."""
+
+    def get_many(self, key_phrases, kind):
+        return {}
+
+    def set(self, key_phrase, kind, data):
+        pass
+
+    def close(self):
+        pass
+
+
+def normalize_key_phrase(key_phrase):
+    """Lower case, without punctuation, stopwords and a trailing locale like "in korea"."""
+    text = unicodedata.normalize('NFKC', key_phrase).lower()
+    text = ' '.join(re.sub(r'[^\w\s]', ' ', text).split())
+    for suffix in LOCALE_SUFFIXES:
+        if text.endswith(' ' + suffix):
+            text = text[:-len(suffix)].strip()
+            break
+    words = [word for word in text.split() if word not in STOPWORDS]
+    return ' '.join(words) or text
+
+
+def group_records(records):
+    """Group records by normalized key phrase: {normalized: (key phrase to generate for, records)}."""
+    groups = {}
+    for record in records:
+        key_phrase = (record['fields'].get('key_phrase') or '').strip()
+        normalized = normalize_key_phrase(key_phrase)
+        if normalized:
+            # The first key phrase of a group is the one the FAQ is generated for
+            groups.setdefault(normalized, (key_phrase, []))[1].append(record)
+    return groups
+
+def fetch_records_to_process(airtable_api_key, base_id, table_name, mirror_path=None):
+    """Fetch records from Airtable (or its local mirror) that have a key phrase but no FAQ."""
+    table = airtable_table(airtable_api_key, base_id, table_name)
+    if mirror_path:
+        table = AirtableMirror(table, mirror_path)
+        table.sync()
+        return table.select(key_phrase=NOT_BLANK, faq=BLANK), table
+    formula = "AND(NOT({key_phrase} = ''), {faq} = BLANK())"
+    records = table.all(formula=formula)
+    return records, table
+
+def generate_text(api_key, prompt, text):
+    """Generate FAQ text using OpenAI's GPT model."""
+    # Retries are handled by resilience_helper
+    client = OpenAI(api_key=api_key, max_retries=0)
+
+    message = [{"role": "system", "content": prompt}, {"role": "user", "content": text}]
+    print(f"Calling GPT for topic: {text[:50] + '..' if len(text) > 52 else text}")
+
+    response = retrying('openai', client.chat.completions.create)(
+        model="gpt-4",
+        messages=message,
+        temperature=1,
+        max_tokens=1500,
+        frequency_penalty=0.0
+    )
+
+    metrics_helper.record_llm_usage('openai', "gpt-4", response)
+    return response.choices[0].message.content
+
+def parse_faq_batch(content, key_phrases):
+    """
+    Validate the JSON answer of a batch request. Returns {key_phrase: [(question, answer), ...]}
+    for the key phrases with at least one complete question and answer; the others are left out.
+    """
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        print("GPT did not return valid JSON for the FAQ batch.")
+        return {}
+    if isinstance(data, dict) and isinstance(data.get('faqs'), dict):
+        data = data['faqs']
+    if not isinstance(data, dict):
+        return {}
+
+    # The model does not always keep the exact casing or spacing of a key phrase
+    answers = {str(key).strip().lower(): value for key, value in data.items()}
+    faqs = {}
+    for key_phrase in key_phrases:
+        items = answers.get(key_phrase.strip().lower())
+        if not isinstance(items, list):
+            continue
+        pairs = []
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            question, answer = item.get('q'), item.get('a')
+            if isinstance(question, str) and isinstance(answer, str) and question.strip() and answer.strip():
+                pairs.append((question.strip(), answer.strip()))
+        if pairs:
+            faqs[key_phrase] = pairs[:FAQ_COUNT]
+    return faqs
+
+def generate_faq_batch(api_key, key_phrases):
+    """Generate the questions and answers for several key phrases with one request."""
+    # Retries are handled by resilience_helper
+    client = OpenAI(api_key=api_key, max_retries=0)
+    print(f"Calling GPT for {len(key_phrases)} key phrases: {', '.join(key_phrases)[:80]}")
+
+    response = retrying('openai', client.chat.completions.create)(
+        model=FAQ_BATCH_MODEL,
+        messages=[
+            {"role": "system", "content": FAQ_BATCH_PROMPT},
+            {"role": "user", "content": json.dumps(key_phrases, ensure_ascii=False)},
+        ],
+        response_format={"type": "json_object"},
+        temperature=1,
+        max_tokens=min(FAQ_TOKENS_PER_PHRASE * len(key_phrases), FAQ_MAX_OUTPUT_TOKENS),
+    )
+
+    metrics_helper.record_llm_usage('openai', FAQ_BATCH_MODEL, response)
+    return parse_faq_batch(response.choices[0].message.content, key_phrases)
+
+def render_faq(pairs, output_format='microdata'):
+    """Render question and answer pairs as FAQPage microdata, or as HTML with a JSON-LD block."""
+    if output_format == 'jsonld':
+        json_ld = json.dumps({
+            "@context": "https://schema.org",
+            "@type": "FAQPage",
+            "mainEntity": [
+                {"@type": "Question", "name": question,
+                 "acceptedAnswer": {"@type": "Answer", "text": answer}}
+                for question, answer in pairs
+            ],
+        }, ensure_ascii=False)
+        questions = ''.join(
+            FAQ_HTML_QUESTION.format(question=html.escape(question), answer=html.escape(answer))
+            for question, answer in pairs
         )
+        # A "</script>" inside an answer must not end the script block
+        return FAQ_HTML_TEMPLATE.format(questions=questions, json_ld=json_ld.replace('</', '<\\/'))
+
+    questions = ''.join(
+        FAQ_MICRODATA_QUESTION.format(question=html.escape(question), answer=html.escape(answer))
+        for question, answer in pairs
+    )
+    return FAQ_MICRODATA_TEMPLATE.format(questions=questions)
+
+def store_faq(table, records, faq_html):
+    """Write one FAQ to all records of a group."""
+    table.batch_update([{'id': record['id'], 'fields': {'faq': faq_html}} for record in records])
+
+def generate_faqs_batched(table, groups, cache, openai_api_key, batch_size, output_format='microdata'):
+    cached = cache.get_many(groups, 'pairs')
+    if cached:
+        updates = [
+            {'id': record['id'], 'fields': {'faq': render_faq(pairs, output_format)}}
+            for normalized, pairs in cached.items()
+            for record in groups[normalized][1]
+        ]
+        try:
+            table.batch_update(updates)
+            print(f"Reused {len(cached)} cached FAQs for {len(updates)} records.")
+        except Exception as e:
+            print(f"Failed to store the cached FAQs: {e}")
+
+    pending = [normalized for normalized in groups if normalized not in cached]
+    if batch_size > FAQ_MAX_BATCH_SIZE:
+        print(f"Batch size {batch_size} does not fit the output limit of {FAQ_BATCH_MODEL}, "
+              f"using {FAQ_MAX_BATCH_SIZE}.")
+        batch_size = FAQ_MAX_BATCH_SIZE
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        key_phrases = [groups[normalized][0] for normalized in batch]
+        try:
+            faqs = generate_faq_batch(openai_api_key, key_phrases)
+        except Exception as e:
+            # Leave the records without FAQ so the next run picks them up again
+            print(f"Failed to generate FAQs for {', '.join(key_phrases)}: {e}")
+            continue
+
+        updates = []
+        for normalized in batch:
+            key_phrase, group = groups[normalized]
+            if key_phrase not in faqs:
+                print(f"No valid FAQ returned for {key_phrase}, leaving it for the next run.")
+                continue
+            cache.set(normalized, 'pairs', faqs[key_phrase])
+            faq_html = render_faq(faqs[key_phrase], output_format)
+            updates.extend({'id': record['id'], 'fields': {'faq': faq_html}} for record in group)
+
+        if updates:
+            try:
+                table.batch_update(updates)
+            except Exception as e:
+                print(f"Failed to store FAQs for {', '.join(key_phrases)}: {e}")
+
+def generate_faq_html(openai_api_key, topic):
+    """Ask GPT for the FAQ of one key phrase, written as schema markup like the example."""
+    faq_prompt = (
+        f"Create 3 frequently asked questions related to {topic} and answer each in 2-3 sentences. "
+        f"Output the result in FAQ Schema Structured data in HTML like the example: {FAQ_SCHEMA_EXAMPLE}"
+    )
+    faq_text = generate_text(api_key=openai_api_key, prompt=faq_prompt, text='')
+    return f"{faq_text}"
+
+def generate_faqs(airtable_api_key, base_id, table_name, openai_api_key, batch_size=None, output_format='microdata',
+                  cache_path=FAQ_CACHE_PATH, mirror_path=None):
+    records, table = fetch_records_to_process(airtable_api_key, base_id, table_name, mirror_path)
+    groups = group_records(records)
+    print(f"Found {len(records)} records with {len(groups)} distinct key phrases.")
+    cache = FaqCache(cache_path) if cache_path else NoFaqCache()
+
+    try:
+        if batch_size:
+            generate_faqs_batched(table, groups, cache, openai_api_key, batch_size, output_format)
+            return
+
+        cached = cache.get_many(groups, 'html')
+        for normalized, (topic, group) in groups.items():
+            try:
+                with metrics_helper.timed('record', 'generate_faq'):
+                    faq_html = cached.get(normalized)
+                    if faq_html is None:
+                        faq_html = generate_faq_html(openai_api_key, topic)
+                        cache.set(normalized, 'html', faq_html)
+                    store_faq(table, group, faq_html)
+            except Exception as e:
+                # Leave the records without FAQ so the next run picks them up again
+                print(f"Failed to generate FAQ for {topic}: {e}")
+    finally:
+        cache.close()
 
-        faq_text = generate_text(api_key=openai_api_key, prompt=faq_prompt, text='')
-        faq_html = f"{faq_text}"
-        table.update(record['id'], {"faq": faq_html})
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate FAQ schema markup for records with a key phrase and no FAQ.")
+    parser.add_argument('--batch-size', type=int,
+                        help=f"Key phrases per request (at most {FAQ_MAX_BATCH_SIZE}); the FAQ markup is then "
+                             "rendered locally from JSON answers")
+    parser.add_argument('--format', choices=['microdata', 'jsonld'], default='microdata',
+                        help="Markup of the locally rendered FAQs (with --batch-size)")
+    parser.add_argument('--cache', default=FAQ_CACHE_PATH, help="Path of the SQLite FAQ cache")
+    parser.add_argument('--no-cache', action='store_true', help="Generate every FAQ again, without the cache")
+    parser.add_argument('--mirror', nargs='?', const=AIRTABLE_MIRROR_PATH,
+                        help="Select the records from a local SQLite mirror of the table, synced incrementally "
+                             "(default path: %(const)s)")
+    args = parser.parse_args(argv)
+    if args.batch_size is not None and args.batch_size < 1:
+        parser.error("--batch-size has to be at least 1")
+    generate_faqs(AIRTABLE_API_KEY, BASE_ID, TABLE_NAME, OPENAI_API_KEY,
+                  batch_size=args.batch_size, output_format=args.format,
+                  cache_path=None if args.no_cache else args.cache, mirror_path=args.mirror)
 
 if __name__ == "__main__":
-    main(AIRTABLE_API_KEY, BASE_ID, TABLE_NAME, OPENAI_API_KEY)
\ No newline at end of file
+    main()
@@ -10,21 +10,22 @@ Description:
 
 
 
+import argparse
 import os
-import requests
 from dotenv import load_dotenv
 import time
-from pyairtable import api
 from datetime import datetime, timezone
 
+import resilience_helper
+from airtable_helper import airtable_table
+
 load_dotenv()
 
 AIRTABLE_API_KEY = os.getenv("AIRTABLE_API_KEY")
 AIRTABLE_BASE_ID = 'AIRTABLE_BASE_ID'
 AIRTABLE_TABLE_ID = 'AIRTABLE_TABLE_NAME'
 
-airtable_api = api.Api(AIRTABLE_API_KEY)
-table = airtable_api.table(AIRTABLE_BASE_ID, AIRTABLE_TABLE_ID)
+table = airtable_table(AIRTABLE_API_KEY, AIRTABLE_BASE_ID, AIRTABLE_TABLE_ID)
 
 
 def fetch_ready_to_publish_records():
@@ -71,7 +72,7 @@ def check_media_status(container_id, access_token):
     print("Checking media status...")
     status_url = f"https://graph.facebook.com/v21.0/{container_id}"
     while True:
-        response = requests.get(status_url, params={
+        response = resilience_helper.request('GET', status_url, endpoint='graph.facebook', params={
             "fields": "status_code",
             "access_token": access_token
         })
@@ -94,7 +95,7 @@ def check_media_status(container_id, access_token):
             print(f"Current media status: {status}, retrying in 5 seconds...")
             time.sleep(5)
 
-def schedule_instagram_post(property, message, media_url, media_type):
+def schedule_instagram_post(record_id, property, message, media_url, media_type):
     ig_account_id = os.getenv(f"INSTAGRAM_{property}_ID")
     access_token = os.getenv(f"FACEBOOK_{property}_PAGE_ACCESS_TOKEN")
 
@@ -106,14 +107,14 @@ def schedule_instagram_post(property, message, media_url, media_type):
         print(f"Uploading image/video to Instagram for property '{property}'...")
         container_url = f"https://graph.facebook.com/v21.0/{ig_account_id}/media"
         if media_type == "REELS":
-            container_response = requests.post(container_url, params={
+            container_response = resilience_helper.request('POST', container_url, endpoint='graph.facebook', params={
                 "media_type": "REELS",
                 "video_url": media_url,
                 "caption": message,
                 "access_token": access_token
             })
         else:
-            container_response = requests.post(container_url, params={
+            container_response = resilience_helper.request('POST', container_url, endpoint='graph.facebook', params={
                 "image_url": media_url,
                 "caption": message,
                 "access_token": access_token
@@ -127,7 +128,7 @@ def schedule_instagram_post(property, message, media_url, media_type):
 
             if check_media_status(container_id, access_token):
                 publication_url = f"https://graph.facebook.com/v21.0/{ig_account_id}/media_publish"
-                publish_response = requests.post(publication_url, json={
+                publish_response = resilience_helper.request('POST', publication_url, endpoint='graph.facebook', json={
                     "creation_id": container_id,
                     "access_token": access_token
                 })
@@ -150,7 +151,8 @@ def schedule_instagram_post(property, message, media_url, media_type):
     except Exception as e:
         print(f"An error occurred while scheduling the Instagram post: {e}")
 
-if __name__ == "__main__":
+def main(argv=None):
+    argparse.ArgumentParser(description="Post today's READY_TO_PUBLISH Airtable records to Instagram.").parse_args(argv)
     records = fetch_ready_to_publish_records()
     for record in records:
         record_id = record['id']
@@ -161,13 +163,16 @@ if __name__ == "__main__":
 
         if video_url:
             schedule_instagram_post(
-                post_details['property'], post_message, video_url, "REELS"
+                record_id, post_details['property'], post_message, video_url, "REELS"
             )
         elif image_url:
             schedule_instagram_post(
-                post_details['property'], post_message, image_url, "IMAGE"
+                record_id, post_details['property'], post_message, image_url, "IMAGE"
             )
         else:
             print("No video URL found in the record.")
     else:
-        print("No record found.")
\ No newline at end of file
+        print("No record found.")
+
+if __name__ == "__main__":
+    main()
@@ -11,12 +11,15 @@ Description:
            © [2025] [Boes Marie]. All rights reserved.
 """
 
+import argparse
 import os
-from pyairtable import Api
 from markdown import markdown
 from dotenv import load_dotenv, find_dotenv
 from bs4 import BeautifulSoup
 
+import metrics_helper
+from airtable_helper import AIRTABLE_MIRROR_PATH, BLANK, AirtableMirror, airtable_table
+
 
 # Load environment variables
 load_dotenv(find_dotenv())
@@ -24,9 +27,6 @@ AIRTABLE_API_KEY = os.getenv("AIRTABLE_API_KEY")
 BASE_ID = os.getenv('AIRTABLE_BASE_ID')
 TABLE_NAME = os.getenv('AIRTABLE_TABLE_NAME')
 
-# Initialize the Airtable API
-api = Api(AIRTABLE_API_KEY)
-table = api.table(BASE_ID, TABLE_NAME)
 
 
 # Function to process and convert Markdown text
@@ -42,25 +42,46 @@ def convert_markdown_to_html(article_text):
 
 
 # Function to fetch records where the status is READY_TO_PUBLISH and html is empty
-def fetch_ready_articles_with_empty_html():
+def fetch_ready_articles_with_empty_html(table):
+    if isinstance(table, AirtableMirror):
+        return table.select(state='READY_TO_PUBLISH', html=BLANK)
     # Use the Airtable formula to filter out records based on the conditions
     formula = "AND({state} = 'READY_TO_PUBLISH', {html} = '')"
     records = table.all(view='Grid view', formula=formula)
     return records
 
-# Fetch all relevant records from the Airtable table
-records = fetch_ready_articles_with_empty_html()
-
-for record in records:
-    record_id = record['id']
-    fields = record['fields']
-    article_text = fields.get('article_text')
-    html = fields.get('html')
-
-    # Check if 'html' field is empty and 'article_text' contains data
-    if article_text and not html:
-        # Convert Markdown article to HTML
-        html_content = convert_markdown_to_html(article_text)
-        # Update the Airtable record with the new HTML content
-        table.update(record_id, {'html': html_content})
-        print(f"Converted and updated record {record_id} from Markdown to HTML.")
\ No newline at end of file
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert Markdown articles that are ready to publish to HTML.")
+    parser.add_argument('--mirror', nargs='?', const=AIRTABLE_MIRROR_PATH,
+                        help="Select the records from a local SQLite mirror of the table, synced incrementally "
+                             "(default path: %(const)s)")
+    args = parser.parse_args(argv)
+
+    # Initialize the Airtable table
+    table = airtable_table(AIRTABLE_API_KEY, BASE_ID, TABLE_NAME)
+    if args.mirror:
+        table = AirtableMirror(table, args.mirror)
+        table.sync()
+
+    # Fetch all relevant records from the Airtable table
+    records = fetch_ready_articles_with_empty_html(table)
+
+    for record in records:
+        record_id = record['id']
+        fields = record['fields']
+        article_text = fields.get('article_text')
+        html = fields.get('html')
+
+        # Check if 'html' field is empty and 'article_text' contains data
+        if article_text and not html:
+            with metrics_helper.timed('record', 'convert_markdown'):
+                # Convert Markdown article to HTML
+                html_content = convert_markdown_to_html(article_text)
+                # Update the Airtable record with the new HTML content
+                table.update(record_id, {'html': html_content})
+            print(f"Converted and updated record {record_id} from Markdown to HTML.")
+
+
+if __name__ == "__main__":
+    main()
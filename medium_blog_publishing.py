@@ -8,12 +8,14 @@ Description:
        © [2025] [Boes Marie]. All rights reserved.
 """
 
+import argparse
 import os
 import random
-import requests
-from pyairtable import Api
 from dotenv import load_dotenv, find_dotenv
 
+import resilience_helper
+from airtable_helper import airtable_table
+
 # Load environment variables from the .env file
 load_dotenv(find_dotenv())
 
@@ -41,9 +43,7 @@ def get_random_image_path():
 
 # Airtable - Get text from article_text column
 def get_ready_to_publish_articles():
-    api = Api(AIRTABLE_API_KEY)
-    base = api.base(BASE_ID)
-    table = base.table(TABLE_NAME)
+    table = airtable_table(AIRTABLE_API_KEY, BASE_ID, TABLE_NAME)
     records = table.all()
     # Filter records that are ready to publish
     ready_to_publish = [
@@ -59,12 +59,13 @@ def upload_image_to_medium(image_path):
         'Authorization': f'Bearer {MEDIUM_INTEGRATION_TOKEN}',
         'Accept': 'application/json'
     }
-    # Open the image in binary mode
+    # Read the image in binary mode, so a retried upload sends the full file again
     with open(image_path, 'rb') as image_file:
-        # Requests will handle the Content-Type and boundary when using the files parameter
-        files = {'image': (os.path.basename(image_path), image_file, 'image/png')}
-        url = f"https://api.medium.com/v1/images"
-        response = requests.post(url, headers=headers, files=files)
+        image_data = image_file.read()
+    # Requests will handle the Content-Type and boundary when using the files parameter
+    files = {'image': (os.path.basename(image_path), image_data, 'image/png')}
+    url = f"https://api.medium.com/v1/images"
+    response = resilience_helper.request('POST', url, endpoint='medium', idempotent=True, headers=headers, files=files)
     # Check for valid image upload
     if response.status_code == 201:
         return response.json()['data']['url']
@@ -88,7 +89,7 @@ def publish_to_medium(article_title, article_content, image_url, publication_id)
         "content": f"![Header Image]({image_url})\n\n{article_content}",
         "publishStatus": "public"
     }
-    response = requests.post(url, headers=headers, json=data)
+    response = resilience_helper.request('POST', url, endpoint='medium', headers=headers, json=data)
     if response.status_code == 201:
         post_id = response.json().get('data').get('id')
         url = response.json().get('data').get('url')
@@ -102,15 +103,15 @@ def publish_to_medium(article_title, article_content, image_url, publication_id)
 
 # Update Airtable with the new post_id and article URL
 def update_airtable_with_post_data(record_id, post_id, article_url):
-    api = Api(AIRTABLE_API_KEY)
-    table = api.base(BASE_ID).table(TABLE_NAME)
+    table = airtable_table(AIRTABLE_API_KEY, BASE_ID, TABLE_NAME)
     table.update(record_id, {
         "post_id": post_id,
         "state": "PUBLISHED",
         "medium_url": article_url
     })
 
-def main():
+def main(argv=None):
+    argparse.ArgumentParser(description="Publish READY_TO_PUBLISH articles from Airtable to Medium.").parse_args(argv)
     publication_id = os.getenv('PUBLICATION_ID')
     try:
         articles = get_ready_to_publish_articles()
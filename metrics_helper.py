@@ -0,0 +1,195 @@
+"""
+Script Name: Metrics Helper
+Description:
+    Small instrumentation module used by all scripts. Every outbound HTTP, LLM and Airtable call
+    is timed by the shared resilience layer, and LLM calls also record their tokens in and out
+    (from `response.usage`) together with the computed cost. The batch scripts also time the work
+    on each record with `timed('record', ...)`, which the offline benchmarks use for records per
+    second and per record latency.
+
+    Nothing is written unless it is configured with environment variables:
+    - METRICS_FILE: JSON lines file, one event per call is appended to it.
+    - METRICS_TEXTFILE_DIR: directory of the Prometheus node exporter textfile collector. At exit
+      every script writes the totals of its run to `<dir>/seo_<script>.prom`.
+       © [2025] [Boes Marie]. All rights reserved.
+"""
+
+import atexit
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+METRICS_FILE = os.getenv('METRICS_FILE')
+METRICS_TEXTFILE_DIR = os.getenv('METRICS_TEXTFILE_DIR')
+
+# USD per million input and output tokens
+MODEL_PRICES = {
+    'gpt-4': (30.00, 60.00),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-3.5-turbo': (0.50, 1.50),
+    'gemini-1.5-flash': (0.075, 0.30),
+}
+
+ENDPOINT_KINDS = {
+    'openai': 'llm',
+    'gemini': 'llm',
+    'airtable': 'airtable',
+    'stage': 'stage',
+    'record': 'record',
+}
+
+_lock = threading.Lock()
+_calls = defaultdict(lambda: {'count': 0, 'errors': 0, 'duration': 0.0})
+_usage = defaultdict(lambda: {'tokens_in': 0, 'tokens_out': 0, 'cost': 0.0})
+
+
+def script_name():
+    name = os.getenv('METRICS_SCRIPT') or os.path.basename(sys.argv[0]) or 'python'
+    return name[:-3] if name.endswith('.py') else name
+
+
+def kind_of(endpoint):
+    return ENDPOINT_KINDS.get(endpoint, 'http')
+
+
+def compute_cost(model, tokens_in, tokens_out):
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (tokens_in * input_price + tokens_out * output_price) / 1_000_000
+
+
+def _write_event(event):
+    if not METRICS_FILE:
+        return
+    event = dict(event, script=script_name(), timestamp=time.time())
+    line = json.dumps(event, ensure_ascii=False) + '\n'
+    with _lock:
+        with open(METRICS_FILE, 'a', encoding='utf-8') as metrics_file:
+            metrics_file.write(line)
+
+
+def record_call(endpoint, operation, duration, ok=True, status=None):
+    kind = kind_of(endpoint)
+    with _lock:
+        totals = _calls[(kind, endpoint, operation)]
+        totals['count'] += 1
+        totals['duration'] += duration
+        if not ok:
+            totals['errors'] += 1
+    _write_event({
+        'type': 'call', 'kind': kind, 'endpoint': endpoint, 'operation': operation,
+        'duration': round(duration, 4), 'ok': ok, 'status': status,
+    })
+
+
+@contextmanager
+def timed(endpoint, operation):
+    """Time a block of work, e.g. `with timed('stage', 'scrape'):`, recording failures too."""
+    start = time.monotonic()
+    try:
+        yield
+    except Exception:
+        record_call(endpoint, operation, time.monotonic() - start, ok=False)
+        raise
+    record_call(endpoint, operation, time.monotonic() - start)
+
+
+def usage_of(response):
+    """Tokens in and out of an OpenAI (new or legacy SDK) or Gemini response, or None."""
+    usage = getattr(response, 'usage', None)
+    if usage is None and isinstance(response, dict):
+        usage = response.get('usage')
+    if usage is not None:
+        if isinstance(usage, dict):
+            return usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0)
+        return usage.prompt_tokens or 0, usage.completion_tokens or 0
+    usage_metadata = getattr(response, 'usage_metadata', None)
+    if usage_metadata is not None:
+        return usage_metadata.prompt_token_count or 0, usage_metadata.candidates_token_count or 0
+    return None
+
+
+def record_llm_usage(endpoint, model, response=None, tokens_in=None, tokens_out=None):
+    """Record token usage and cost of an LLM call, from its response or from explicit counts."""
+    if response is not None:
+        usage = usage_of(response)
+        if usage is None:
+            return
+        tokens_in, tokens_out = usage
+    cost = compute_cost(model, tokens_in or 0, tokens_out or 0)
+    with _lock:
+        totals = _usage[(endpoint, model)]
+        totals['tokens_in'] += tokens_in or 0
+        totals['tokens_out'] += tokens_out or 0
+        totals['cost'] += cost
+    _write_event({
+        'type': 'llm_usage', 'endpoint': endpoint, 'model': model,
+        'tokens_in': tokens_in, 'tokens_out': tokens_out, 'cost': round(cost, 6),
+    })
+
+
+def summary():
+    with _lock:
+        return {
+            'calls': {'/'.join(key): dict(value) for key, value in _calls.items()},
+            'usage': {'/'.join(key): dict(value) for key, value in _usage.items()},
+        }
+
+
+def _label_value(value):
+    # Escapes of the exposition format, node_exporter drops the whole file on an invalid line
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_string(**labels):
+    return ','.join(f'{key}="{_label_value(value)}"' for key, value in labels.items())
+
+
+def write_textfile(directory=None):
+    """Write the totals of this run in the Prometheus text format, replacing the file atomically."""
+    directory = directory or METRICS_TEXTFILE_DIR
+    if not directory:
+        return
+    script = script_name()
+    families = {
+        'seo_run_calls': ('Outbound calls in the last run of the script.', []),
+        'seo_run_call_errors': ('Failed outbound calls in the last run of the script.', []),
+        'seo_run_call_duration_seconds': ('Total time spent in outbound calls in the last run.', []),
+        'seo_run_llm_tokens': ('LLM tokens used in the last run of the script.', []),
+        'seo_run_llm_cost_usd': ('Computed LLM cost of the last run of the script.', []),
+    }
+    with _lock:
+        for (kind, endpoint, operation), totals in sorted(_calls.items()):
+            labels = _label_string(script=script, kind=kind, endpoint=endpoint, operation=operation)
+            families['seo_run_calls'][1].append(f'{{{labels}}} {totals["count"]}')
+            families['seo_run_call_errors'][1].append(f'{{{labels}}} {totals["errors"]}')
+            families['seo_run_call_duration_seconds'][1].append(f'{{{labels}}} {totals["duration"]:.4f}')
+        for (endpoint, model), totals in sorted(_usage.items()):
+            for direction in ('in', 'out'):
+                labels = _label_string(script=script, endpoint=endpoint, model=model, direction=direction)
+                families['seo_run_llm_tokens'][1].append(f'{{{labels}}} {totals["tokens_" + direction]}')
+            labels = _label_string(script=script, endpoint=endpoint, model=model)
+            families['seo_run_llm_cost_usd'][1].append(f'{{{labels}}} {totals["cost"]:.6f}')
+
+    # All samples of a metric have to follow its HELP and TYPE lines
+    lines = []
+    for name, (help_text, samples) in families.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        lines.extend(f'{name}{sample}' for sample in samples)
+
+    os.makedirs(directory, exist_ok=True)
+    file_name = re.sub(r'[^\w.-]', '_', script)
+    path = os.path.join(directory, f'seo_{file_name}.prom')
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as textfile:
+        textfile.write('\n'.join(lines) + '\n')
+    os.replace(temporary_path, path)
+
+
+atexit.register(write_textfile)
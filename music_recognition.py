@@ -1,3 +1,5 @@
+import argparse
+import asyncio
 import os
 from shazamio import Shazam
 from mutagen.easyid3 import EasyID3
@@ -41,5 +43,11 @@ async def rename_music_files(folder_path):
             else:
                 print(f"Failed to identify '{filename}'.")
 
-import asyncio
-asyncio.run(rename_music_files(r'C:\Users\marie\Documents\Music'))
\ No newline at end of file
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recognize MP3 files with Shazam, tag and rename them.")
+    parser.add_argument('folder', nargs='?', default=r'C:\Users\marie\Documents\Music')
+    args = parser.parse_args(argv)
+    asyncio.run(rename_music_files(args.folder))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -5,22 +5,54 @@ Description:
     while checking for SEO-related indexing directives. Specifically, it identifies URLs that are set with the
     "noindex" directive, indicating that they should not be indexed by search engines. Here's how the script works:
 
+    With --audit every URL gets a full indexability audit from a single fetch, written as one JSON
+    record per line (to stdout or --output): status code and redirect chain, X-Robots-Tag, meta
+    robots, canonical, hreflang alternates, and whether robots.txt allows crawling it. robots.txt
+    is fetched and parsed once per host.
+
+    With --output the URLs are sharded over --workers processes, each fetching with --threads
+    threads over its own pooled session. Every worker appends its records to a shard file as soon
+    as a URL is done; at the end the shards are merged into the output and a summary per site is
+    written next to it. An interrupted audit resumes from the records already on disk when it is
+    run again with the same --output.
+
                © [2025] [Boes Marie]. All rights reserved.
 """
 
 
+import argparse
+import contextlib
+import glob
+import json
+import multiprocessing
 import os
+import queue
+import signal
+import sys
+import threading
+import zlib
+from urllib import robotparser
+from urllib.parse import urljoin, urlparse
+
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
-from lxml import html
+from lxml import etree, html
 from dotenv import load_dotenv
 
+import metrics_helper
+import resilience_helper
+
 load_dotenv()
 
+USER_AGENT = 'Googlebot'
+REQUEST_TIMEOUT = 30
+AUDIT_QUEUE_SIZE = 1000
+
 
 def fetch_urls_from_sitemap(sitemap_url):
     try:
-        response = requests.get(sitemap_url)
+        response = resilience_helper.request('GET', sitemap_url)
         response.raise_for_status()
         soup = BeautifulSoup(response.content, 'xml')
 
@@ -40,46 +72,413 @@ def fetch_urls_from_sitemap(sitemap_url):
         return []
 
 
+def robots_directives(value, user_agent=USER_AGENT):
+    """
+    Directives of an X-Robots-Tag or meta robots value that apply to `user_agent`, lower case.
+    Directives for another crawler ("otherbot: noindex") are left out.
+    """
+    directives = []
+    for part in (value or '').split(','):
+        part = part.strip().lower()
+        if ':' in part:
+            agent, directive = (piece.strip() for piece in part.split(':', 1))
+            # "unavailable_after: <date>" has a colon too but is not an agent prefix
+            if agent != 'unavailable_after':
+                if agent not in (user_agent.lower(), '*'):
+                    continue
+                part = directive
+        if part:
+            directives.append(part)
+    return directives
+
+
 def is_noindex(header):
-    return 'noindex' in header.get('X-Robots-Tag', '').lower()
+    directives = robots_directives(header.get('X-Robots-Tag', ''))
+    return 'noindex' in directives or 'none' in directives
 
 
-def check_noindex_url(url):
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        headers = response.headers
+class RobotsCache:
+    """Parsed robots.txt per host, fetched once and shared by all threads."""
+
+    def __init__(self, session=None, user_agent=USER_AGENT):
+        self.session = session
+        self.user_agent = user_agent
+        self._parsers = {}
+        self._lock = threading.Lock()
+        self._host_locks = {}
+
+    def parser_for(self, url):
+        parts = urlparse(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            if host in self._parsers:
+                return self._parsers[host]
+            host_lock = self._host_locks.setdefault(host, threading.Lock())
+
+        # Only one thread fetches the robots.txt of a host, the others wait for it
+        with host_lock:
+            with self._lock:
+                if host in self._parsers:
+                    return self._parsers[host]
+            parser = self._fetch(host)
+            with self._lock:
+                self._parsers[host] = parser
+            return parser
+
+    def _fetch(self, host):
+        parser = robotparser.RobotFileParser(f"{host}/robots.txt")
+        try:
+            response = resilience_helper.request('GET', f"{host}/robots.txt", session=self.session,
+                                                 timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            print(f"Error fetching robots.txt of {host}: {e}", file=sys.stderr)
+            return None
+        if response.status_code in (401, 403):
+            parser.disallow_all = True
+        elif 400 <= response.status_code < 500:
+            parser.allow_all = True
+        elif response.ok:
+            parser.parse(response.text.splitlines())
+        else:
+            # A server error leaves it unknown whether crawling is allowed
+            return None
+        return parser
+
+    def allowed(self, url):
+        """True or False from the robots.txt rules of the URL's host, None when robots.txt could not be read."""
+        parser = self.parser_for(url)
+        if parser is None:
+            return None
+        return parser.can_fetch(self.user_agent, url)
+
+
+def empty_record(url):
+    return {
+        'url': url,
+        'final_url': None,
+        'status': None,
+        'redirect_chain': [],
+        'x_robots_tag': None,
+        'meta_robots': None,
+        'noindex': False,
+        'noindex_sources': [],
+        'canonical': None,
+        'canonical_is_self': None,
+        'hreflang': [],
+        'robots_txt_allowed': None,
+        'error': None,
+    }
+
 
+def audit_response(url, response):
+    """Build the audit record of a URL from its (final) response."""
+    x_robots_tag = response.headers.get('X-Robots-Tag')
+    record = empty_record(url)
+    record.update({
+        'final_url': response.url,
+        'status': response.status_code,
+        'redirect_chain': [
+            {'url': hop.url, 'status': hop.status_code, 'location': hop.headers.get('Location')}
+            for hop in response.history
+        ],
+        'x_robots_tag': x_robots_tag,
+    })
+
+    header_directives = robots_directives(x_robots_tag)
+    if 'noindex' in header_directives or 'none' in header_directives:
+        record['noindex_sources'].append('header')
+
+    # Canonical and hreflang can also be sent as Link headers
+    for link in requests.utils.parse_header_links(response.headers.get('Link', '')):
+        relations = link.get('rel', '').lower().split()
+        if 'canonical' in relations:
+            record['canonical'] = urljoin(response.url, link.get('url', ''))
+        if 'alternate' in relations and link.get('hreflang'):
+            record['hreflang'].append({'hreflang': link['hreflang'], 'href': urljoin(response.url, link.get('url', ''))})
+
+    content_type = response.headers.get('Content-Type', '')
+    if response.content and ('html' in content_type or not content_type):
         tree = html.fromstring(response.content)
-        # Check for X-Robots-Tag in headers
-        if is_noindex(headers):
-            print(f"NOINDEX detected in headers for URL: {url}")
-            return True
-
-        meta_tags = tree.xpath("//meta[@name='robots' or @name='googlebot']")
-        noindex_content = [
-            'noindex' in (tag.get('content') or '').lower() for tag in meta_tags
-        ]
 
-        if any(noindex_content):
-            print(f"NOINDEX detected in meta tag for URL: {url}")
-            return True
+        meta_values = [tag.get('content') or '' for tag in tree.xpath("//meta[@name='robots' or @name='googlebot']")]
+        if meta_values:
+            record['meta_robots'] = ', '.join(meta_values)
+            meta_directives = [directive for value in meta_values for directive in robots_directives(value)]
+            if 'noindex' in meta_directives or 'none' in meta_directives:
+                record['noindex_sources'].append('meta')
 
-        print(f"URL is indexed: {url}")
-        return False
+        for link in tree.xpath("//link[@href and @rel]"):
+            relations = link.get('rel').lower().split()
+            if 'canonical' in relations and record['canonical'] is None:
+                record['canonical'] = urljoin(response.url, link.get('href').strip())
+            if 'alternate' in relations and link.get('hreflang'):
+                record['hreflang'].append({'hreflang': link.get('hreflang'),
+                                           'href': urljoin(response.url, link.get('href').strip())})
 
-    except requests.RequestException as e:
-        print(f"Error checking URL {url}: {e}")
+    record['noindex'] = bool(record['noindex_sources'])
+    if record['canonical']:
+        record['canonical_is_self'] = record['canonical'].rstrip('/') == response.url.rstrip('/')
+    return record
+
+
+def audit_url(url, session=None, robots=None):
+    """Audit the indexability of a URL with a single fetch. Returns a JSON serializable record."""
+    try:
+        response = resilience_helper.request('GET', url, session=session, allow_redirects=True,
+                                             timeout=REQUEST_TIMEOUT)
+        record = audit_response(url, response)
+    except (requests.RequestException, ValueError, etree.LxmlError, resilience_helper.CircuitOpenError) as e:
+        # lxml raises ParserError (not a ValueError) on blank or comment-only documents, and an
+        # open circuit of the site fails the URL like any other fetch error
+        record = empty_record(url)
+        record['error'] = str(e)
+    if robots is not None:
+        record['robots_txt_allowed'] = robots.allowed(record.get('final_url') or url)
+    return record
+
+
+def check_noindex_url(url):
+    record = audit_url(url)
+    if record['error']:
+        print(f"Error checking URL {url}: {record['error']}")
+        return False
+    if record['status'] >= 400:
+        print(f"Error checking URL {url}: HTTP {record['status']}")
         return False
 
+    if 'header' in record['noindex_sources']:
+        print(f"NOINDEX detected in headers for URL: {url}")
+        return True
+    if 'meta' in record['noindex_sources']:
+        print(f"NOINDEX detected in meta tag for URL: {url}")
+        return True
+
+    print(f"URL is indexed: {url}")
+    return False
+
 
 def parse_env_urls(env_var):
     urls = os.getenv(env_var, '').split(',')
     return [url.strip() for url in urls if url.strip() and not url.strip().startswith('#')]
 
 
-if __name__ == "__main__":
-    sitemap_urls = parse_env_urls('SITEMAP_URLS')
+def run_audit(sitemap_urls, output):
+    session = requests.Session()
+    robots = RobotsCache(session)
+    totals = {'urls': 0, 'noindex': 0, 'errors': 0, 'blocked': 0}
+
+    for sitemap_url in sitemap_urls:
+        print(f"Processing sitemap: {sitemap_url}", file=sys.stderr)
+        for page_url in fetch_urls_from_sitemap(sitemap_url):
+            with metrics_helper.timed('record', 'audit_url'):
+                record = audit_url(page_url, session=session, robots=robots)
+            record['sitemap'] = sitemap_url
+            output.write(json.dumps(record, ensure_ascii=False) + '\n')
+            totals['urls'] += 1
+            totals['noindex'] += record['noindex']
+            totals['errors'] += bool(record['error'])
+            totals['blocked'] += record.get('robots_txt_allowed') is False
+
+    print(f"Audited {totals['urls']} URLs: {totals['noindex']} noindex, {totals['blocked']} blocked by robots.txt, "
+          f"{totals['errors']} errors.", file=sys.stderr)
+    return totals
+
+
+def shard_paths(output_path):
+    return sorted(glob.glob(glob.escape(output_path) + '.shard-*'))
+
+
+def read_audit_records(path):
+    """Records of a JSONL audit file, skipping a line cut off by an interrupted run."""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding='utf-8') as records_file:
+        for line in records_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and record.get('url'):
+                yield record
+
+
+def completed_urls(output_path):
+    done = set()
+    for path in [output_path] + shard_paths(output_path):
+        done.update(record['url'] for record in read_audit_records(path))
+    return done
+
+
+def open_for_append(path):
+    """Open a JSONL file for appending, starting on a new line if the last one was cut off."""
+    records_file = open(path, 'a', encoding='utf-8')
+    if records_file.tell():
+        with open(path, 'rb') as existing:
+            existing.seek(-1, os.SEEK_END)
+            if existing.read(1) != b'\n':
+                records_file.write('\n')
+    return records_file
+
+
+def audit_worker(url_queue, shard_path, threads):
+    """Worker process: audit the URLs of its queue with `threads` threads until they get None."""
+    # Ctrl+C reaches the whole process group, the main process stops the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=threads, pool_maxsize=threads)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    robots = RobotsCache(session)
+    write_lock = threading.Lock()
+
+    with open_for_append(shard_path) as shard:
+        def run():
+            while True:
+                item = url_queue.get()
+                if item is None:
+                    return
+                page_url, sitemap_url = item
+                try:
+                    with metrics_helper.timed('record', 'audit_url'):
+                        record = audit_url(page_url, session=session, robots=robots)
+                except Exception as e:
+                    # Still write a record: a dead thread would drop the URL and, once all
+                    # threads are gone, stop the worker and abort the whole audit
+                    record = empty_record(page_url)
+                    record['error'] = f"{type(e).__name__}: {e}"
+                record['sitemap'] = sitemap_url
+                line = json.dumps(record, ensure_ascii=False) + '\n'
+                with write_lock:
+                    shard.write(line)
+                    shard.flush()
+
+        workers = [threading.Thread(target=run, daemon=True) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+
+def put_url(url_queue, process, item):
+    # A worker that died would otherwise leave the producer waiting on its full queue forever
+    while True:
+        try:
+            url_queue.put(item, timeout=1)
+            return
+        except queue.Full:
+            if not process.is_alive():
+                raise RuntimeError(f"Audit worker {process.name} stopped with exit code {process.exitcode}")
+
+
+def merge_shards(output_path):
+    with open_for_append(output_path) as output:
+        for path in shard_paths(output_path):
+            for record in read_audit_records(path):
+                output.write(json.dumps(record, ensure_ascii=False) + '\n')
+            output.flush()
+            os.remove(path)
+
+
+def summarize_audit(output_path):
+    """Totals per site of an audit file. A URL that is in it twice (after a resume) counts once."""
+    counters = ('urls', 'noindex', 'blocked', 'redirected', 'not_ok', 'canonical_elsewhere', 'errors')
+    summary = dict.fromkeys(counters, 0)
+    summary['sites'] = {}
+    seen = set()
+    for record in read_audit_records(output_path):
+        if record['url'] in seen:
+            continue
+        seen.add(record['url'])
+        site = summary['sites'].setdefault(urlparse(record['url']).netloc, dict.fromkeys(counters, 0))
+        values = {
+            'urls': 1,
+            'noindex': bool(record.get('noindex')),
+            'blocked': record.get('robots_txt_allowed') is False,
+            'redirected': bool(record.get('redirect_chain')),
+            'not_ok': record.get('status') is not None and record['status'] >= 400,
+            'canonical_elsewhere': record.get('canonical_is_self') is False,
+            'errors': bool(record.get('error')),
+        }
+        for name, value in values.items():
+            summary[name] += value
+            site[name] += value
+    return summary
+
+
+def run_sharded_audit(sitemap_urls, output_path, workers=1, threads=4):
+    done = completed_urls(output_path)
+    if done:
+        print(f"Resuming audit, {len(done)} URLs are already in {output_path}.")
+
+    url_queues = [multiprocessing.Queue(maxsize=AUDIT_QUEUE_SIZE) for _ in range(workers)]
+    processes = [
+        multiprocessing.Process(target=audit_worker, name=f"audit-{index}",
+                                args=(url_queues[index], f"{output_path}.shard-{index}", threads))
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        queued = 0
+        for sitemap_url in sitemap_urls:
+            print(f"Processing sitemap: {sitemap_url}")
+            for page_url in fetch_urls_from_sitemap(sitemap_url):
+                if page_url in done:
+                    continue
+                done.add(page_url)
+                index = zlib.crc32(page_url.encode('utf-8')) % workers
+                put_url(url_queues[index], processes[index], (page_url, sitemap_url))
+                queued += 1
+        print(f"Queued {queued} URLs over {workers} workers.")
+
+        for url_queue, process in zip(url_queues, processes):
+            for _ in range(threads):
+                put_url(url_queue, process, None)
+        for process in processes:
+            process.join()
+    except BaseException as e:
+        for process in processes:
+            process.terminate()
+            process.join()
+        print(f"Audit stopped, run it again with the same output to resume: {output_path}")
+        if isinstance(e, KeyboardInterrupt):
+            raise SystemExit(130)
+        raise
+
+    merge_shards(output_path)
+    summary = summarize_audit(output_path)
+    summary_path = os.path.splitext(output_path)[0] + '.summary.json'
+    with open(summary_path, 'w', encoding='utf-8') as summary_file:
+        json.dump(summary, summary_file, ensure_ascii=False, indent=2)
+
+    print(f"Audited {summary['urls']} URLs: {summary['noindex']} noindex, {summary['blocked']} blocked by robots.txt, "
+          f"{summary['redirected']} redirected, {summary['errors']} errors. Summary: {summary_path}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the pages in sitemaps for noindex directives.")
+    parser.add_argument('sitemap_urls', nargs='*', help="Sitemap URLs, defaults to the SITEMAP_URLS environment variable")
+    parser.add_argument('--audit', action='store_true',
+                        help="Write a full indexability record per URL as JSON lines")
+    parser.add_argument('--output', help="JSONL file for the audit records, resumed when it exists (default: stdout)")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes for an audit with --output")
+    parser.add_argument('--threads', type=int, default=4, help="Fetching threads per worker process")
+    args = parser.parse_args(argv)
+    sitemap_urls = args.sitemap_urls or parse_env_urls('SITEMAP_URLS')
+    if args.workers < 1 or args.threads < 1:
+        parser.error("--workers and --threads have to be at least 1")
+
+    if args.audit:
+        if args.output:
+            run_sharded_audit(sitemap_urls, args.output, args.workers, args.threads)
+        else:
+            # Only the records go to stdout
+            output = sys.stdout
+            with contextlib.redirect_stdout(sys.stderr):
+                run_audit(sitemap_urls, output)
+        return
 
     for sitemap_url in sitemap_urls:
         print(f"Processing sitemap: {sitemap_url}")
@@ -87,7 +486,13 @@ if __name__ == "__main__":
         noindex_urls = []
 
         for page_url in page_urls:
-            if check_noindex_url(page_url):
+            with metrics_helper.timed('record', 'noindex_check'):
+                noindex = check_noindex_url(page_url)
+            if noindex:
                 noindex_urls.append(page_url)
 
-        print(f"Noindex URLs found: {noindex_urls}")
\ No newline at end of file
+        print(f"Noindex URLs found: {noindex_urls}")
+
+
+if __name__ == "__main__":
+    main()
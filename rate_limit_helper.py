@@ -0,0 +1,96 @@
+"""
+Script Name: Rate Limit Helper
+Description:
+    Small helper used by the other scripts to keep outbound API calls under a provider's
+    request rate. The RateLimiter spaces calls evenly so that at most `rate` calls start
+    per `period` seconds, and it is safe to share between the threads of a worker pool.
+
+    SharedRateLimiter does the same across processes: the next free slot of every named limit is
+    kept in a small SQLite file (RATE_LIMIT_DB, in the temp directory by default) and claimed in a
+    write transaction, so scripts that run at the same time from cron share one request rate
+    instead of each bursting at the full rate and all getting rate limited.
+       © [2025] [Boes Marie]. All rights reserved.
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB', os.path.join(tempfile.gettempdir(), 'seo_rate_limits.sqlite'))
+
+
+class RateLimiter:
+    def __init__(self, rate, period=1.0):
+        if rate <= 0:
+            raise ValueError("rate must be a positive number")
+        self.interval = period / rate
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        """Block until the caller is allowed to start its next call."""
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+
+        if wait > 0:
+            time.sleep(wait)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class SharedRateLimiter:
+    """A RateLimiter whose slots are shared by every process on the host that uses the same name."""
+
+    def __init__(self, name, rate, period=1.0, path=None):
+        if rate <= 0:
+            raise ValueError("rate must be a positive number")
+        self.name = name
+        self.interval = period / rate
+        self.path = path or RATE_LIMIT_DB
+        self._lock = threading.Lock()
+        # isolation_level=None so the transaction is started explicitly with BEGIN IMMEDIATE
+        self._connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS rate_limits (name TEXT PRIMARY KEY, next_slot REAL)")
+
+    def acquire(self):
+        """Block until the caller is allowed to start its next call."""
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock, so no other process claims the same slot
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(
+                    "SELECT next_slot FROM rate_limits WHERE name = ?", (self.name,)
+                ).fetchone()
+                now = time.time()
+                slot = max(now, row[0] if row else 0.0)
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO rate_limits (name, next_slot) VALUES (?, ?)",
+                    (self.name, slot + self.interval),
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
@@ -0,0 +1,256 @@
+"""
+Script Name: Resilience Helper
+Description:
+    Shared retry, backoff and circuit breaker layer for the outbound calls of all scripts
+    (OpenAI, Gemini, Airtable, WordPress, Medium, Graph API and plain page fetches).
+
+    - Rate limited (429) and transient server errors (5xx, timeouts, dropped connections) are
+      retried with jittered exponential backoff. A Retry-After header is honored, and a 429 pauses
+      every caller of the same endpoint until the Retry-After time has passed. A call asked to
+      wait longer than RETRY_MAX_RETRY_AFTER seconds (120 by default) fails instead.
+    - Every endpoint has a circuit breaker. After repeated server failures it opens and callers
+      wait for the reset timeout instead of hammering the failing service, after which a single
+      trial call decides whether the circuit closes again.
+    - Server errors are only retried for idempotent calls, so creating a post is never repeated
+      after a 5xx that may have been processed already. Rate limited calls are always retried.
+    - Every attempt is timed and recorded with metrics_helper.
+       © [2025] [Boes Marie]. All rights reserved.
+"""
+
+import functools
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+
+import metrics_helper
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', 5))
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+# Longest Retry-After that is honored, a call asked to wait longer fails instead
+MAX_RETRY_AFTER = float(os.getenv('RETRY_MAX_RETRY_AFTER', 120))
+# Longest a single call waits for an open circuit before giving up
+MAX_CIRCUIT_WAIT = 300.0
+
+# Connection level errors of the SDKs, matched by name so the SDKs are not imported here
+CONNECTION_ERROR_NAMES = {'APIConnectionError', 'APITimeoutError', 'ServiceUnavailable', 'DeadlineExceeded'}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class RetryableResponseError(Exception):
+    """Raised for a retryable HTTP response so it goes through the same retry logic as SDK errors."""
+
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code} from {response.url}")
+        self.response = response
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._throttled_until = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Return 0 when a call may go through now, otherwise the number of seconds to wait first."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._throttled_until:
+                return self._throttled_until - now
+            if self.state == self.OPEN:
+                remaining = self._opened_at + self.reset_timeout - now
+                if remaining > 0:
+                    return remaining
+                print(f"Circuit for {self.name} is half open, sending a trial call.")
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = True
+                return 0
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    return 1.0
+                self._trial_in_flight = True
+            return 0
+
+    def throttle(self, seconds):
+        """Hold back all callers of this endpoint, e.g. for the Retry-After time of a 429."""
+        with self._lock:
+            self._throttled_until = max(self._throttled_until, time.monotonic() + seconds)
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                print(f"Circuit for {self.name} is closed again.")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"Circuit for {self.name} is open after {self.failures} failures, "
+                          f"pausing calls for {self.reset_timeout:.0f}s.")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(endpoint):
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(endpoint)
+        return _breakers[endpoint]
+
+
+def status_code_of(error):
+    """HTTP status of a requests, OpenAI, Airtable or Google API error, or None."""
+    status = getattr(error, 'status_code', None)
+    if isinstance(status, int):
+        return status
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if isinstance(status, int):
+        return status
+    code = getattr(error, 'code', None)
+    return code if isinstance(code, int) else None
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header, which holds either seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def retry_after_of(error):
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    return parse_retry_after(headers.get('Retry-After') or headers.get('retry-after'))
+
+
+def is_connection_error(error):
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    return type(error).__name__ in CONNECTION_ERROR_NAMES
+
+
+def backoff_delay(attempt):
+    """Full jitter exponential backoff."""
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+
+
+def retrying(endpoint, func, idempotent=True, operation=None):
+    """
+    Wrap `func` so its calls go through the retry and circuit breaker logic of `endpoint`.
+    Example: retrying('openai', client.chat.completions.create)(model=..., messages=...)
+    """
+    breaker = get_breaker(endpoint)
+    operation = operation or getattr(func, '__name__', 'call')
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        attempt = 0
+        waited = 0.0
+        while True:
+            wait = breaker.acquire()
+            if wait > 0:
+                if waited + wait > MAX_CIRCUIT_WAIT:
+                    raise CircuitOpenError(f"Circuit for {endpoint} stayed open for more than {MAX_CIRCUIT_WAIT:.0f}s")
+                time.sleep(wait)
+                waited += wait
+                continue
+
+            start = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                status = status_code_of(e)
+                metrics_helper.record_call(endpoint, operation, time.monotonic() - start, ok=False, status=status)
+                if status != 429 and not (is_connection_error(e) or status in RETRYABLE_STATUS_CODES):
+                    # The service answered, the request itself was wrong
+                    breaker.record_success()
+                    raise
+
+                retry_after = retry_after_of(e)
+                if retry_after is not None and retry_after > MAX_RETRY_AFTER:
+                    # A bogus or far away Retry-After would hold up every caller of the endpoint
+                    if status != 429:
+                        breaker.record_failure()
+                    print(f"{endpoint} call failed ({status or type(e).__name__}), Retry-After of "
+                          f"{retry_after:.0f}s is more than {MAX_RETRY_AFTER:.0f}s, not retrying")
+                    raise
+                delay = retry_after or backoff_delay(attempt)
+                if status == 429:
+                    breaker.throttle(delay)
+                    retryable = True
+                else:
+                    breaker.record_failure()
+                    retryable = idempotent
+
+                attempt += 1
+                if not retryable or attempt >= MAX_ATTEMPTS:
+                    raise
+                print(f"{endpoint} call failed ({status or type(e).__name__}), "
+                      f"retrying in {delay:.1f}s (attempt {attempt + 1}/{MAX_ATTEMPTS})")
+                time.sleep(delay)
+                continue
+
+            metrics_helper.record_call(endpoint, operation, time.monotonic() - start)
+            breaker.record_success()
+            return result
+
+    return wrapper
+
+
+def request(method, url, endpoint=None, session=None, idempotent=None, **kwargs):
+    """
+    Send an HTTP request with retries. Returns the final response like requests does, so callers
+    can keep checking `response.ok`; only exhausted connection errors are raised.
+    """
+    endpoint = endpoint or urlparse(url).netloc
+    if idempotent is None:
+        idempotent = method.upper() not in ('POST', 'PATCH')
+    http = session or requests
+
+    def send():
+        response = http.request(method, url, **kwargs)
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            raise RetryableResponseError(response)
+        return response
+
+    try:
+        return retrying(endpoint, send, idempotent=idempotent, operation=method.upper())()
+    except RetryableResponseError as e:
+        return e.response
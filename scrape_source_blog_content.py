@@ -5,21 +5,41 @@ Description:
     storing new article URLs into an Airtable base. It then processes these stored URLs
     to fetch and update the article content in the Airtable records.
 
+    The post list is read straight from Naver's PostList.naver endpoint, page by page, newest
+    first. The newest logNo seen is kept in a crawl state file (NAVER_CRAWL_STATE), and the next
+    run stops at the first page whose oldest post reaches it (a pinned old post at the top does
+    not stop it), so a run only reads the pages with new posts.
+    Without a state file (or with --full) the crawl goes back to PUBLISH_DATE_CUTOFF.
+
+    Only the post body is stored as source_content_text: the post is read from its PostView page
+    (the content of the mainFrame iframe) and the text is taken from the SmartEditor container
+    (se-main-container, postViewArea of the old editor), or else from the block with the most
+    paragraph text, without navigation, comments and widgets. Paragraphs are separated by an empty line.
+
 Functions:
 - parse_date: Parses date strings from the blog articles, handling both relative and absolute dates.
-- fetch_latest_articles: Fetches the latest blog articles posted after a certain cutoff date.
+- crawl_new_articles: Pages through the post list until it reaches posts seen before or the cutoff date.
+- fetch_latest_articles: Fetches the blog articles posted since the last run and the new crawl state.
 - store_article_url_in_airtable: Stores new article URLs in Airtable if they do not already exist.
+- extract_post_text: Extracts the text of the post body from a Naver post page, paragraph by paragraph.
+- fetch_article_text: Fetches the PostView page of an article URL and returns the text of its body.
 - fetch_and_update_airtable: Retrieves URLs from Airtable, fetches their body content, and updates Airtable with the content.
    © [2025] [Boes Marie]. All rights reserved.
 """
+import argparse
+import json
 import os
 import requests
 from bs4 import BeautifulSoup
-from pyairtable import Api
+from lxml import etree, html
 from dotenv import load_dotenv, find_dotenv
 from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlparse
 import re
 
+import resilience_helper
+from airtable_helper import airtable_table
+
 # Load environment variables from .env file
 load_dotenv(find_dotenv())
 
@@ -30,9 +50,27 @@ TABLE_NAME = os.getenv('AIRTABLE_TABLE_NAME')
 
 # Naver Blog URL
 BLOG_URL = 'https://blog.naver.com/ntscafe'
+BLOG_ID = BLOG_URL.rstrip('/').rsplit('/', 1)[-1]
+POST_LIST_URL = 'https://blog.naver.com/PostList.naver'
+
+# Oldest posts picked up by a first run, later runs continue from the crawl state
+PUBLISH_DATE_CUTOFF = datetime.fromisoformat(os.getenv('PUBLISH_DATE_CUTOFF', '2024-12-04'))
+CRAWL_STATE_PATH = os.getenv('NAVER_CRAWL_STATE', 'naver_crawl_state.json')
+CRAWL_MAX_PAGES = 200
+
+POST_VIEW_URL = 'https://blog.naver.com/PostView.naver'
 
-# Define date to filter articles
-PUBLISH_DATE_CUTOFF = datetime(2024, 12, 4)
+# Post body containers of the Naver editors, newest first
+POST_BODY_XPATHS = [
+    "//div[contains(concat(' ', normalize-space(@class), ' '), ' se-main-container ')]",
+    "//div[@id='postViewArea']",
+    "//div[contains(concat(' ', normalize-space(@class), ' '), ' se_component_wrap ')]",
+]
+NOISE_XPATH = '//script | //style | //noscript | //iframe | //button | //select | //form | //comment()'
+BLOCK_TAGS = {'p', 'div', 'section', 'article', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'ul', 'ol',
+              'blockquote', 'pre', 'table', 'tr', 'figcaption', 'br'}
+# Paragraphs shorter than this are not counted by the density fallback
+MIN_PARAGRAPH_LENGTH = 25
 
 
 def parse_date(date_str):
@@ -52,36 +90,41 @@ def parse_date(date_str):
     raise ValueError(f"Unsupported date format: {date_str}")
 
 
-def fetch_latest_articles():
-    print("Fetching the blog page...")
-    response = requests.get(BLOG_URL)
-    if response.status_code != 200:
-        raise Exception("Failed to load blog page")
+def load_crawl_state(path=CRAWL_STATE_PATH):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as state_file:
+        state = json.load(state_file)
+    # A state file of another blog does not apply
+    return state if state.get('blog_id') == BLOG_ID else {}
 
-    soup = BeautifulSoup(response.content, 'html.parser')
 
-    # Get the iframe containing the blog posts
-    iframe_element = soup.find('iframe', id='mainFrame')
-    if not iframe_element:
-        raise Exception("Failed to find iframe containing blog posts")
+def save_crawl_state(state, path=CRAWL_STATE_PATH):
+    if not path:
+        return
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as state_file:
+        json.dump(state, state_file, ensure_ascii=False, indent=2)
+    os.replace(temporary_path, path)
 
-    # Correctly construct the iframe URL
-    iframe_src = iframe_element['src']
-    if 'http' not in iframe_src:
-        iframe_src = 'https://blog.naver.com' + iframe_src
 
-    print(f"Fetching the iframe content from: {iframe_src}")
-    iframe_response = requests.get(iframe_src)
-    if iframe_response.status_code != 200:
-        raise Exception("Failed to load iframe content")
+def log_no_of(url):
+    match = re.search(r'logNo=(\d+)', url) or re.search(r'/(\d{6,})(?:[/?#]|$)', url)
+    return int(match.group(1)) if match else None
 
-    iframe_soup = BeautifulSoup(iframe_response.content, 'html.parser')
 
-    # Find articles in iframe content
-    articles = iframe_soup.find_all('dd', class_='p_photo_d')
+def fetch_post_list_page(page):
+    """The posts on one page of the post list: (url, logNo, publish date), newest first."""
+    params = {'blogId': BLOG_ID, 'from': 'postList', 'categoryNo': 0, 'currentPage': page}
+    print(f"Fetching post list page {page}...")
+    response = resilience_helper.request('GET', POST_LIST_URL, endpoint='naver', params=params)
+    if response.status_code != 200:
+        raise Exception(f"Failed to load post list page {page}")
 
-    latest_articles = []
-    for article in articles:
+    soup = BeautifulSoup(response.content, 'html.parser')
+
+    posts = []
+    for article in soup.find_all('dd', class_='p_photo_d'):
         try:
             # Extract URL
             url_element = article.find('a')
@@ -91,31 +134,80 @@ def fetch_latest_articles():
             if not url.startswith('https://blog.naver.com'):
                 url = 'https://blog.naver.com' + url
 
-            # Avoid processing if URL points to "이벤트" category
-            if 'categoryNo=9' in url:
-                continue
-
             # Extract Date
             date_element = article.find('span', class_='pcol2 fil5')
             if not date_element:
                 continue
             date_str = date_element.get_text().strip()
-            publish_date = parse_date(date_str)
-
-            if publish_date > PUBLISH_DATE_CUTOFF:
-                latest_articles.append(url)
-                print(f"Article accepted - URL: {url}")
+            posts.append((url, log_no_of(url), parse_date(date_str)))
 
         except Exception as e:
             print(f"Error processing article: {e}")
 
-    return latest_articles
+    return posts
+
+
+def crawl_new_articles(state, cutoff=PUBLISH_DATE_CUTOFF, max_pages=CRAWL_MAX_PAGES):
+    """
+    Page through the post list until the oldest post of a page is from the previous crawl (or
+    older than the cutoff date on a first crawl). Returns the new article URLs and the updated
+    crawl state.
+    """
+    last_log_no = state.get('last_log_no')
+    newest_log_no = last_log_no or 0
+    latest_articles = []
+    previous_page = None
+
+    for page in range(1, max_pages + 1):
+        posts = fetch_post_list_page(page)
+        log_nos = [log_no for _, log_no, _ in posts]
+        # Past the last page Naver repeats it
+        if not posts or log_nos == previous_page:
+            break
+        previous_page = log_nos
+
+        # The whole page is checked, but only the oldest post of the page (the last one) decides
+        # whether to stop: a pinned old post at the top of the page is out of order
+        seen = False
+        for url, log_no, publish_date in posts:
+            newest_log_no = max(newest_log_no, log_no or 0)
+            if last_log_no is not None:
+                seen = log_no is not None and log_no <= last_log_no
+            else:
+                seen = publish_date <= cutoff
+            if seen:
+                continue
+
+            # Avoid processing if URL points to "이벤트" category
+            if 'categoryNo=9' in url:
+                continue
+            latest_articles.append(url)
+            print(f"Article accepted - URL: {url}")
+
+        if seen:
+            break
+    else:
+        print(f"Stopped after {max_pages} pages of the post list.")
+
+    new_state = dict(state, blog_id=BLOG_ID, last_crawl=datetime.now().isoformat(timespec='seconds'))
+    if newest_log_no:
+        new_state['last_log_no'] = newest_log_no
+    return latest_articles, new_state
+
+
+def fetch_latest_articles(state_path=CRAWL_STATE_PATH):
+    """The articles posted since the previous crawl and the new crawl state.
+
+    The state is not saved here: the caller saves it with save_crawl_state once every article is
+    stored, otherwise an article that failed would be behind the saved state and never found again.
+    """
+    return crawl_new_articles(load_crawl_state(state_path))
 
 
 def store_article_url_in_airtable(article_url):
+    """Store a new article URL. Returns False when Airtable could not be updated."""
     try:
-        api = Api(AIRTABLE_API_KEY)
-        table = api.table(BASE_ID, TABLE_NAME)
+        table = airtable_table(AIRTABLE_API_KEY, BASE_ID, TABLE_NAME)
 
         # Check if the URL already exists in the table
         match = table.first(formula=f"{{source_content_url}} = '{article_url}'")
@@ -126,16 +218,101 @@ def store_article_url_in_airtable(article_url):
             new_record = {'source_content_url': article_url}
             table.create(new_record)
             print(f"Stored new article URL: {article_url}")
+        return True
 
     except Exception as e:
         print(f"Error storing article URL in Airtable: {e}")
+        return False
+
+
+def post_view_url(article_url):
+    """The PostView URL of a post, whose page has the post itself instead of the blog frame."""
+    parsed = urlparse(article_url)
+    query = parse_qs(parsed.query)
+    blog_id = (query.get('blogId') or [None])[0]
+    log_no = (query.get('logNo') or [None])[0]
+    if not (blog_id and log_no):
+        # https://blog.naver.com/<blogId>/<logNo>
+        match = re.match(r'/([\w-]+)/(\d+)', parsed.path)
+        if not match:
+            return article_url
+        blog_id, log_no = match.groups()
+    return f"{POST_VIEW_URL}?blogId={blog_id}&logNo={log_no}&redirect=Dlog&widgetTypeCall=true&directAccess=false"
+
+
+def block_text(element):
+    """Text of an element with an empty line between its paragraphs (block elements)."""
+    for block in element.iter(*BLOCK_TAGS):
+        block.tail = '\n' + (block.tail or '')
+        if block.tag != 'br':
+            block.text = '\n' + (block.text or '')
+
+    paragraphs = []
+    previous_empty = True
+    for line in element.text_content().replace('\u200b', '').split('\n'):
+        line = ' '.join(line.split())
+        if line:
+            paragraphs.append(line)
+            previous_empty = False
+        elif not previous_empty:
+            paragraphs.append('')
+            previous_empty = True
+    return '\n'.join(paragraphs).strip()
+
+
+def densest_block(tree):
+    """
+    The element with the most paragraph text, readability style: every paragraph scores for its
+    parent and half for its grandparent, less the share of it that is link text.
+    """
+    scores = {}
+    for paragraph in tree.iter('p', 'td', 'pre', 'li', 'span'):
+        text = ' '.join(paragraph.text_content().split())
+        if len(text) < MIN_PARAGRAPH_LENGTH:
+            continue
+        link_length = sum(len(link.text_content()) for link in paragraph.iter('a'))
+        score = (1 + text.count(',') + min(len(text) // 100, 3)) * (1 - link_length / len(text))
+        parent = paragraph.getparent()
+        if parent is not None:
+            scores[parent] = scores.get(parent, 0) + score
+            grandparent = parent.getparent()
+            if grandparent is not None:
+                scores[grandparent] = scores.get(grandparent, 0) + score / 2
+    return max(scores, key=scores.get) if scores else None
+
+
+def extract_post_text(content, encoding=None):
+    """Text of the post body in a Naver post page, falling back to the whole page."""
+    parser = html.HTMLParser(encoding=encoding) if encoding else None
+    tree = html.document_fromstring(content, parser=parser)
+    for noise in tree.xpath(NOISE_XPATH):
+        noise.drop_tree()
+
+    for xpath in POST_BODY_XPATHS:
+        containers = tree.xpath(xpath)
+        if containers:
+            return '\n\n'.join(filter(None, (block_text(container) for container in containers)))
+
+    container = densest_block(tree)
+    if container is None:
+        container = tree.find('body') if tree.find('body') is not None else tree
+    return block_text(container)
+
+
+def fetch_article_text(article_url):
+    # The PostView page has the post without the blog frame around it
+    response = resilience_helper.request('GET', post_view_url(article_url), endpoint='naver')
+    response.raise_for_status()
+    # Without a charset in the header requests assumes ISO-8859-1 for text/html, which would
+    # override the <meta charset> of the page, so lxml only gets an encoding the server declared
+    charset = re.search(r'charset=["\']?([\w.:-]+)', response.headers.get('Content-Type', ''), re.I)
+    return extract_post_text(response.content, charset.group(1) if charset else None)
 
 
 def fetch_and_update_airtable():
     try:
-        # Initialize Airtable API and table connection
-        api = Api(AIRTABLE_API_KEY)
-        table = api.table(BASE_ID, TABLE_NAME)
+        # Initialize Airtable table connection
+        table = airtable_table(AIRTABLE_API_KEY, BASE_ID, TABLE_NAME)
 
         # Fetch records from Airtable
         formula = "AND(NOT({source_content_url} = ''), OR({source_content_text} = '', {source_content_text} = BLANK()))"
@@ -152,20 +329,14 @@ def fetch_and_update_airtable():
                 print(f"Processing URL: {source_content_url}")
 
                 try:
-                    # Fetch the content from the URL
-                    response = requests.get(source_content_url)
-                    response.raise_for_status()
-                    html_content = response.content
-
-                    # Parse the HTML content using BeautifulSoup
-                    soup = BeautifulSoup(html_content, 'html.parser')
-                    scraped_text = soup.get_text(separator=' ', strip=True)
+                    scraped_text = fetch_article_text(source_content_url)
 
                     # Store the scraped content back into Airtable
                     table.update(record['id'], {'source_content_text': scraped_text})
                     print("Content updated successfully.")
 
-                except requests.exceptions.RequestException as e:
+                except (requests.exceptions.RequestException, etree.LxmlError) as e:
+                    # lxml raises ParserError on an empty page
                     print(f"Failed to retrieve or parse content from {source_content_url}: {e}")
 
         print("Completed processing all records.")
@@ -174,11 +345,25 @@ def fetch_and_update_airtable():
         print(f"Error: {e}")
 
 
-if __name__ == '__main__':
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch new Naver blog articles and store their content in Airtable.")
+    parser.add_argument('--state', default=CRAWL_STATE_PATH, help="Crawl state file (default: %(default)s)")
+    parser.add_argument('--full', action='store_true',
+                        help="Ignore the crawl state and go back to the cutoff date")
+    parser.add_argument('--cutoff', type=datetime.fromisoformat, default=PUBLISH_DATE_CUTOFF,
+                        help="Oldest publish date of a crawl without state, YYYY-MM-DD")
+    args = parser.parse_args(argv)
     try:
-        latest_articles = fetch_latest_articles()
-        for article_url in latest_articles:
-            store_article_url_in_airtable(article_url)
+        state = {} if args.full else load_crawl_state(args.state)
+        latest_articles, new_state = crawl_new_articles(state, cutoff=args.cutoff)
+        stored = [store_article_url_in_airtable(article_url) for article_url in latest_articles]
+        # Keep the old state when a URL was not stored, so the next run finds it again
+        if all(stored):
+            save_crawl_state(new_state, args.state)
         fetch_and_update_airtable()
     except Exception as e:
-        print(f"Error: {e}")
\ No newline at end of file
+        print(f"Error: {e}")
+
+
+if __name__ == '__main__':
+    main()
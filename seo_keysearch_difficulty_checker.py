@@ -1,18 +1,138 @@
+"""
+Script Name: SEO Keysearch Difficulty Checker
+Description:
+    This script looks up keyword difficulty, volume and CPC data with the Keysearch API and
+    reports the keywords sorted by difficulty score. Keywords can be passed in bulk from a CSV
+    research sheet: they are normalized and de-duplicated, looked up in a local cache first and
+    only new or stale keywords are queried, with bounded concurrency and a rate limiter.
+    Freshly fetched results are appended with declared dtypes to a Parquet dataset partitioned
+    by run date, which keeps historical trend queries fast, and the report is rendered headless
+    to PNG and HTML files so the script can run unattended from cron.
+       © [2025] [Boes Marie]. All rights reserved.
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
 import pandas as pd
 from dotenv import load_dotenv
-import os
+
+import resilience_helper
+from rate_limit_helper import RateLimiter
 
 load_dotenv()
 
 api_key = os.getenv('KEYSEARCH_API_KEY')
 base_url = 'https://www.keysearch.co/api'
 
+# Difficulty scores hardly move week to week, so cached results are reused for a week
+CACHE_PATH = os.getenv('KEYSEARCH_CACHE_PATH', 'keyword_cache.sqlite')
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# Columnar keyword history, partitioned by the date of the run that fetched the result
+DATASET_PATH = os.getenv('KEYWORD_DATASET_PATH', 'keyword_data')
+REPORT_PATH = os.getenv('KEYWORD_REPORT_PATH', 'keyword_report')
+KEYWORD_DTYPES = {
+    'keyword': 'string',
+    'score': 'float64',
+    'volume': 'float64',
+    'cpc': 'float64',
+    'ppc': 'float64',
+}
+NUMERIC_COLUMNS = [column for column, dtype in KEYWORD_DTYPES.items() if dtype == 'float64']
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_REQUESTS_PER_SECOND = 2
+
+keywords = ["rhinoplasty dermal graft", "What are grafts in rhinoplasty"]
+
+
+class KeywordCache:
+    """Persistent keyword result cache with a time to live, stored in SQLite."""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS keyword_cache ("
+            " keyword TEXT PRIMARY KEY, data TEXT NOT NULL, fetched_at REAL NOT NULL)"
+        )
+
+    def get_fresh(self, keywords):
+        """Return {keyword: data} for the given keywords that are cached and not stale."""
+        oldest = time.time() - self.ttl
+        fresh = {}
+        keywords = list(keywords)
+        # Stay well below SQLite's limit on bound parameters
+        for start in range(0, len(keywords), 500):
+            chunk = keywords[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.connection.execute(
+                f"SELECT keyword, data FROM keyword_cache"
+                f" WHERE keyword IN ({placeholders}) AND fetched_at >= ?",
+                (*chunk, oldest)
+            )
+            fresh.update((keyword, json.loads(data)) for keyword, data in rows)
+        return fresh
+
+    def set(self, keyword, data):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO keyword_cache (keyword, data, fetched_at) VALUES (?, ?, ?)",
+                (keyword, json.dumps(data), time.time())
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+def normalize_keyword(keyword):
+    return re.sub(r'\s+', ' ', keyword).strip().lower()
+
+
+def unique_keywords(raw_keywords):
+    """Normalize keywords and drop empty values and duplicates, keeping the first occurrence order."""
+    seen = set()
+    result = []
+    for keyword in raw_keywords:
+        normalized = normalize_keyword(keyword)
+        if normalized and normalized not in seen:
+            seen.add(normalized)
+            result.append(normalized)
+    return result
+
+
+def read_keywords_csv(csv_path, column='keyword'):
+    """Stream keywords from a CSV file, using the `column` header or else the first column."""
+    with open(csv_path, newline='', encoding='utf-8-sig') as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader, None)
+        if header is None:
+            return
+        normalized_header = [name.strip().lower() for name in header]
+        if column in normalized_header:
+            index = normalized_header.index(column)
+        else:
+            # No matching header, so the first row is a keyword as well
+            index = 0
+            yield header[0]
+        for row in reader:
+            if len(row) > index:
+                yield row[index]
+
 
-def get_keyword_data(keyword):
-    endpoint = f"{base_url}?key={api_key}&difficulty={keyword}&cr=all"
+def get_keyword_data(keyword, session=None):
     try:
-        response = requests.get(endpoint)
+        response = resilience_helper.request('GET', base_url, endpoint='keysearch', session=session,
+                                             params={'key': api_key, 'difficulty': keyword, 'cr': 'all'})
         response.raise_for_status()
         try:
             data = response.json()
@@ -26,36 +146,149 @@ def get_keyword_data(keyword):
         return None
 
 
-keywords = ["rhinoplasty dermal graft", "What are grafts in rhinoplasty"]
+def fetch_keywords_bulk(raw_keywords, concurrency=DEFAULT_CONCURRENCY,
+                        requests_per_second=DEFAULT_REQUESTS_PER_SECOND, cache_path=CACHE_PATH,
+                        ttl=CACHE_TTL_SECONDS):
+    """
+    Return Keysearch results for the keywords, only querying keywords that are new or stale.
+    The second list holds the results that were fetched during this call.
+    """
+    keyword_list = unique_keywords(raw_keywords)
+    cache = KeywordCache(cache_path, ttl)
+    fetched = []
+    try:
+        results = cache.get_fresh(keyword_list)
+        to_query = [keyword for keyword in keyword_list if keyword not in results]
+        print(f"{len(keyword_list)} unique keywords: {len(results)} cached, {len(to_query)} to query.")
+
+        if to_query:
+            limiter = RateLimiter(requests_per_second)
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+            session.mount('https://', adapter)
+
+            def query(keyword):
+                limiter.acquire()
+                return get_keyword_data(keyword, session=session)
+
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = {executor.submit(query, keyword): keyword for keyword in to_query}
+                for future in as_completed(futures):
+                    keyword = futures[future]
+                    result = future.result()
+                    if result:
+                        result.setdefault('keyword', keyword)
+                        print(f"Result for {keyword}: {result}")
+                        cache.set(keyword, result)
+                        results[keyword] = result
+                        fetched.append(result)
+    finally:
+        cache.close()
+
+    return [results[keyword] for keyword in keyword_list if keyword in results], fetched
+
+
+def to_keyword_frame(data):
+    """Build a DataFrame with the declared dtypes from raw Keysearch results."""
+    df = pd.DataFrame.from_records(data, columns=list(KEYWORD_DTYPES))
+    df[NUMERIC_COLUMNS] = df[NUMERIC_COLUMNS].apply(pd.to_numeric, errors='coerce')
+    return df.astype(KEYWORD_DTYPES)
+
+
+def append_to_dataset(df, dataset_path=DATASET_PATH):
+    """Append rows to the Parquet dataset, adding a new file to today's run_date partition."""
+    checked_at = datetime.now(timezone.utc)
+    df = df.assign(checked_at=checked_at, run_date=checked_at.strftime('%Y-%m-%d'))
+    df.to_parquet(dataset_path, partition_cols=['run_date'], index=False)
+    print(f"Appended {len(df)} rows to {dataset_path}")
+
 
-data = []
-for keyword in keywords:
-    result = get_keyword_data(keyword)
-    if result:
-        print(f"Result for {keyword}: {result}")
-        data.append(result)
+def load_keyword_history(dataset_path=DATASET_PATH, keywords=None, since=None):
+    """
+    Read historical results from the dataset. Filtering on `since` (YYYY-MM-DD) prunes whole
+    run_date partitions and filtering on `keywords` is pushed down to the Parquet reader.
+    """
+    if not os.path.exists(dataset_path):
+        return to_keyword_frame([])
+    filters = []
+    if since:
+        filters.append(('run_date', '>=', since))
+    if keywords:
+        filters.append(('keyword', 'in', list(keywords)))
+    return pd.read_parquet(dataset_path, filters=filters or None)
 
-if data:
-    df = pd.DataFrame(data)
-    df['cpc'] = pd.to_numeric(df['cpc'], errors='coerce')
-    df['ppc'] = pd.to_numeric(df['ppc'], errors='coerce')
-    df['volume'] = pd.to_numeric(df['volume'], errors='coerce')
-    df['score'] = pd.to_numeric(df['score'], errors='coerce')
 
-    print(df.head())
+def keyword_trend(history, value='score'):
+    """Pivot history into one row per keyword and one column per run date."""
+    history = history.assign(run_date=history['run_date'].astype('string'))
+    return history.pivot_table(index='keyword', columns='run_date', values=value, aggfunc='last')
+
+
+def render_report(df, report_path=REPORT_PATH, top=50):
+    """Render the difficulty chart to PNG with the Agg backend and write an HTML report next to it."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
 
     sorted_df = df.sort_values(by='score', ascending=False)
-    print("Sorted by score:")
-    print(sorted_df)
+    df_plot = sorted_df.head(top).sort_values(by='score', ascending=True)
+
+    fig, ax = plt.subplots(figsize=(10, max(6, len(df_plot) * 0.25)))
+    ax.barh(df_plot['keyword'], df_plot['score'])
+    ax.set_xlabel('Score')
+    ax.set_title('Keyword Difficulty Scores')
+    fig.tight_layout()
+    png_path = f"{report_path}.png"
+    fig.savefig(png_path)
+    plt.close(fig)
+
+    html_path = f"{report_path}.html"
+    with open(html_path, 'w', encoding='utf-8') as html_file:
+        html_file.write(
+            "<html><head><meta charset='utf-8'><title>Keyword Difficulty Scores</title></head><body>"
+            f"<h1>Keyword Difficulty Scores</h1><img src='{os.path.basename(png_path)}'>"
+            f"{sorted_df.to_html(index=False, na_rep='')}</body></html>"
+        )
+    print(f"Report written to {png_path} and {html_path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check Keysearch keyword difficulty scores.")
+    parser.add_argument('--csv', help="CSV file with keywords, read from the 'keyword' column or the first column")
+    parser.add_argument('--column', default='keyword', help="CSV column holding the keywords")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--rate', type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                        help="Maximum Keysearch requests per second")
+    parser.add_argument('--cache', default=CACHE_PATH, help="Path of the SQLite result cache")
+    parser.add_argument('--ttl-days', type=float, default=CACHE_TTL_SECONDS / 86400,
+                        help="Days before a cached result is queried again")
+    parser.add_argument('--dataset', default=DATASET_PATH, help="Directory of the Parquet keyword dataset")
+    parser.add_argument('--report', default=REPORT_PATH, help="Report path without extension (.png and .html)")
+    parser.add_argument('--plot-top', type=int, default=50, help="Number of hardest keywords to plot")
+    parser.add_argument('--trend', action='store_true', help="Print the score history of the keywords")
+    parser.add_argument('--since', help="Only include history from this run date on (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    raw_keywords = read_keywords_csv(args.csv, args.column.lower()) if args.csv else keywords
+    data, fetched = fetch_keywords_bulk(raw_keywords, concurrency=args.concurrency, requests_per_second=args.rate,
+                                        cache_path=args.cache, ttl=args.ttl_days * 86400)
+
+    if fetched:
+        append_to_dataset(to_keyword_frame(fetched), args.dataset)
+
+    if data:
+        df = to_keyword_frame(data)
+
+        print("Sorted by score:")
+        print(df.sort_values(by='score', ascending=False))
 
-    df.to_csv('keyword_data.csv', index=False)
+        if args.trend:
+            history = load_keyword_history(args.dataset, keywords=df['keyword'].tolist(), since=args.since)
+            print("Score trend by run date:")
+            print(keyword_trend(history))
 
+        render_report(df, args.report, top=args.plot_top)
 
-import matplotlib.pyplot as plt
 
-plt.figure(figsize=(10, 6))
-df_sorted = df.sort_values(by='score', ascending=True)
-plt.barh(df_sorted['keyword'], df_sorted['score'])
-plt.xlabel('Score')
-plt.title('Keyword Difficulty Scores')
-plt.show()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
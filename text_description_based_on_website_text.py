@@ -11,16 +11,27 @@ Description:
        using predefined skip words.
     3. Content Generation: Utilizes OpenAI's API to create detailed, bullet-pointed descriptions for company profiles.
     4. Updating Records: Updates Airtable records with newly generated content, enriching each company's details.
+
+    Before any tokens are spent the scraped text goes through a cheap local gate: it needs enough
+    distinct words, mostly Korean or Latin letters, and little boilerplate, and short pages with
+    parked domain or placeholder phrases are rejected. Every failure (no content, rejected by the gate, generation
+    error, sample content in the result) is stored on the record in `descriptionStatus` and
+    `descriptionError`, and `descriptionAttempts` is increased. Records that failed
+    --max-attempts times are not picked up again.
            © [2025] [Boes Marie]. All rights reserved.
 """
 
+import argparse
 import os
-import requests
+import re
 from bs4 import BeautifulSoup
-from pyairtable import Api
 from openai import OpenAI
 from dotenv import load_dotenv
 
+import metrics_helper
+import resilience_helper
+from airtable_helper import airtable_table
+
 # Load environment variables
 load_dotenv()
 airtable_api_key = os.getenv('AIRTABLE_API_KEY')
@@ -28,15 +39,95 @@ openai_api_key = os.getenv('OPENAI_API_KEY')
 base_id = os.getenv('AIRTABLE_BASE_ID')
 table_name = os.getenv('AIRTABLE_TABLE_NAME')
 
-# Set up APIs
-airtable_sdk = Api(airtable_api_key)
-
 # Words to skip when parsing text
 SKIP_WORDS = [
     'copyright', '사업자', '대표', 'whatsapp', 'facebook', 'kakao',
     'e-mail', 'email', '+82-'
 ]
 
+# Check for sample content keywords
+SAMPLE_CONTENT_KEYWORDS = ['example', 'sample', '#', 'certainly']
+
+MAX_ATTEMPTS = int(os.getenv('DESCRIPTION_MAX_ATTEMPTS', 3))
+
+# Content gate
+MIN_DISTINCT_WORDS = 40
+MIN_LETTER_RATIO = 0.5
+MIN_KNOWN_SCRIPT_RATIO = 0.8
+MAX_BOILERPLATE_RATIO = 0.3
+# The parked and placeholder patterns only count on short pages: a real company site can well
+# say "new product coming soon" somewhere in its text
+PARKED_MAX_DISTINCT_WORDS = MIN_DISTINCT_WORDS * 2
+PARKED_PATTERNS = [
+    'domain is for sale', 'buy this domain', 'domain may be for sale', 'this domain is parked',
+    'parked free', 'hugedomains', 'sedo.com', 'dan.com', 'under construction', 'coming soon',
+    'account suspended', 'default web page', 'it works!', 'index of /', 'welcome to nginx',
+    '도메인 판매', '도메인을 구매', '도메인이 만료', '서비스 준비중', '사이트 준비중', '호스팅 기간이 만료',
+]
+BOILERPLATE_WORDS = {
+    'cookie', 'cookies', 'privacy', 'policy', 'terms', 'login', 'sign', 'menu', 'home', 'search',
+    'javascript', 'browser', 'subscribe', 'newsletter', 'sitemap', 'copyright', 'rights', 'reserved',
+    '로그인', '회원가입', '개인정보처리방침', '개인정보', '이용약관', '검색', '메뉴', '홈', '사이트맵',
+}
+HANGUL = re.compile(r'[\uac00-\ud7a3\u1100-\u11ff\u3130-\u318f]')
+LATIN = re.compile(r'[A-Za-z]')
+
+
+def score_content(text):
+    """
+    Cheap checks of scraped text before it is sent to GPT. Returns the reasons to reject it
+    (an empty list when it passes) and the measured values.
+    """
+    lowered = text.lower()
+    words = re.findall(r'\w+', lowered)
+    distinct_words = set(words)
+    letters = [char for char in text if char.isalpha()]
+    visible = [char for char in text if not char.isspace()]
+    known_script = sum(1 for char in letters if HANGUL.match(char) or LATIN.match(char))
+
+    scores = {
+        'length': len(text),
+        'distinct_words': len(distinct_words),
+        'letter_ratio': round(len(letters) / len(visible), 3) if visible else 0.0,
+        'known_script_ratio': round(known_script / len(letters), 3) if letters else 0.0,
+        'boilerplate_ratio': round(len(distinct_words & BOILERPLATE_WORDS) / len(distinct_words), 3)
+        if distinct_words else 0.0,
+    }
+
+    reasons = []
+    parked = [pattern for pattern in PARKED_PATTERNS if pattern in lowered]
+    if parked and scores['distinct_words'] < PARKED_MAX_DISTINCT_WORDS:
+        reasons.append(f"parked or placeholder page ({parked[0]})")
+    if scores['distinct_words'] < MIN_DISTINCT_WORDS:
+        reasons.append(f"too little text ({scores['distinct_words']} distinct words)")
+    if scores['letter_ratio'] < MIN_LETTER_RATIO:
+        reasons.append(f"mostly numbers or symbols (letter ratio {scores['letter_ratio']})")
+    if letters and scores['known_script_ratio'] < MIN_KNOWN_SCRIPT_RATIO:
+        reasons.append(f"unexpected script or garbled text (Korean/Latin ratio {scores['known_script_ratio']})")
+    if scores['boilerplate_ratio'] > MAX_BOILERPLATE_RATIO:
+        reasons.append(f"mostly boilerplate (ratio {scores['boilerplate_ratio']})")
+    return reasons, scores
+
+
+def mark_failure(table, company, status, error, max_attempts=MAX_ATTEMPTS):
+    """Store why a record failed and count the attempt, so it is retried at most max_attempts times."""
+    attempts = (company['fields'].get('descriptionAttempts') or 0) + 1
+    table.update(company['id'], {
+        'descriptionStatus': status,
+        'descriptionError': error,
+        'descriptionAttempts': attempts,
+    })
+    final = ' No more retries.' if attempts >= max_attempts else ''
+    print(f"Marked {company['fields'].get('name', company['id'])} as {status} (attempt {attempts}): {error}.{final}")
+
+
+def pending_companies_formula(max_attempts=MAX_ATTEMPTS):
+    return (
+        "AND({introduction} = '', {siteUrl} != '', "
+        f"OR({{descriptionAttempts}} = BLANK(), {{descriptionAttempts}} < {int(max_attempts)}))"
+    )
+
+
 def parent_contains_skip_word(parent, skip_words):
     """Check if any parent element contains a skip word in its ID or class."""
     if parent.parent:
@@ -54,7 +145,7 @@ def parent_contains_skip_word(parent, skip_words):
 def get_text(link, skip_words):
     """Extract relevant text from a webpage, excluding elements with skip words."""
     try:
-        html = requests.get(link).text
+        html = resilience_helper.request('GET', link).text
     except Exception as e:
         print(f"Error fetching URL {link}: {e}")
         return ""
@@ -72,7 +163,8 @@ def get_text(link, skip_words):
 
 def generate_text(api_key, prompt, text, topic):
     """Generate AI-assisted text using OpenAI's API."""
-    client = OpenAI(api_key=api_key)
+    # Retries are handled by resilience_helper
+    client = OpenAI(api_key=api_key, max_retries=0)
 
     message = [
         {"role": "assistant", "content": prompt},
@@ -80,21 +172,26 @@ def generate_text(api_key, prompt, text, topic):
     ]
 
     try:
-        response = client.chat.completions.create(
+        response = resilience_helper.retrying('openai', client.chat.completions.create)(
             model="gpt-4o",
             messages=message,
             temperature=1,
             max_tokens=4095,
             frequency_penalty=0.0
         )
+        metrics_helper.record_llm_usage('openai', "gpt-4o", response)
         return response.choices[0].message.content
     except Exception as e:
         print(f"OpenAI API error for topic {topic}: {e}")
         return ""
 
-def main():
-    company_table = airtable_sdk.table(base_id, table_name)
-    company = company_table.all(formula="AND(NOT({introduction} != ''), {siteUrl} != ''))")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate company introductions from the text of their websites.")
+    parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                        help="Failed attempts after which a record is no longer picked up")
+    args = parser.parse_args(argv)
+    company_table = airtable_table(airtable_api_key, base_id, table_name)
+    company = company_table.all(formula=pending_companies_formula(args.max_attempts))
 
     count = 0
     for company in company:
@@ -104,11 +201,20 @@ def main():
 
         print(f'Processing company: {company_name}, URL: {url}')
 
-        content = get_text(link=url, skip_words=SKIP_WORDS)
+        # Scraping includes the HTML parsing, so this shows whether a run is bound by scraping or by GPT
+        with metrics_helper.timed('stage', 'scrape'):
+            content = get_text(link=url, skip_words=SKIP_WORDS)
 
         if not content:
             print(f'No content found, skipping company: {company_name}')
-            company_table.update(company['id'], {'introduction': 'SKIPPING'})
+            mark_failure(company_table, company, 'NO_CONTENT', 'no text found on the website', args.max_attempts)
+            continue
+
+        # Parked domains and placeholder pages are rejected before any tokens are spent
+        reasons, scores = score_content(content)
+        if reasons:
+            print(f'Content of {company_name} rejected by the gate: {scores}')
+            mark_failure(company_table, company, 'REJECTED_CONTENT', '; '.join(reasons), args.max_attempts)
             continue
 
         prompt = (
@@ -119,16 +225,23 @@ def main():
             "(Do not use the words 'likely', 'possibly', and any synonyms of those words)"
         )
 
-        result = generate_text(api_key=openai_api_key, prompt=prompt, text=content, topic=company_name)
+        with metrics_helper.timed('stage', 'generate'):
+            result = generate_text(api_key=openai_api_key, prompt=prompt, text=content, topic=company_name)
+
+        if not result:
+            mark_failure(company_table, company, 'GENERATION_FAILED', 'no answer from OpenAI', args.max_attempts)
+            continue
 
-        # Check for sample content keywords
-        SAMPLE_CONTENT_KEYWORDS = ['example', 'sample', '#', 'certainly']
-        if any(word in result for word in SAMPLE_CONTENT_KEYWORDS):
+        sample_keywords = [word for word in SAMPLE_CONTENT_KEYWORDS if word in result]
+        if sample_keywords:
             print(f'Result for {company_name} failed due to sample keyword, skipping.')
+            mark_failure(company_table, company, 'SAMPLE_CONTENT',
+                         f"sample keywords in the result: {', '.join(sample_keywords)}", args.max_attempts)
             continue
 
         # Store result in Airtable
-        company_table.update(company['id'], {'introduction': result})
+        company_table.update(company['id'], {'introduction': result, 'descriptionStatus': 'DONE',
+                                             'descriptionError': None})
         print(f"Processed and updated company: {company_name}")
 
         count += 1
@@ -136,4 +249,4 @@ def main():
             break
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -7,15 +7,30 @@ Description:
     meeting these criteria, the script selects a random image from a predefined list to be
     used as the featured image on WordPress. The article's publication status is set to
     "future" if a specific schedule date is provided; otherwise, it is published immediately.
+
+    With --bulk the articles are sent through the WordPress batch endpoint (/wp-json/batch/v1,
+    WordPress 5.6+) with up to 25 posts per request. Every sub-response is mapped back to its
+    Airtable record: the published records are updated in Airtable batches, a failed post leaves
+    its record READY_TO_PUBLISH for the next run.
+
+    Published records keep a hash of their title and HTML in `wp_content_hash`. With --sync the
+    PUBLISHED records are compared with it and only the posts whose title or HTML changed are
+    updated, with just the changed fields, through the same batch endpoint. Records without a hash
+    (published before it was kept) only get their hash stored as the baseline on the first --sync,
+    and --sync --record-only stores the current hash of every record without updating WordPress.
            © [2025] [Boes Marie]. All rights reserved.
 """
+import argparse
+import hashlib
 import os
 import random
 from datetime import datetime
-import requests
-from pyairtable import Api
 from dotenv import load_dotenv, find_dotenv
 
+import metrics_helper
+import resilience_helper
+from airtable_helper import AIRTABLE_MIRROR_PATH, NOT_BLANK, AirtableBatchWriter, AirtableMirror, airtable_table
+
 # Load environment variables from .env file
 load_dotenv(find_dotenv())
 
@@ -23,19 +38,31 @@ load_dotenv(find_dotenv())
 AIRTABLE_API_KEY = os.getenv('AIRTABLE_API_KEY')
 AIRTABLE_BASE_ID = os.getenv('AIRTABLE_BASE_ID')
 AIRTABLE_TABLE_NAME = os.getenv('AIRTABLE_TABLE_NAME')
-WORDPRESS_SITE_URL = 'XXXX'
+WORDPRESS_SITE_URL = os.getenv('WORDPRESS_SITE_URL', 'XXXX')
 WORDPRESS_APP_USERNAME = os.getenv('WORDPRESS_APP_USERNAME')
 WORDPRESS_APP_PASSWORD = os.getenv('WORDPRESS_APP_PASSWORD')
 
+# The batch endpoint accepts at most 25 requests per call
+WORDPRESS_BATCH_SIZE = 25
+
 # List of WordPress Media IDs
 WORDPRESS_MEDIA_IDS = [395, 394, 393, 392, 391, 390, 389, 388]
 
-# Initialize Airtable API
-airtable_api = Api(AIRTABLE_API_KEY)
 
+def get_table():
+    return airtable_table(AIRTABLE_API_KEY, AIRTABLE_BASE_ID, AIRTABLE_TABLE_NAME)
 
-def fetch_ready_articles():
-    table = airtable_api.table(AIRTABLE_BASE_ID, AIRTABLE_TABLE_NAME)
+
+def open_mirror(path):
+    mirror = AirtableMirror(get_table(), path)
+    mirror.sync()
+    return mirror
+
+
+def fetch_ready_articles(mirror=None):
+    if mirror:
+        return mirror.select(state='READY_TO_PUBLISH')
+    table = get_table()
     records = table.all(view='Grid view', formula="state = 'READY_TO_PUBLISH'")
     return records
 
@@ -45,7 +72,7 @@ def get_random_image_name():
     return random.choice(WORDPRESS_MEDIA_IDS)
 
 
-def publish_to_wordpress(title, content, image_id, schedule_date):
+def build_post_data(title, content, image_id, schedule_date):
     post_data = {
         'title': title,
         'content': content,
@@ -54,11 +81,22 @@ def publish_to_wordpress(title, content, image_id, schedule_date):
     }
     if schedule_date:
         post_data['date'] = schedule_date.isoformat()
+    return post_data
 
+
+def publish_to_wordpress(title, content, image_id, schedule_date):
+    return create_post(build_post_data(title, content, image_id, schedule_date))
+
+
+def create_post(post_data, wp_id=None):
+    """Create a post, or update post `wp_id` with the fields of `post_data`. Returns the post id."""
     print(f"Publishing to WordPress with data: {post_data}")
 
-    response = requests.post(
-        f'{WORDPRESS_SITE_URL}/wp-json/wp/v2/posts',
+    # Rate limited requests are retried, server errors are not because the post may exist already
+    response = resilience_helper.request(
+        'POST',
+        f'{WORDPRESS_SITE_URL}/wp-json/wp/v2/posts' + (f'/{wp_id}' if wp_id else ''),
+        endpoint='wordpress',
         json=post_data,
         auth=(WORDPRESS_APP_USERNAME, WORDPRESS_APP_PASSWORD)
     )
@@ -72,49 +110,336 @@ def publish_to_wordpress(title, content, image_id, schedule_date):
         return None
 
 
-def update_airtable_record(record_id, wp_id):
-    table = airtable_api.table(AIRTABLE_BASE_ID, AIRTABLE_TABLE_NAME)
+def fetch_published_articles(mirror=None):
+    if mirror:
+        return mirror.select(state='PUBLISHED', wp_id=NOT_BLANK)
+    table = get_table()
+    return table.all(formula="AND(state = 'PUBLISHED', wp_id != '')",
+                     fields=['title', 'html', 'wp_id', 'wp_content_hash'])
+
+
+def hash_text(text):
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()[:16]
+
+
+def content_hash(title, html):
+    """Hashes of the title and the HTML of an article, kept apart to only send what changed."""
+    return f"{hash_text(title)}:{hash_text(html)}"
+
+
+def changed_fields(fields):
+    """The post fields of a published article that differ from its stored content hash."""
+    stored_title, _, stored_html = (fields.get('wp_content_hash') or '').partition(':')
+    changes = {}
+    if stored_title != hash_text(fields.get('title')):
+        changes['title'] = fields.get('title')
+    if stored_html != hash_text(fields.get('html')):
+        changes['content'] = fields.get('html')
+    return changes
+
+
+def update_airtable_record(record_id, wp_id, wp_content_hash=None):
+    table = get_table()
     fields = {
         'state': 'PUBLISHED',
         'wp_id': str(wp_id) if wp_id else None,
     }
+    if wp_content_hash:
+        fields['wp_content_hash'] = wp_content_hash
     try:
         table.update(record_id, fields)
     except Exception as e:
         print(f'Error updating Airtable record: {e}')
 
 
-def main():
-    try:
-        articles = fetch_ready_articles()
-        if articles:
-            for article in articles:
-                record_id = article['id']
-                title = article['fields'].get('title')
-                article_html = article['fields'].get('html')
-
-                # Parse schedule date if present, otherwise use None
-                schedule_date_str = article['fields'].get('schedule_date')
-                schedule_date = None
-                if schedule_date_str:
-                    schedule_date = datetime.fromisoformat(schedule_date_str)
-
-                image_id = get_random_image_name()
-
-                if image_id and title and article_html:
-                    # Publish to WordPress
-                    wp_post_id = publish_to_wordpress(title, article_html, image_id, schedule_date)
-
-                    # Update Airtable with WordPress post data
-                    if wp_post_id:
-                        update_airtable_record(record_id, wp_post_id)
-                        print(f"Article '{title}' published on WordPress successfully.")
-                else:
-                    print(f"Failed to process article '{title}' due to missing data.")
+def prepare_article(article):
+    """The WordPress post data of an article, or None when its title or HTML is missing."""
+    title = article['fields'].get('title')
+    article_html = article['fields'].get('html')
+
+    # Parse schedule date if present, otherwise use None
+    schedule_date_str = article['fields'].get('schedule_date')
+    schedule_date = None
+    if schedule_date_str:
+        schedule_date = datetime.fromisoformat(schedule_date_str)
+
+    image_id = get_random_image_name()
+
+    if image_id and title and article_html:
+        return build_post_data(title, article_html, image_id, schedule_date)
+    print(f"Failed to process article '{title}' due to missing data.")
+    return None
+
+
+def publish_article(article):
+    record_id = article['id']
+    post_data = prepare_article(article)
+
+    if post_data:
+        # Publish to WordPress
+        wp_post_id = create_post(post_data)
+
+        # Update Airtable with WordPress post data
+        if wp_post_id:
+            update_airtable_record(record_id, wp_post_id, content_hash(post_data['title'], post_data['content']))
+            print(f"Article '{post_data['title']}' published on WordPress successfully.")
+
+
+def wordpress_batch(requests, labels):
+    """
+    Send up to 25 post requests, (path, body) pairs, with one call to the batch endpoint. Returns
+    the post id of every request in the same order, None for a request that failed. Raises
+    LookupError when the site has no batch endpoint.
+    """
+    batch = {
+        # 'normal' validation lets the valid requests of a batch through when another one is invalid
+        'validation': 'normal',
+        'requests': [{'method': 'POST', 'path': path, 'body': body} for path, body in requests],
+    }
+    response = resilience_helper.request(
+        'POST',
+        f'{WORDPRESS_SITE_URL}/wp-json/batch/v1',
+        endpoint='wordpress',
+        json=batch,
+        auth=(WORDPRESS_APP_USERNAME, WORDPRESS_APP_PASSWORD)
+    )
+    if response.status_code == 404:
+        raise LookupError(f"WordPress batch endpoint not found: {response.text}")
+    if not response.ok:
+        print(f"WordPress batch of {len(requests)} posts failed ({response.status_code}): {response.text}")
+        return [None] * len(requests)
+
+    # A batch that fails validation as a whole answers with a single error response
+    responses = response.json().get('responses')
+    if not isinstance(responses, list) or len(responses) != len(requests):
+        print(f"WordPress batch of {len(requests)} posts failed: {response.text}")
+        return [None] * len(requests)
+
+    wp_ids = []
+    for label, item in zip(labels, responses):
+        body = item.get('body') or {}
+        if 200 <= item.get('status', 500) < 300 and body.get('id'):
+            wp_ids.append(body['id'])
         else:
-            print('No articles ready to publish.')
+            print(f"Failed to post '{label}' to WordPress ({item.get('status')}): {body}")
+            wp_ids.append(None)
+    return wp_ids
+
+
+def publish_batch(posts):
+    """Create up to 25 posts with one request, see wordpress_batch."""
+    return wordpress_batch([('/wp/v2/posts', post_data) for post_data in posts],
+                           [post_data['title'] for post_data in posts])
+
+
+def publish_articles_bulk(articles, batch_size=WORDPRESS_BATCH_SIZE):
+    """
+    Publish articles through the batch endpoint. Returns the number of published articles and
+    the (record id, post id) of the posts that were created but could not be marked PUBLISHED.
+    """
+    table = get_table()
+    prepared = []
+    for article in articles:
+        # A bad article (e.g. an invalid schedule_date) is skipped and stays READY_TO_PUBLISH
+        try:
+            post_data = prepare_article(article)
+        except Exception as e:
+            print(f"Error preparing article {article['id']}: {e}")
+            continue
+        if post_data:
+            prepared.append((article['id'], post_data))
+    published = {}
+
+    # The writer retries the records of a failed batch update one by one
+    with AirtableBatchWriter(table) as writer:
+        def mark_published(record_id, post_data, wp_id):
+            writer.update(record_id, {'state': 'PUBLISHED', 'wp_id': str(wp_id),
+                                      'wp_content_hash': content_hash(post_data['title'], post_data['content'])})
+            published[record_id] = wp_id
+
+        for start in range(0, len(prepared), batch_size):
+            chunk = prepared[start:start + batch_size]
+            try:
+                with metrics_helper.timed('stage', 'publish_batch'):
+                    wp_ids = publish_batch([post_data for _, post_data in chunk])
+            except LookupError as e:
+                print(f"{e}, publishing the remaining articles one by one.")
+                for record_id, post_data in prepared[start:]:
+                    try:
+                        with metrics_helper.timed('record', 'publish_article'):
+                            wp_post_id = create_post(post_data)
+                        if wp_post_id:
+                            mark_published(record_id, post_data, wp_post_id)
+                    except Exception as e:
+                        print(f"Error publishing article {record_id}: {e}")
+                break
+            except Exception as e:
+                # The posts may have been created, so the records are not retried in this run
+                print(f"Error publishing a batch of {len(chunk)} articles: {e}")
+                continue
+
+            created = 0
+            for (record_id, post_data), wp_id in zip(chunk, wp_ids):
+                if wp_id:
+                    mark_published(record_id, post_data, wp_id)
+                    created += 1
+            print(f"Published {created} of {len(chunk)} articles in a WordPress batch.")
+
+    unmarked = [(record_id, published[record_id]) for record_id in writer.failed_updates if record_id in published]
+    if unmarked:
+        # These records are still READY_TO_PUBLISH, the next run would publish them again
+        print(f"Published but not marked in Airtable: {unmarked}")
+    return len(published) - len(unmarked), unmarked
+
+
+def record_hashes(table, articles):
+    """Store the current content hash of articles without sending anything to WordPress."""
+    hash_updates = [{'id': article['id'],
+                     'fields': {'wp_content_hash': content_hash(article['fields'].get('title'),
+                                                                article['fields'].get('html'))}}
+                    for article in articles]
+    if not hash_updates:
+        return 0
+    try:
+        table.batch_update(hash_updates)
+    except Exception as e:
+        print(f"Error updating {len(hash_updates)} Airtable records: {e}")
+        return 0
+    return len(hash_updates)
+
+
+def sync_articles(articles, batch_size=WORDPRESS_BATCH_SIZE, record_only=False):
+    """
+    Update the posts of published articles whose title or HTML changed since they were sent.
+    Returns the number of updated posts.
+
+    Articles without a stored hash (published before hashes were kept) are not sent: their
+    current hash is stored as the baseline, since there is nothing to compare them with and
+    sending them would overwrite edits made in WordPress. With record_only every article only
+    gets its current hash stored, to accept the posts as they are.
+    """
+    table = get_table()
+    if record_only:
+        recorded = record_hashes(table, articles)
+        print(f"Recorded the content hash of {recorded} of {len(articles)} published articles.")
+        return 0
+
+    baseline = [article for article in articles if not article['fields'].get('wp_content_hash')]
+    if baseline:
+        recorded = record_hashes(table, baseline)
+        print(f"Recorded the content hash of {recorded} published articles without one, they were not sent.")
+
+    changed = []
+    for article in articles:
+        fields = article['fields']
+        if not fields.get('wp_content_hash'):
+            continue
+        changes = changed_fields(fields)
+        if changes:
+            changed.append((article['id'], fields['wp_id'], changes,
+                            content_hash(fields.get('title'), fields.get('html'))))
+    print(f"{len(changed)} of {len(articles) - len(baseline)} published articles changed.")
+    updated = 0
+    use_batch = True
+
+    for start in range(0, len(changed), batch_size):
+        chunk = changed[start:start + batch_size]
+        wp_ids = None
+        if use_batch:
+            try:
+                with metrics_helper.timed('stage', 'sync_batch'):
+                    wp_ids = wordpress_batch([(f'/wp/v2/posts/{wp_id}', changes) for _, wp_id, changes, _ in chunk],
+                                             [f"post {wp_id}" for _, wp_id, _, _ in chunk])
+            except LookupError as e:
+                print(f"{e}, updating the posts one by one.")
+                use_batch = False
+            except Exception as e:
+                print(f"Error updating a batch of {len(chunk)} posts: {e}")
+                continue
+        if wp_ids is None:
+            wp_ids = []
+            for record_id, wp_id, changes, _ in chunk:
+                try:
+                    wp_ids.append(create_post(changes, wp_id))
+                except Exception as e:
+                    print(f"Error updating post {wp_id} of record {record_id}: {e}")
+                    wp_ids.append(None)
+
+        # Only the posts that were updated get their new hash, the others are retried next run
+        hash_updates = [{'id': record_id, 'fields': {'wp_content_hash': new_hash}}
+                        for (record_id, _, _, new_hash), wp_id in zip(chunk, wp_ids) if wp_id]
+        if hash_updates:
+            try:
+                table.batch_update(hash_updates)
+            except Exception as e:
+                print(f"Error updating {len(hash_updates)} Airtable records: {e}")
+        updated += len(hash_updates)
+
+    return updated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Publish READY_TO_PUBLISH articles from Airtable to WordPress.")
+    parser.add_argument('--bulk', action='store_true',
+                        help="Publish through the WordPress batch endpoint, up to 25 posts per request")
+    parser.add_argument('--batch-size', type=int, default=WORDPRESS_BATCH_SIZE,
+                        help=f"Posts per batch request with --bulk or --sync (at most {WORDPRESS_BATCH_SIZE})")
+    parser.add_argument('--sync', action='store_true',
+                        help="Update the posts of PUBLISHED articles whose title or HTML changed")
+    parser.add_argument('--record-only', action='store_true',
+                        help="With --sync, store the current content hash of every PUBLISHED article "
+                             "without updating WordPress")
+    parser.add_argument('--mirror', nargs='?', const=AIRTABLE_MIRROR_PATH,
+                        help="Select the records from a local SQLite mirror of the table, synced incrementally "
+                             "(default path: %(const)s)")
+    args = parser.parse_args(argv)
+    if not 1 <= args.batch_size <= WORDPRESS_BATCH_SIZE:
+        parser.error(f"--batch-size has to be between 1 and {WORDPRESS_BATCH_SIZE}")
+    if args.record_only and not args.sync:
+        parser.error("--record-only is only used with --sync")
+
+    mirror = None
+    if args.mirror:
+        try:
+            mirror = open_mirror(args.mirror)
+        except Exception as e:
+            print(f"Error syncing the Airtable mirror: {e}")
+            return
+
+    if args.sync:
+        try:
+            published_articles = fetch_published_articles(mirror)
+        except Exception as e:
+            print(f"Error fetching published articles: {e}")
+            return
+        updated = sync_articles(published_articles, args.batch_size, record_only=args.record_only)
+        print(f"Updated {updated} posts on WordPress.")
+        return
+
+    try:
+        articles = fetch_ready_articles(mirror)
     except Exception as e:
-        print(f"Error: {e}")
+        print(f"Error fetching articles: {e}")
+        return
+
+    if not articles:
+        print('No articles ready to publish.')
+        return
+
+    if args.bulk:
+        published, unmarked = publish_articles_bulk(articles, args.batch_size)
+        print(f"Published {published} of {len(articles)} articles.")
+        if unmarked:
+            return 1
+        return
+
+    for article in articles:
+        # A failing article is left READY_TO_PUBLISH for the next run and does not stop the others
+        try:
+            with metrics_helper.timed('record', 'publish_article'):
+                publish_article(article)
+        except Exception as e:
+            print(f"Error publishing article {article['id']}: {e}")
 
 
 if __name__ == "__main__":